@@ -54,6 +54,17 @@ def _parse_ops(value: str) -> str:
     return "".join(sorted(set(letters)))
 
 
+def _parse_budget(value: str, command: str) -> int:
+    """Parse a --budget token count, which must be a positive integer."""
+    try:
+        budget = int(value)
+    except ValueError:
+        budget = 0
+    if budget <= 0:
+        raise RuntimeError(f"router {command}: --budget must be a positive token count")
+    return budget
+
+
 def _parse_diff_style_args(
     args: list[str],
     config: dict,
@@ -73,6 +84,10 @@ def _parse_diff_style_args(
     ops = ""
     compact_enabled = False
     compact_spec = ""
+    stream = None
+    no_cache = False
+    budget = None
+    estimate = False
     positionals: list[str] = []
 
     idx = 0
@@ -136,6 +151,27 @@ def _parse_diff_style_args(
             detail_mode = "name-status"
             idx += 1
             continue
+        if token in {"--stream", "--no-stream"}:
+            # Streaming only changes how output is delivered, never its content.
+            stream = token == "--stream"
+            idx += 1
+            continue
+        if token == "--no-cache":
+            no_cache = True
+            idx += 1
+            continue
+        if token == "--estimate":
+            # Estimate-only runs report predicted sizes from numstat and skip the diff itself.
+            estimate = True
+            idx += 1
+            continue
+        if token == "--budget":
+            if idx + 1 >= len(args):
+                raise RuntimeError(f"router {command}: --budget requires a value")
+            # A token budget replaces the detail choice with a per-file allocation.
+            budget = _parse_budget(args[idx + 1], command)
+            idx += 2
+            continue
         if token == "--include":
             if idx + 1 >= len(args):
                 raise RuntimeError(f"router {command}: --include requires a value")
@@ -177,6 +213,10 @@ def _parse_diff_style_args(
             "ops": ops,
             "compact_enabled": compact_enabled,
             "compact_spec": compact_spec,
+            "stream": stream,
+            "no_cache": no_cache,
+            "budget": budget,
+            "estimate": estimate,
         },
         positionals,
     )
@@ -190,6 +230,8 @@ def _parse_log_like_args(args: list[str], command: str) -> tuple[dict, list[str]
     rev_range = ""
     path = ""
     short_hash = False
+    after_cursor = ""
+    page_size = None
     rest: list[str] = []
 
     idx = 0
@@ -229,6 +271,23 @@ def _parse_log_like_args(args: list[str], command: str) -> tuple[dict, list[str]
             short_hash = True
             idx += 1
             continue
+        if token == "--after-cursor":
+            if idx + 1 >= len(args):
+                raise RuntimeError(f"router {command}: --after-cursor requires a value")
+            # --after-cursor resumes a paged walk from the previous page's cursor.
+            after_cursor = args[idx + 1].strip()
+            idx += 2
+            continue
+        if token == "--page-size":
+            if idx + 1 >= len(args):
+                raise RuntimeError(f"router {command}: --page-size requires a value")
+            # --page-size pages the walk, ending each page with a cursor.
+            try:
+                page_size = int(args[idx + 1])
+            except ValueError:
+                raise RuntimeError(f"router {command}: --page-size requires an integer")
+            idx += 2
+            continue
         rest.append(token)
         idx += 1
 
@@ -239,6 +298,8 @@ def _parse_log_like_args(args: list[str], command: str) -> tuple[dict, list[str]
             "rev_range": rev_range,
             "path": path,
             "short_hash": short_hash,
+            "after_cursor": after_cursor,
+            "page_size": page_size,
         },
         rest,
     )
@@ -294,3 +355,10 @@ def _validate_stat_name_status(command: str, show_stat: bool, show_name_status:
     if show_stat and show_name_status:
         raise RuntimeError(f"router {command}: choose --stat or --name-status, not both")
 
+
+def _validate_budget(command: str, detail_mode: str) -> None:
+    """Error when --budget is combined with an explicit detail choice."""
+    if detail_mode:
+        raise RuntimeError(
+            f"router {command}: --budget picks the detail per file; drop --detail/--summary/--files-only/--stat/--name-status"
+        )
@@ -15,31 +15,12 @@ CURRENT_CONFIG: dict | None = None
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from app.cli.cli_parse import (
-    _build_diff_args,
-    _build_pathspecs,
-    _parse_diff_style_args,
-    _parse_list_arg,
-    _parse_log_like_args,
-    _parse_ops,
-    _validate_stat_name_status,
-)
-from app.commands.base_cmd import dispatch_base as _dispatch_base
-from app.commands.branch_cmd import dispatch_branch as _dispatch_branch
-from app.commands.compare_cmd import dispatch_compare as _dispatch_compare
-from app.commands.diff_cmd import dispatch_diff as _dispatch_diff
-from app.commands.files_cmd import dispatch_files as _dispatch_files
-from app.commands.history_cmd import dispatch_history as _dispatch_history
-from app.commands.log_cmd import dispatch_log as _dispatch_log
-from app.commands.pr_cmd import dispatch_pr as _dispatch_pr
-from app.commands.scan_cmd import dispatch_scan as _dispatch_scan
-from app.commands.show_cmd import dispatch_show as _dispatch_show
-from app.commands.state import dispatch_state as _dispatch_state
-from app.compact.compact import _apply_compact_options, _render_compact_output
 from app.utils.exec_utils import git_output as _git_output_exec
 from app.utils.exec_utils import run_gh as _run_gh_exec
 from app.utils.exec_utils import run_git as _run_git_exec
+from app.utils.exec_utils import run_many as _run_many_exec
 from app.utils.exec_utils import run_tool as _run_tool_exec
+from app.utils.exec_utils import stream_git as _stream_git_exec
 from app.policy.guardrails import get_guardrails as _get_guardrails
 from app.policy.guardrails import guardrails_block as _guardrails_block
 from app.utils.log_utils import TeeStream as _TeeStream
@@ -50,19 +31,33 @@ from app.routing.routing import dispatch_custom as _dispatch_custom
 from app.routing.routing import pick_tool as _pick_tool
 from app.routing.routing import tool_enabled as _tool_enabled
 from app.utils.runtime import RuntimeContext
-from app.config.config_loader import (
-    _deep_merge,
-    _load_compact_defaults,
-    _load_compact_profiles,
-    _load_config,
-    _load_default_excludes,
-    _load_history_compact_meta_overrides,
-    _merge_compact_options,
-    _merge_custom_commands,
-    _resolve_noise_level,
-)
+from app.config.config_loader import _load_effective_config
+
+# Built-in handler name -> (module, dispatch function). Modules are imported on
+# first dispatch so `router state` or a passthrough never loads PR/branch/compact code.
+_HANDLER_MODULES: dict[str, tuple[str, str]] = {
+    "state": ("app.commands.state", "dispatch_state"),
+    "diff": ("app.commands.diff_cmd", "dispatch_diff"),
+    "log": ("app.commands.log_cmd", "dispatch_log"),
+    "history": ("app.commands.history_cmd", "dispatch_history"),
+    "files": ("app.commands.files_cmd", "dispatch_files"),
+    "branch": ("app.commands.branch_cmd", "dispatch_branch"),
+    "base": ("app.commands.base_cmd", "dispatch_base"),
+    "scan": ("app.commands.scan_cmd", "dispatch_scan"),
+    "compare": ("app.commands.compare_cmd", "dispatch_compare"),
+    "show": ("app.commands.show_cmd", "dispatch_show"),
+    "pr": ("app.commands.pr_cmd", "dispatch_pr"),
+    "cache": ("app.commands.cache_cmd", "dispatch_cache"),
+    "page": ("app.commands.page_cmd", "dispatch_page"),
+    "index": ("app.commands.index_cmd", "dispatch_index"),
+    "optimize": ("app.commands.optimize_cmd", "dispatch_optimize"),
+    "config": ("app.commands.config_cmd", "dispatch_config"),
+}
+_LOADED_HANDLERS: dict[str, Callable[..., int | None]] = {}
 
 RUNTIME_CONTEXT = RuntimeContext()
+# Set in daemon workers to the serving daemon's pid; None when running in-process.
+DAEMON_PID: int | None = None
 
 
 def _git_output(args: Sequence[str]) -> str:
@@ -75,6 +70,67 @@ def _run_git(args: Sequence[str], **kwargs):
     return _run_git_exec(args, RUNTIME_CONTEXT.record_resolved, RUNTIME_CONTEXT.get_timeout, **kwargs)
 
 
+def _run_many(commands: Sequence[Sequence[str]]):
+    """Run independent git commands concurrently using the runtime context."""
+    return _run_many_exec(commands, RUNTIME_CONTEXT.record_resolved, RUNTIME_CONTEXT.get_timeout)
+
+
+def _objects():
+    """Return the cat-file object server for this invocation."""
+    return RUNTIME_CONTEXT.get_objects()
+
+
+def _stream_git(args: Sequence[str]):
+    """Start a streaming git command using the configured runtime context."""
+    return _stream_git_exec(args, RUNTIME_CONTEXT.record_resolved, RUNTIME_CONTEXT.get_timeout)
+
+
+def _result_cache(config: dict):
+    """Return the repo's result cache, or None when disabled."""
+    from app.utils.result_cache import open_result_cache as _open_result_cache
+
+    from app.utils.refs import git_common_dir as _git_common_dir
+
+    return _open_result_cache(config, lambda: _git_common_dir(_git_output), _run_git)
+
+
+def _commit_index(config: dict):
+    """Return the repo's commit index (updated to the current refs), or None when unused."""
+    from app.utils.commit_index import open_commit_index as _open_commit_index
+
+    from app.utils.refs import git_common_dir as _git_common_dir
+
+    return _open_commit_index(config, lambda: _git_common_dir(_git_output), _run_git)
+
+
+def _git_common_dir_path() -> str:
+    """Return the repo's git common dir."""
+    from app.utils.refs import git_common_dir as _git_common_dir
+
+    return _git_common_dir(_git_output)
+
+
+def _spill_store(config: dict, require_enabled: bool = True):
+    """Return the repo's spill store, or None when disabled."""
+    from app.utils.spill_store import open_spill_store as _open_spill_store
+
+    from app.utils.refs import git_common_dir as _git_common_dir
+
+    return _open_spill_store(config, lambda: _git_common_dir(_git_output), require_enabled)
+
+
+def _spilled(command: str, config: dict, produce: Callable[[], int]) -> int:
+    """Run a diff-style handler, paging oversized output through the spill store."""
+    from app.utils.spill_store import run_spilled as _run_spilled
+
+    return _run_spilled(command, config, produce, _spill_store)
+
+
+def _guardrails(tool: str, args: list[str], config: dict, git_output: Callable[[list[str]], str]):
+    """Evaluate guardrails with the fast plumbing checks wired in."""
+    return _guardrails_block(tool, args, config, git_output, _run_git, _stream_git)
+
+
 def _gh_run(args: Sequence[str]):
     """Run a gh command using the configured runtime context."""
     return _run_gh_exec(args, RUNTIME_CONTEXT.record_resolved, RUNTIME_CONTEXT.get_timeout)
@@ -91,20 +147,58 @@ def _ensure_gh() -> None:
         raise RuntimeError("gh CLI not available")
 
 
+def _handler(name: str) -> Callable[..., int | None]:
+    """Import a built-in handler module on first use and return its dispatch function."""
+    func = _LOADED_HANDLERS.get(name)
+    if func is None:
+        module_name, attr = _HANDLER_MODULES[name]
+        # __import__ (unlike importlib.import_module) is reported by `python -X importtime`.
+        func = getattr(__import__(module_name, fromlist=[attr]), attr)
+        _LOADED_HANDLERS[name] = func
+    return func
+
+
+def warm_handlers() -> None:
+    """Import every built-in handler module up front (the daemon does this before forking)."""
+    for name in _HANDLER_MODULES:
+        _handler(name)
+
+
 def _builtin_handlers() -> dict[str, Callable[[list[str], dict], int]]:
-    """Return the built-in command handler dict."""
+    """Return the built-in command handler dict (handlers import lazily when called)."""
     return {
-        "state": lambda args, config: _dispatch_state(args, config, _git_output),
-        "diff": lambda args, config: _dispatch_diff(args, config, _run_git),
-        "log": lambda args, config: _dispatch_log(args, config, _run_git),
-        "history": lambda args, config: _dispatch_history(args, config, _run_git),
-        "files": lambda args, config: _dispatch_files(args, config, _git_output, _run_git),
-        "branch": lambda args, config: _dispatch_branch(args, config, _git_output, _run_git),
-        "base": lambda args, config: _dispatch_base(args, config, _git_output),
-        "scan": lambda args, config: _dispatch_scan(args, config, _get_guardrails),
-        "compare": lambda args, config: _dispatch_compare(args, config, _run_git),
-        "show": lambda args, config: _dispatch_show(args, config, _run_git),
-        "pr": lambda args, config: _dispatch_pr(args, config, _gh_run, _ensure_gh),
+        "state": lambda args, config: _handler("state")(args, config, _git_output, _objects, _run_many),
+        "diff": lambda args, config: _spilled(
+            "diff", config, lambda: _handler("diff")(args, config, _run_git, _stream_git)
+        ),
+        "log": lambda args, config: _handler("log")(args, config, _run_git, _commit_index),
+        "history": lambda args, config: _spilled(
+            "history",
+            config,
+            lambda: _handler("history")(
+                args, config, _run_git, _stream_git, _objects, _result_cache, _commit_index
+            ),
+        ),
+        "files": lambda args, config: _handler("files")(args, config, _git_output, _run_git),
+        "branch": lambda args, config: _handler("branch")(
+            args, config, _git_output, _run_git, _objects, _run_many, _stream_git
+        ),
+        "base": lambda args, config: _handler("base")(args, config, _git_output),
+        "scan": lambda args, config: _handler("scan")(args, config, _get_guardrails),
+        "compare": lambda args, config: _spilled(
+            "compare",
+            config,
+            lambda: _handler("compare")(args, config, _run_git, _stream_git, _objects, _result_cache),
+        ),
+        "show": lambda args, config: _handler("show")(args, config, _run_git, _objects, _result_cache),
+        "pr": lambda args, config: _handler("pr")(args, config, _gh_run, _ensure_gh),
+        "cache": lambda args, config: _handler("cache")(args, config, _result_cache),
+        "page": lambda args, config: _handler("page")(
+            args, config, lambda cfg: _spill_store(cfg, require_enabled=False)
+        ),
+        "index": lambda args, config: _handler("index")(args, config, _run_git, _git_common_dir_path),
+        "optimize": lambda args, config: _handler("optimize")(args, config, _run_git),
+        "config": lambda args, config: _handler("config")(args, config),
     }
 
 
@@ -137,6 +231,11 @@ def run(argv: Sequence[str] | None = None) -> int:
         action="store_true",
         help="Disable compact auto-tune for this invocation.",
     )
+    parser.add_argument(
+        "--unpaged",
+        action="store_true",
+        help="Print oversized diff/compare/history output in full instead of paging it.",
+    )
     parser.add_argument("--log", action="store_true", help="Log this router invocation.")
     parser.add_argument("--log-all", action="store_true", help="Log actions for every invocation.")
     parser.add_argument("--log-file", default="", help="Log file path.")
@@ -164,18 +263,8 @@ def run(argv: Sequence[str] | None = None) -> int:
     log_file = ""
     log_format = "txt"
     try:
-        # Load config and apply any profile overrides.
-        config = _load_config(config_path)
-        profiles = config.get("profiles", {}) if isinstance(config.get("profiles"), dict) else {}
-        router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
-        profile = parsed.profile.strip().lower() or str(router_cfg.get("default_profile", "")).strip().lower()
-        if profile:
-            if profile not in profiles:
-                raise RuntimeError(f"router: unknown profile '{profile}'")
-            profile_cfg = profiles.get(profile, {})
-            if not isinstance(profile_cfg, dict):
-                raise RuntimeError(f"router: profile '{profile}' must be a dict")
-            config = _deep_merge(config, profile_cfg)
+        # Load the profile-merged config (with custom commands), from the compiled snapshot when fresh.
+        config, profile = _load_effective_config(config_path, parsed.profile)
         router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
         if parsed.auto_tune or parsed.no_auto_tune:
             auto_cfg = router_cfg.get("compact_auto_tune", {})
@@ -184,6 +273,13 @@ def run(argv: Sequence[str] | None = None) -> int:
             auto_cfg["enabled"] = bool(parsed.auto_tune) if parsed.auto_tune else False
             router_cfg["compact_auto_tune"] = auto_cfg
             config["router"] = router_cfg
+        if parsed.unpaged:
+            spill_cfg = router_cfg.get("spill", {})
+            if not isinstance(spill_cfg, dict):
+                spill_cfg = {}
+            spill_cfg["enabled"] = False
+            router_cfg["spill"] = spill_cfg
+            config["router"] = router_cfg
         # Resolve guardrails, logging, and runtime metadata for this run.
         guardrails_cfg = config.get("guardrails", {}) if isinstance(config.get("guardrails"), dict) else {}
         profile_safe = bool(guardrails_cfg.get("safe_mode", False))
@@ -200,8 +296,10 @@ def run(argv: Sequence[str] | None = None) -> int:
             "safe_mode": safe_mode,
             "config_path": str(config_path),
             "profile": profile,
+            "profile_arg": parsed.profile,
             "resolved_commands": [],
             "resolved_tool": "",
+            "daemon_pid": DAEMON_PID,
         }
         global CURRENT_CONFIG
         CURRENT_CONFIG = config
@@ -213,9 +311,6 @@ def run(argv: Sequence[str] | None = None) -> int:
             sys.stdout = tee_out
             sys.stderr = tee_err
 
-        # Merge custom command definitions before dispatch.
-        _merge_custom_commands(config, config_path)
-
         args = parsed.args
         tool_override = parsed.tool
         allow_prefixed = bool(router_cfg.get("allow_prefixed", True))
@@ -260,7 +355,7 @@ def run(argv: Sequence[str] | None = None) -> int:
             _pick_tool,
             _tool_enabled,
             _command_allowed,
-            _guardrails_block,
+            _guardrails,
             _run_tool,
             _git_output,
         )
@@ -281,7 +376,7 @@ def run(argv: Sequence[str] | None = None) -> int:
             rc = 2
             return rc
 
-        guard_err = _guardrails_block(tool, args, config, _git_output)
+        guard_err = _guardrails(tool, args, config, _git_output)
         if guard_err:
             sys.stderr.write(f"{guard_err}\n")
             rc = 2
@@ -303,6 +398,7 @@ def run(argv: Sequence[str] | None = None) -> int:
             sys.stdout = tee_out.stream
         if tee_err is not None:
             sys.stderr = tee_err.stream
+        RUNTIME_CONTEXT.close_objects()
         RUNTIME_CONTEXT.set_config(None)
         if log_enabled:
             runtime = config.get("_runtime", {}) if isinstance(config, dict) else {}
@@ -316,6 +412,7 @@ def run(argv: Sequence[str] | None = None) -> int:
                 "stdout": tee_out.buffer if tee_out else "",
                 "stderr": tee_err.buffer if tee_err else "",
                 "profile": runtime.get("profile", ""),
+                "daemon_pid": runtime.get("daemon_pid"),
             }
             _write_log_entries([entry], log_file, log_format)
 
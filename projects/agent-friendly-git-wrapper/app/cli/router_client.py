@@ -0,0 +1,222 @@
+"""Thin client that forwards router invocations to a resident daemon.
+
+This module is the first thing `router.sh` runs, so it only imports the
+standard-library modules it needs to talk to the daemon socket. When no daemon
+is listening for the current repo it falls back to running the router
+in-process. It also falls back when the socket directory or the listening
+process does not belong to the current user: requests carry the caller's
+environment and stdio, so they only go to a daemon this user started.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HEADER = struct.Struct("!I")
+DISABLED_VALUES = {"0", "off", "false", "no"}
+
+
+def daemon_supported() -> bool:
+    """Return True when this platform can pass fds over Unix sockets."""
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds") and hasattr(os, "fork")
+
+
+def find_repo_root(start: str) -> str:
+    """Return the worktree root containing `start`, or `start` when none is found."""
+    git_dir = os.environ.get("GIT_DIR", "").strip()
+    if git_dir:
+        return os.path.realpath(os.path.join(start, git_dir))
+    current = os.path.realpath(start)
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return os.path.realpath(start)
+        current = parent
+
+
+def socket_dir() -> str:
+    """Return the per-user directory that holds daemon sockets."""
+    override = os.environ.get("ROUTER_SOCKET_DIR", "").strip()
+    if override:
+        return override
+    base = os.environ.get("XDG_RUNTIME_DIR", "").strip() or os.environ.get("TMPDIR", "").strip() or "/tmp"
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(base, f"agent-git-router-{uid}")
+
+
+def private_dir(path: str) -> bool:
+    """Return True when `path` is a real directory owned by this user with mode 0700."""
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and stat.S_IMODE(info.st_mode) == 0o700
+
+
+def code_stamp() -> str:
+    """Return a digest of the router's source files (paths, sizes, mtimes).
+
+    It is part of the socket name, so after an upgrade clients stop reaching a
+    daemon that still has the old code loaded; that daemon idles out.
+    """
+    digest = hashlib.sha1()
+    app_dir = os.path.join(PROJECT_ROOT, "app")
+    for root, dirs, files in os.walk(app_dir):
+        dirs[:] = sorted(name for name in dirs if name != "__pycache__")
+        for name in sorted(files):
+            if name.endswith(".py"):
+                info = os.stat(os.path.join(root, name))
+                digest.update(f"{os.path.relpath(os.path.join(root, name), app_dir)}\0{info.st_size}\0{info.st_mtime_ns}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def socket_path(repo_root: str) -> str:
+    """Return the daemon socket path for a repo root and this router install and code."""
+    digest = hashlib.sha1(f"{repo_root}\0{PROJECT_ROOT}\0{code_stamp()}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(socket_dir(), f"{digest}.sock")
+
+
+def send_message(sock: socket.socket, payload: dict, fds: list[int] | None = None) -> None:
+    """Send a length-prefixed JSON message, optionally passing fds alongside it."""
+    body = json.dumps(payload).encode("utf-8")
+    data = HEADER.pack(len(body)) + body
+    if fds:
+        sent = socket.send_fds(sock, [data], fds)
+        data = data[sent:]
+    if data:
+        sock.sendall(data)
+
+
+def _recv_exact(sock: socket.socket, size: int, prefix: bytes = b"") -> bytes:
+    """Read exactly `size` bytes from the socket (raises on EOF)."""
+    data = bytearray(prefix)
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("router daemon: connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def recv_request(sock: socket.socket, maxfds: int) -> tuple[dict, list[int]]:
+    """Receive the single request message (and its fds) a client sends."""
+    first, fds, _flags, _addr = socket.recv_fds(sock, 65536, maxfds)
+    if not first:
+        raise ConnectionError("router daemon: connection closed")
+    head = _recv_exact(sock, HEADER.size, first[: HEADER.size])
+    (size,) = HEADER.unpack(head)
+    body = _recv_exact(sock, size, first[HEADER.size :])
+    return json.loads(body.decode("utf-8")), fds
+
+
+def read_message(reader) -> dict:
+    """Read one length-prefixed JSON message from a buffered socket reader."""
+    head = reader.read(HEADER.size)
+    if len(head) < HEADER.size:
+        raise ConnectionError("router daemon: connection closed")
+    (size,) = HEADER.unpack(head)
+    body = reader.read(size)
+    if len(body) < size:
+        raise ConnectionError("router daemon: connection closed")
+    return json.loads(body.decode("utf-8"))
+
+
+def connect(repo_root: str, timeout: float | None = None) -> socket.socket | None:
+    """Connect to the daemon for a repo root, returning None when none is listening."""
+    return connect_path(socket_path(repo_root), timeout)
+
+
+def _peer_is_self(sock: socket.socket) -> bool:
+    """Return True when the process on the other end runs as this user.
+
+    Uses SO_PEERCRED where the platform has it; elsewhere the socket file's
+    owner (checked before connecting) has to do.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _pid, uid, _gid = struct.unpack("3i", creds)
+    return uid == os.getuid()
+
+
+def connect_path(path: str, timeout: float | None = None) -> socket.socket | None:
+    """Connect to a daemon socket path, returning None when no daemon of this user is listening."""
+    if not private_dir(os.path.dirname(path)):
+        return None
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return None
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if timeout is not None:
+        sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        if not _peer_is_self(sock):
+            sock.close()
+            return None
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def forward(argv: list[str]) -> int | None:
+    """Run argv through the daemon and return its exit code (None when unavailable)."""
+    if os.environ.get("ROUTER_DAEMON", "").strip().lower() in DISABLED_VALUES or not daemon_supported():
+        return None
+    cwd = os.getcwd()
+    sock = connect(find_repo_root(cwd))
+    if sock is None:
+        return None
+    with sock, sock.makefile("rb") as reader:
+        try:
+            send_message(sock, {"argv": argv, "cwd": cwd, "env": dict(os.environ)}, [0, 1, 2])
+            started = read_message(reader)
+        except (OSError, ConnectionError, ValueError):
+            # The request never reached a worker, so running in-process is still safe.
+            return None
+        worker = int(started.get("pid", 0))
+        try:
+            reply = read_message(reader)
+        except KeyboardInterrupt:
+            if worker:
+                os.kill(worker, signal.SIGINT)
+            return 130
+        except (OSError, ConnectionError, ValueError):
+            sys.stderr.write("router: lost connection to router daemon\n")
+            return 1
+    return int(reply.get("rc", 1))
+
+
+def run_in_process(argv: list[str]) -> int:
+    """Run the router in this interpreter, as router.sh did before the daemon."""
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+    from app.main import run
+
+    return run(["router", *argv])
+
+
+def main() -> None:
+    """Forward to the daemon when one is running, otherwise run in-process."""
+    argv = sys.argv[1:]
+    rc = forward(argv)
+    if rc is None:
+        rc = run_in_process(argv)
+    raise SystemExit(rc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Resident router daemon that serves requests from the thin client."""
+from __future__ import annotations
+
+import io
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app import main as router_main  # noqa: E402
+from app.cli import router_cli  # noqa: E402
+from app.cli import router_client  # noqa: E402
+from app.config.config_loader import _load_effective_config  # noqa: E402
+from app.utils.refs import reset_discovery  # noqa: E402
+
+DEFAULT_IDLE_TIMEOUT = 1800.0
+POLL_INTERVAL = 0.5
+
+
+def _warm_config() -> None:
+    """Refresh the default config snapshot so forked workers start from a fresh compile."""
+    try:
+        _load_effective_config(router_cli.DEFAULT_CONFIG)
+    except (OSError, RuntimeError):
+        # Workers load config themselves and will surface the error to the client.
+        pass
+
+
+def _bind_stdio(fds: list[int]) -> None:
+    """Point this worker's stdin/stdout/stderr at the fds the client passed."""
+    for target, fd in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = io.TextIOWrapper(io.FileIO(0, "rb", closefd=False), encoding="utf-8", errors="replace")
+    for target, name in ((1, "stdout"), (2, "stderr")):
+        stream = io.TextIOWrapper(
+            io.FileIO(target, "wb", closefd=False),
+            encoding="utf-8",
+            errors="replace",
+            line_buffering=os.isatty(target),
+            write_through=target == 2,
+        )
+        setattr(sys, name, stream)
+
+
+def _exit_code(exc: SystemExit) -> int:
+    """Map SystemExit to an exit code the way the interpreter does (printing non-int codes)."""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    sys.stderr.write(f"{exc.code}\n")
+    return 1
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """Run one router invocation inside a forked worker."""
+
+    def handle(self) -> None:
+        """Read the client request, run the router, and reply with the exit code."""
+        sock: socket.socket = self.request
+        try:
+            request, fds = router_client.recv_request(sock, 3)
+        except (OSError, ConnectionError, ValueError):
+            return
+        control = str(request.get("control", "")).strip()
+        if control:
+            self._handle_control(sock, control)
+            return
+        if len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            return
+        # Each request runs in its own forked worker, so cwd, environment, and the
+        # router's runtime context never leak between requests.
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        _bind_stdio(fds)
+        os.environ.clear()
+        os.environ.update({str(k): str(v) for k, v in dict(request.get("env", {})).items()})
+        router_client.send_message(sock, {"pid": os.getpid()})
+        router_cli.DAEMON_PID = self.server.parent_pid  # type: ignore[attr-defined]
+        # The layout the daemon saw earlier may be stale (git init, new worktree, core.bare).
+        reset_discovery()
+        rc = 1
+        try:
+            os.chdir(str(request.get("cwd", ".")))
+            rc = router_main.run(["router", *[str(arg) for arg in request.get("argv", [])]])
+        except KeyboardInterrupt:
+            rc = 130
+        except SystemExit as exc:
+            rc = _exit_code(exc)
+        except Exception as exc:  # pragma: no cover - surfaced to the client
+            sys.stderr.write(f"router daemon: {exc}\n")
+            rc = 1
+        finally:
+            for stream in (sys.stdout, sys.stderr):
+                try:
+                    stream.flush()
+                except (OSError, ValueError):
+                    pass
+        router_client.send_message(sock, {"rc": rc})
+
+    def _handle_control(self, sock: socket.socket, control: str) -> None:
+        """Answer ping/stop control messages from `router daemon` commands."""
+        server: RouterDaemon = self.server  # type: ignore[assignment]
+        if control == "ping":
+            router_client.send_message(
+                sock,
+                {"pid": server.parent_pid, "uptime": round(time.time() - server.started_at, 1)},
+            )
+        elif control == "stop":
+            router_client.send_message(sock, {"stopping": True})
+            os.kill(server.parent_pid, signal.SIGTERM)
+
+
+class RouterDaemon(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server that forks one worker per router request."""
+
+    def __init__(self, path: str, idle_timeout: float) -> None:
+        """Bind the socket and record daemon metadata."""
+        self.socket_path = path
+        self.parent_pid = os.getpid()
+        self.started_at = time.time()
+        self.idle_timeout = idle_timeout
+        self.last_request = time.monotonic()
+        self.timeout = POLL_INTERVAL
+        super().__init__(path, _RequestHandler)
+        os.chmod(path, 0o600)
+
+    def process_request(self, request, client_address) -> None:
+        """Refresh cached config before forking so workers start warm."""
+        self.last_request = time.monotonic()
+        _warm_config()
+        super().process_request(request, client_address)
+
+    def is_idle(self) -> bool:
+        """Return True once no request arrived within the idle timeout."""
+        if self.idle_timeout <= 0:
+            return False
+        return time.monotonic() - self.last_request > self.idle_timeout
+
+
+def _prepare_socket(path: str) -> None:
+    """Create the private socket directory and clear a stale socket left by a dead daemon."""
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, mode=0o700)
+        # The umask may have cleared bits, never added them, but be exact.
+        os.chmod(directory, 0o700)
+    except FileExistsError:
+        pass
+    if not router_client.private_dir(directory):
+        # Another user could have created it to receive clients' environments.
+        raise RuntimeError(f"router daemon: {directory} must be a directory owned by this user with mode 0700")
+    if not os.path.lexists(path):
+        return
+    sock = router_client.connect_path(path)
+    if sock is not None:
+        sock.close()
+        raise RuntimeError(f"router daemon: already running at {path}")
+    os.unlink(path)
+
+
+def serve(repo_root: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> int:
+    """Serve router requests for a repo until stopped or idle."""
+    if not router_client.daemon_supported():
+        raise RuntimeError("router daemon: Unix sockets with fd passing are not available on this platform")
+    path = router_client.socket_path(repo_root)
+    _prepare_socket(path)
+    # Parse config and import every handler once up front so forked workers start warm.
+    _warm_config()
+    router_cli.warm_handlers()
+    server = RouterDaemon(path, idle_timeout)
+    stopping = False
+
+    def _stop(_signum, _frame) -> None:
+        """Leave the serve loop after the current request."""
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        while not stopping and not server.is_idle():
+            try:
+                server.handle_request()
+            except InterruptedError:
+                pass
+            server.collect_children()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    return 0
+
+
+def _control(repo_root: str, control: str) -> dict | None:
+    """Send a control message to the repo's daemon and return its reply."""
+    sock = router_client.connect(repo_root, timeout=5.0)
+    if sock is None:
+        return None
+    with sock, sock.makefile("rb") as reader:
+        try:
+            router_client.send_message(sock, {"control": control})
+            return router_client.read_message(reader)
+        except (OSError, ConnectionError, ValueError):
+            return None
+
+
+def dispatch_daemon(action: str, idle_timeout: float) -> int:
+    """Run a `daemon start|stop|status|serve` action for the current repo."""
+    repo_root = router_client.find_repo_root(os.getcwd())
+    if action == "serve":
+        return serve(repo_root, idle_timeout)
+    if action == "status":
+        reply = _control(repo_root, "ping")
+        if reply is None:
+            sys.stdout.write("daemon: stopped\n")
+            return 1
+        sys.stdout.write(f"daemon: running pid={reply.get('pid')} uptime_s={reply.get('uptime')}\n")
+        sys.stdout.write(f"socket: {router_client.socket_path(repo_root)}\n")
+        return 0
+    if action == "stop":
+        reply = _control(repo_root, "stop")
+        sys.stdout.write("daemon: stopped\n" if reply is not None else "daemon: not running\n")
+        return 0
+    if action == "start":
+        if _control(repo_root, "ping") is not None:
+            sys.stdout.write("daemon: already running\n")
+            return 0
+        subprocess.Popen(
+            [
+                sys.executable,
+                str(PROJECT_ROOT / "app" / "main.py"),
+                "daemon",
+                "serve",
+                "--idle-timeout",
+                str(idle_timeout),
+            ],
+            cwd=repo_root,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + 10.0
+        while time.monotonic() < deadline:
+            if _control(repo_root, "ping") is not None:
+                sys.stdout.write(f"daemon: started socket={router_client.socket_path(repo_root)}\n")
+                return 0
+            time.sleep(0.05)
+        raise RuntimeError("router daemon: failed to start (no socket after 10s)")
+    raise RuntimeError(f"router daemon: unknown action '{action}'")
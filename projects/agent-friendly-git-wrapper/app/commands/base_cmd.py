@@ -4,6 +4,8 @@ from __future__ import annotations
 import sys
 from typing import Callable
 
+from app.utils.refs import current_branch
+
 
 def dispatch_base(
     args: list[str],
@@ -35,7 +37,7 @@ def dispatch_base(
         raise RuntimeError(f"router base: unknown argument '{token}'")
 
     if not branch:
-        branch = git_output(["rev-parse", "--abbrev-ref", "HEAD"])
+        branch = current_branch(git_output)
     if not base:
         router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
         base = str(router_cfg.get("default_base", "")).strip()
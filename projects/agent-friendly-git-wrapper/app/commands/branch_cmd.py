@@ -1,10 +1,17 @@
 ﻿"""Handle the router branch command."""
 from __future__ import annotations
 
+import subprocess
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from fnmatch import fnmatch
-from typing import Callable
+from typing import Callable, Sequence
+
+from app.utils.exec_utils import ObjectServer
+from app.utils.fetch_cache import fetch_is_fresh, record_fetch
+from app.utils.refs import current_branch, discover, git_common_dir
 
 
 def _get_branch_config(config: dict) -> dict:
@@ -23,8 +30,13 @@ def _match_any(name: str, patterns: list[str]) -> bool:
     return False
 
 
-def _ref_exists(ref: str, run_git: Callable[..., object]) -> bool:
+def _ref_exists(ref: str, run_git: Callable[..., object], objects: Callable[[], ObjectServer] | None = None) -> bool:
     """Return True when a ref exists in git."""
+    repo = discover()
+    if repo is not None:
+        return repo.has_ref(ref)
+    if objects is not None:
+        return objects().verify_ref(ref)
     proc = run_git(["show-ref", "--verify", "--quiet", ref], check=False)
     return proc.returncode == 0
 
@@ -87,6 +99,359 @@ def _load_branches(remote: str, include_remotes: bool, run_git: Callable[..., ob
     return entries
 
 
+def _base_groups(
+    base: str,
+    remote: str,
+    include_remotes: bool,
+    run_git: Callable[..., object],
+    objects: Callable[[], ObjectServer] | None,
+) -> list[tuple[str, list[str]]]:
+    """Return (base_ref, ref patterns) pairs, resolving the remote base once."""
+    if not include_remotes:
+        return [(base, ["refs/heads"])]
+    remote_base = base
+    if _ref_exists(f"refs/remotes/{remote}/{base}", run_git, objects):
+        remote_base = f"{remote}/{base}"
+    if remote_base == base:
+        return [(base, ["refs/heads", f"refs/remotes/{remote}"])]
+    return [(base, ["refs/heads"]), (remote_base, [f"refs/remotes/{remote}"])]
+
+
+def _refs_upstream_lines() -> list[str] | None:
+    """Build `refname:short|objectname|upstream:short` lines from the ref files, or None."""
+    repo = discover()
+    if repo is None:
+        return None
+    branches = repo.branches()
+    if branches is None:
+        return None
+    lines = []
+    for ref, oid in branches:
+        name = repo.shorten(ref)
+        upstream = repo.upstream_short(ref[len("refs/heads/"):])
+        if name is None or upstream is None:
+            return None
+        lines.append(f"{name}|{oid}|{upstream}")
+    return lines
+
+
+def _upstream_lines(run_git: Callable[..., object]) -> list[str]:
+    """Return local branches with their upstreams, reading ref files when possible."""
+    lines = _refs_upstream_lines()
+    if lines is not None:
+        return lines
+    proc = run_git(
+        ["for-each-ref", "--format=%(refname:short)|%(objectname)|%(upstream:short)", "refs/heads"],
+        check=False,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    return proc.stdout.splitlines()
+
+
+def _for_each_ref_lines(args: list[str], run_git: Callable[..., object]) -> list[str] | None:
+    """Run for-each-ref and return its lines, or None when git rejects the call."""
+    proc = run_git(
+        ["for-each-ref", *args],
+        check=False,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    if proc.returncode != 0:
+        return None
+    return proc.stdout.splitlines()
+
+
+def _merged_refs(groups: list[tuple[str, list[str]]], run_git: Callable[..., object]) -> set[str]:
+    """Return full refnames already merged into their group's base (one call per group)."""
+    merged: set[str] = set()
+    for base_ref, patterns in groups:
+        lines = _for_each_ref_lines([f"--merged={base_ref}", "--format=%(refname)", *patterns], run_git)
+        merged.update(lines or [])
+    return merged
+
+
+def _delete_safe_refs(refs: list[str], run_git: Callable[..., object]) -> set[str]:
+    """Return the local refs `git branch -d` would delete.
+
+    Like `-d`, a branch must be merged into its upstream, or into HEAD when it
+    has none (or the upstream is gone). Upstream state comes from one
+    `%(upstream:track)` listing: no `ahead` count means merged. Branches
+    without a usable upstream share one `--merged=HEAD` call.
+    """
+    if not refs:
+        return set()
+    wanted = set(refs)
+    lines = _for_each_ref_lines(["--format=%(refname)|%(upstream)|%(upstream:track)", *refs], run_git) or []
+    safe: set[str] = set()
+    against_head: list[str] = []
+    for line in lines:
+        parts = line.split("|", 2)
+        if len(parts) < 3 or parts[0] not in wanted:
+            continue
+        ref, upstream, track = parts
+        if not upstream or track == "[gone]":
+            against_head.append(ref)
+        elif "ahead" not in track:
+            safe.add(ref)
+    if against_head:
+        merged = _for_each_ref_lines(["--merged=HEAD", "--format=%(refname)", *against_head], run_git) or []
+        safe.update(ref for ref in merged if ref in wanted)
+    return safe
+
+
+def _unmerged_counts(
+    groups: list[tuple[str, list[str]]],
+    git_output: Callable[[list[str]], str],
+    run_git: Callable[..., object],
+    run_many: Callable[[Sequence[Sequence[str]]], list[subprocess.CompletedProcess]] | None,
+) -> dict[str, tuple[str, str]]:
+    """Return {refname: (ahead, behind)} for refs not merged into their group's base.
+
+    Uses `%(ahead-behind:BASE)` (git >= 2.41) so one for-each-ref call covers a
+    whole group; older git lists unmerged refs in bulk and counts them on a
+    bounded thread pool.
+    """
+    counts: dict[str, tuple[str, str]] = {}
+    for base_ref, patterns in groups:
+        lines = _for_each_ref_lines(
+            [f"--no-merged={base_ref}", f"--format=%(refname) %(ahead-behind:{base_ref})", *patterns],
+            run_git,
+        )
+        if lines is not None:
+            for line in lines:
+                parts = line.rsplit(" ", 2)
+                if len(parts) == 3:
+                    counts[parts[0]] = (parts[1], parts[2])
+            continue
+        refs = _for_each_ref_lines([f"--no-merged={base_ref}", "--format=%(refname)", *patterns], run_git)
+        if refs is None:
+            if _for_each_ref_lines(["--format=%(refname)", *patterns], run_git):
+                raise RuntimeError(f"fatal: Not a valid object name {base_ref}")
+            continue
+        queries = [["rev-list", "--left-right", "--count", f"{base_ref}...{ref}"] for ref in refs]
+        if run_many is not None:
+            for ref, proc in zip(refs, run_many(queries)):
+                if proc.returncode != 0:
+                    raise RuntimeError(proc.stderr.strip() or f"git {' '.join(queries[0])} failed")
+                behind, ahead = proc.stdout.split()
+                counts[ref] = (ahead, behind)
+        else:
+            for ref, query in zip(refs, queries):
+                behind, ahead = git_output(query).split()
+                counts[ref] = (ahead, behind)
+    return counts
+
+
+_SYNC_FORMAT = "%(refname:short)|%(upstream:short)|%(upstream:track,nobracket)"
+
+
+def _parse_track(track: str) -> tuple[str, str] | None:
+    """Parse `%(upstream:track,nobracket)` into (ahead, behind); None when unparseable."""
+    ahead = "0"
+    behind = "0"
+    if not track:
+        return ahead, behind
+    for part in track.split(","):
+        words = part.split()
+        if len(words) != 2 or not words[1].isdigit():
+            return None
+        if words[0] == "ahead":
+            ahead = words[1]
+        elif words[0] == "behind":
+            behind = words[1]
+        else:
+            return None
+    return ahead, behind
+
+
+def _sync_line(name: str, upstream: str, ahead: str, behind: str) -> str:
+    """Format one sync-report line from ahead/behind counts."""
+    status = "in-sync"
+    if ahead != "0" and behind != "0":
+        status = "diverged"
+    elif ahead != "0":
+        status = "ahead"
+    elif behind != "0":
+        status = "behind"
+    return f"  sync: {name} upstream={upstream} ahead={ahead} behind={behind} status={status}\n"
+
+
+def _sync_fallback(name: str, upstream: str, git_output: Callable[[list[str]], str]) -> str:
+    """Count ahead/behind with rev-list when the track field cannot be parsed."""
+    behind, ahead = git_output(["rev-list", "--left-right", "--count", f"{upstream}...{name}"]).split()
+    return _sync_line(name, upstream, ahead, behind)
+
+
+def _write_sync_report(
+    lines,
+    is_ignored: Callable[[str], bool],
+    git_output: Callable[[list[str]], str],
+    max_workers: int = 8,
+) -> None:
+    """Write sync-report lines as for-each-ref produces them.
+
+    Most branches are answered by the track field; the rare unparseable ones
+    are counted on a small thread pool while later lines keep streaming, and
+    output order still follows for-each-ref.
+    """
+    pending: deque = deque()
+
+    def _flush(block: bool) -> None:
+        """Write every ready line at the head of the queue."""
+        while pending:
+            head = pending[0]
+            if isinstance(head, str):
+                sys.stdout.write(head)
+            elif block or head.done():
+                sys.stdout.write(head.result())
+            else:
+                break
+            pending.popleft()
+        sys.stdout.flush()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for line in lines:
+            parts = line.rstrip("\n").split("|", 2)
+            if len(parts) < 3:
+                continue
+            name, upstream, track = parts
+            if is_ignored(name):
+                continue
+            if not upstream:
+                pending.append(f"  sync: {name} upstream=- ahead=0 behind=0 status=missing\n")
+            elif track == "gone":
+                pending.append(f"  sync: {name} upstream={upstream} ahead=0 behind=0 status=gone\n")
+            else:
+                counts = _parse_track(track)
+                if counts is None:
+                    pending.append(pool.submit(_sync_fallback, name, upstream, git_output))
+                else:
+                    pending.append(_sync_line(name, upstream, *counts))
+            _flush(block=False)
+        _flush(block=True)
+
+
+def _fetch(
+    remote: str,
+    refspec: str,
+    enabled: bool,
+    force: bool,
+    ttl: float,
+    git_output: Callable[[list[str]], str],
+    run_git: Callable[..., object],
+) -> None:
+    """Fetch before a branch report unless disabled or already fetched within the TTL."""
+    if not enabled:
+        return
+    git_dir = ""
+    if ttl > 0:
+        git_dir = git_common_dir(git_output)
+        if not force and fetch_is_fresh(git_dir, remote, refspec, ttl):
+            return
+    proc = run_git(["fetch", remote, refspec], check=False, capture_output=True)
+    if git_dir and proc.returncode == 0:
+        record_fetch(git_dir, remote, refspec)
+
+
+def _worktree_branches(run_git: Callable[..., object]) -> set[str]:
+    """Return branch names checked out in any worktree."""
+    proc = run_git(
+        ["worktree", "list", "--porcelain"],
+        check=False,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    prefix = "branch refs/heads/"
+    return {line[len(prefix) :] for line in proc.stdout.splitlines() if line.startswith(prefix)}
+
+
+def _branch_config_sections(run_git: Callable[..., object]) -> set[str]:
+    """Return branch names that have a `branch.<name>` config section."""
+    proc = run_git(
+        ["config", "--local", "--name-only", "--get-regexp", r"^branch\."],
+        check=False,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    names: set[str] = set()
+    for key in proc.stdout.splitlines():
+        section = key[len("branch.") :]
+        if "." in section:
+            names.add(section.rsplit(".", 1)[0])
+    return names
+
+
+def _delete_branches(targets: list[tuple[str, str]], run_git: Callable[..., object]) -> dict[str, bool]:
+    """Delete local branches in one `update-ref --stdin` transaction.
+
+    Each delete is pinned to the sha the branch was classified at, so a branch
+    that moved in the meantime fails instead of being lost. The transaction is
+    all-or-nothing; refs git names in its error are reported as failed and the
+    rest are retried as a new transaction. Returns {name: deleted}.
+    """
+    results: dict[str, bool] = {}
+    if not targets:
+        return results
+    # Like `git branch -d`, never delete a branch checked out in another worktree.
+    checked_out = _worktree_branches(run_git)
+    remaining = []
+    for name, sha in targets:
+        if name in checked_out:
+            results[name] = False
+        else:
+            remaining.append((name, sha))
+    while remaining:
+        payload = "".join(f"delete refs/heads/{name} {sha}\n" for name, sha in remaining)
+        proc = run_git(
+            ["update-ref", "--stdin"],
+            input=payload,
+            check=False,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        if proc.returncode == 0:
+            results.update({name: True for name, _sha in remaining})
+            break
+        stderr = proc.stderr or ""
+        rejected = {
+            name
+            for name, _sha in remaining
+            if f"'refs/heads/{name}'" in stderr or f" refs/heads/{name}:" in stderr
+        }
+        if not rejected:
+            results.update({name: False for name, _sha in remaining})
+            break
+        results.update({name: False for name in rejected})
+        remaining = [(name, sha) for name, sha in remaining if name not in rejected]
+
+    # update-ref leaves `branch.<name>` config behind; drop it as `git branch -d` would.
+    deleted = [name for name, ok in results.items() if ok]
+    stale = sorted(set(deleted) & _branch_config_sections(run_git)) if deleted else []
+    for name in stale:
+        # Sequential on purpose: each call takes the .git/config lock.
+        run_git(["config", "--local", "--remove-section", f"branch.{name}"], check=False, capture_output=True)
+    return results
+
+
+def _write_deletion_report(label: str, report: list[tuple[str, str]], deleted: dict[str, bool]) -> None:
+    """Write per-branch cleanup/prune lines, resolving deletes to their outcome."""
+    for action, name in report:
+        if action == "delete":
+            action = "deleted" if deleted.get(name) else "failed"
+        sys.stdout.write(f"  {label}: {action} {name}\n")
+
+
 def _parse_iso_date(date_str: str) -> datetime | None:
     """Parse an ISO8601 timestamp into a datetime."""
     if not date_str:
@@ -129,6 +494,9 @@ def dispatch_branch(
     config: dict,
     git_output: Callable[[list[str]], str],
     run_git: Callable[..., object],
+    objects: Callable[[], ObjectServer] | None = None,
+    run_many: Callable[[Sequence[Sequence[str]]], list[subprocess.CompletedProcess]] | None = None,
+    stream_git: Callable[..., object] | None = None,
 ) -> int:
     """Dispatch branch hygiene subcommands."""
     if not args:
@@ -144,6 +512,11 @@ def dispatch_branch(
     remote_default = str(branch_cfg.get("default_remote", "origin")).strip() or "origin"
     include_remotes = bool(branch_cfg.get("include_remotes", True))
     fetch_before = bool(branch_cfg.get("fetch_before", True))
+    try:
+        fetch_ttl = float(branch_cfg.get("fetch_ttl_seconds", 0) or 0)
+    except (TypeError, ValueError):
+        raise RuntimeError("branch_hygiene.fetch_ttl_seconds must be a number")
+    fetch_force = False
     protected_branches = [str(item).strip() for item in branch_cfg.get("protected_branches", []) if str(item).strip()]
     protected_patterns = [str(item).strip() for item in branch_cfg.get("protected_patterns", []) if str(item).strip()]
     ignore_patterns = [str(item).strip() for item in branch_cfg.get("ignore_patterns", []) if str(item).strip()]
@@ -181,7 +554,7 @@ def dispatch_branch(
         while idx < len(rest):
             token = rest[idx]
             if token in {"-h", "--help"}:
-                sys.stdout.write("usage: router branch report-merged [--base BRANCH] [--remote NAME]\n")
+                sys.stdout.write("usage: router branch report-merged [--base BRANCH] [--remote NAME] [--local-only] [--fetch|--no-fetch]\n")
                 return 0
             if token == "--base":
                 if idx + 1 >= len(rest):
@@ -199,23 +572,23 @@ def dispatch_branch(
                 include = False
                 idx += 1
                 continue
+            if token in {"--fetch", "--no-fetch"}:
+                fetch_before = token == "--fetch"
+                fetch_force = fetch_before
+                idx += 1
+                continue
             raise RuntimeError(f"router branch report-merged: unknown argument '{token}'")
         if not base:
             raise RuntimeError("router branch report-merged: base branch required")
-        if fetch_before:
-            run_git(["fetch", remote, base], check=False, capture_output=True)
+        _fetch(remote, base, fetch_before, fetch_force, fetch_ttl, git_output, run_git)
         branches = _load_branches(remote, include, run_git)
+        merged = _merged_refs(_base_groups(base, remote, include, run_git, objects), run_git)
         sys.stdout.write("merged_branches:\n")
         for info in branches:
             name = info["name"]
             if name == base or is_ignored(name):
                 continue
-            base_ref = base
-            if info["location"] == "remote":
-                remote_base = f"{remote}/{base}"
-                if _ref_exists(f"refs/remotes/{remote}/{base}", run_git):
-                    base_ref = remote_base
-            if run_git(["merge-base", "--is-ancestor", info["ref"], base_ref], check=False).returncode != 0:
+            if info["ref"] not in merged:
                 continue
             policy = _merge_policy_status(base, name, merge_policies)
             age = _age_days(info["date"])
@@ -237,6 +610,7 @@ def dispatch_branch(
             if token in {"-h", "--help"}:
                 sys.stdout.write(
                     "usage: router branch cleanup-merged [--base BRANCH] [--remote NAME] [--dry-run|--apply]\n"
+                    "                                    [--fetch|--no-fetch]\n"
                 )
                 return 0
             if token == "--base":
@@ -259,40 +633,53 @@ def dispatch_branch(
                 apply = True
                 idx += 1
                 continue
+            if token in {"--fetch", "--no-fetch"}:
+                fetch_before = token == "--fetch"
+                fetch_force = fetch_before
+                idx += 1
+                continue
             raise RuntimeError(f"router branch cleanup-merged: unknown argument '{token}'")
         if not base:
             raise RuntimeError("router branch cleanup-merged: base branch required")
-        if fetch_before:
-            run_git(["fetch", remote, base], check=False, capture_output=True)
-        current = git_output(["rev-parse", "--abbrev-ref", "HEAD"])
+        _fetch(remote, base, fetch_before, fetch_force, fetch_ttl, git_output, run_git)
+        current = current_branch(git_output)
         branches = _load_branches(remote, False, run_git)
         sys.stdout.write("cleanup_merged:\n")
         if safe_mode and not override:
             raise RuntimeError("router branch cleanup-merged blocked by safe mode (use --override to proceed)")
+        merged = _merged_refs(_base_groups(base, remote, False, run_git, objects), run_git)
+        # Merged into the base is not enough: `git branch -d` also wants HEAD or the upstream.
+        delete_safe = _delete_safe_refs(
+            [info["ref"] for info in branches if info["ref"] in merged and info["name"] != base], run_git
+        )
+        report: list[tuple[str, str]] = []
+        targets: list[tuple[str, str]] = []
         for info in branches:
             name = info["name"]
             if name == base or is_ignored(name):
                 continue
-            if run_git(["merge-base", "--is-ancestor", info["ref"], base], check=False).returncode != 0:
+            if info["ref"] not in merged:
                 continue
             if is_protected(name):
-                sys.stdout.write(f"  cleanup: skip-protected {name}\n")
+                report.append(("skip-protected", name))
                 continue
             if name == current:
-                sys.stdout.write(f"  cleanup: skip-current {name}\n")
+                report.append(("skip-current", name))
                 continue
             policy = _merge_policy_status(base, name, merge_policies)
             if enforce_policy and policy == "blocked":
-                sys.stdout.write(f"  cleanup: policy-blocked {name}\n")
+                report.append(("policy-blocked", name))
+                continue
+            if info["ref"] not in delete_safe:
+                report.append(("skip-unmerged-head", name))
                 continue
             if not apply:
-                sys.stdout.write(f"  cleanup: dry-run {name}\n")
+                report.append(("dry-run", name))
                 continue
-            proc = run_git(["branch", "-d", name], check=False, capture_output=True, text=True)
-            if proc.returncode == 0:
-                sys.stdout.write(f"  cleanup: deleted {name}\n")
-            else:
-                sys.stdout.write(f"  cleanup: failed {name}\n")
+            report.append(("delete", name))
+            targets.append((name, info["sha"]))
+        deleted = _delete_branches(targets, run_git)
+        _write_deletion_report("cleanup", report, deleted)
         return 0
 
     if sub == "audit-unmerged":
@@ -303,7 +690,7 @@ def dispatch_branch(
         while idx < len(rest):
             token = rest[idx]
             if token in {"-h", "--help"}:
-                sys.stdout.write("usage: router branch audit-unmerged [--base BRANCH] [--remote NAME]\n")
+                sys.stdout.write("usage: router branch audit-unmerged [--base BRANCH] [--remote NAME] [--local-only] [--fetch|--no-fetch]\n")
                 return 0
             if token == "--base":
                 if idx + 1 >= len(rest):
@@ -321,26 +708,26 @@ def dispatch_branch(
                 include = False
                 idx += 1
                 continue
+            if token in {"--fetch", "--no-fetch"}:
+                fetch_before = token == "--fetch"
+                fetch_force = fetch_before
+                idx += 1
+                continue
             raise RuntimeError(f"router branch audit-unmerged: unknown argument '{token}'")
         if not base:
             raise RuntimeError("router branch audit-unmerged: base branch required")
-        if fetch_before:
-            run_git(["fetch", remote, base], check=False, capture_output=True)
+        _fetch(remote, base, fetch_before, fetch_force, fetch_ttl, git_output, run_git)
         branches = _load_branches(remote, include, run_git)
+        groups = _base_groups(base, remote, include, run_git, objects)
+        unmerged = _unmerged_counts(groups, git_output, run_git, run_many)
         sys.stdout.write("unmerged_branches:\n")
         for info in branches:
             name = info["name"]
             if name == base or is_ignored(name):
                 continue
-            base_ref = base
-            if info["location"] == "remote":
-                remote_base = f"{remote}/{base}"
-                if _ref_exists(f"refs/remotes/{remote}/{base}", run_git):
-                    base_ref = remote_base
-            if run_git(["merge-base", "--is-ancestor", info["ref"], base_ref], check=False).returncode == 0:
+            if info["ref"] not in unmerged:
                 continue
-            counts = git_output(["rev-list", "--left-right", "--count", f"{base_ref}...{info['ref']}"])
-            behind, ahead = counts.split()
+            ahead, behind = unmerged[info["ref"]]
             policy = _merge_policy_status(base, name, merge_policies)
             age = _age_days(info["date"])
             upstream = info["upstream"] or "-"
@@ -360,6 +747,7 @@ def dispatch_branch(
             if token in {"-h", "--help"}:
                 sys.stdout.write(
                     "usage: router branch prune-local [--remote NAME] [--pattern GLOB] [--dry-run|--apply]\n"
+                    "                                 [--fetch|--no-fetch]\n"
                 )
                 return 0
             if token == "--remote":
@@ -382,44 +770,41 @@ def dispatch_branch(
                 apply = True
                 idx += 1
                 continue
+            if token in {"--fetch", "--no-fetch"}:
+                fetch_before = token == "--fetch"
+                fetch_force = fetch_before
+                idx += 1
+                continue
             raise RuntimeError(f"router branch prune-local: unknown argument '{token}'")
         if safe_mode and not override:
             raise RuntimeError("router branch prune-local blocked by safe mode (use --override to proceed)")
-        if fetch_before:
-            run_git(["fetch", remote, "--prune"], check=False, capture_output=True)
-        current = git_output(["rev-parse", "--abbrev-ref", "HEAD"])
-        proc = run_git(
-            ["for-each-ref", "--format=%(refname:short)|%(upstream:short)", "refs/heads"],
-            check=False,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-        )
+        _fetch(remote, "--prune", fetch_before, fetch_force, fetch_ttl, git_output, run_git)
+        current = current_branch(git_output)
         sys.stdout.write("prune_local:\n")
-        for line in proc.stdout.splitlines():
-            parts = line.split("|", 1)
-            if len(parts) < 2:
+        report = []
+        targets = []
+        for line in _upstream_lines(run_git):
+            parts = line.split("|", 2)
+            if len(parts) < 3:
                 continue
-            name, upstream = parts
+            name, sha, upstream = parts
             if not upstream:
                 continue
             if pattern and not fnmatch(name, pattern):
                 continue
             if is_protected(name):
-                sys.stdout.write(f"  prune: skip-protected {name}\n")
+                report.append(("skip-protected", name))
                 continue
             if name == current:
-                sys.stdout.write(f"  prune: skip-current {name}\n")
+                report.append(("skip-current", name))
                 continue
             if not apply:
-                sys.stdout.write(f"  prune: dry-run {name}\n")
+                report.append(("dry-run", name))
                 continue
-            proc = run_git(["branch", "-D", name], check=False, capture_output=True, text=True)
-            if proc.returncode == 0:
-                sys.stdout.write(f"  prune: deleted {name}\n")
-            else:
-                sys.stdout.write(f"  prune: failed {name}\n")
+            report.append(("delete", name))
+            targets.append((name, sha))
+        deleted = _delete_branches(targets, run_git)
+        _write_deletion_report("prune", report, deleted)
         return 0
 
     if sub == "sync-report":
@@ -428,7 +813,7 @@ def dispatch_branch(
         while idx < len(rest):
             token = rest[idx]
             if token in {"-h", "--help"}:
-                sys.stdout.write("usage: router branch sync-report [--remote NAME]\n")
+                sys.stdout.write("usage: router branch sync-report [--remote NAME] [--fetch|--no-fetch]\n")
                 return 0
             if token == "--remote":
                 if idx + 1 >= len(rest):
@@ -436,40 +821,30 @@ def dispatch_branch(
                 remote = rest[idx + 1].strip()
                 idx += 2
                 continue
+            if token in {"--fetch", "--no-fetch"}:
+                fetch_before = token == "--fetch"
+                fetch_force = fetch_before
+                idx += 1
+                continue
             raise RuntimeError(f"router branch sync-report: unknown argument '{token}'")
-        if fetch_before:
-            run_git(["fetch", remote, "--prune"], check=False, capture_output=True)
-        proc = run_git(
-            ["for-each-ref", "--format=%(refname:short)|%(upstream:short)", "refs/heads"],
-            check=False,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-        )
+        _fetch(remote, "--prune", fetch_before, fetch_force, fetch_ttl, git_output, run_git)
         sys.stdout.write("branch_sync:\n")
-        for line in proc.stdout.splitlines():
-            parts = line.split("|", 1)
-            if len(parts) < 2:
-                continue
-            name, upstream = parts
-            if is_ignored(name):
-                continue
-            if not upstream:
-                sys.stdout.write(f"  sync: {name} upstream=- ahead=0 behind=0 status=missing\n")
-                continue
-            counts = git_output(["rev-list", "--left-right", "--count", f"{upstream}...{name}"])
-            behind, ahead = counts.split()
-            status = "in-sync"
-            if ahead != "0" and behind != "0":
-                status = "diverged"
-            elif ahead != "0":
-                status = "ahead"
-            elif behind != "0":
-                status = "behind"
-            sys.stdout.write(
-                f"  sync: {name} upstream={upstream} ahead={ahead} behind={behind} status={status}\n"
+        sys.stdout.flush()
+        ref_args = ["for-each-ref", f"--format={_SYNC_FORMAT}", "refs/heads"]
+        if stream_git is not None:
+            with stream_git(ref_args) as stream:
+                _write_sync_report(stream, is_ignored, git_output)
+                stream.wait()
+        else:
+            proc = run_git(
+                ref_args,
+                check=False,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
             )
+            _write_sync_report(proc.stdout.splitlines(), is_ignored, git_output)
         return 0
 
     if sub == "validate-name":
@@ -494,7 +869,7 @@ def dispatch_branch(
             raise RuntimeError(f"router branch validate-name: unknown argument '{token}'")
 
         if not branch:
-            branch = git_output(["rev-parse", "--abbrev-ref", "HEAD"])
+            branch = current_branch(git_output)
         patterns = branch_cfg.get("name_patterns", [])
         patterns = [str(item).strip() for item in patterns if str(item).strip()]
         if not patterns:
@@ -0,0 +1,40 @@
+﻿"""Handle the router cache command."""
+from __future__ import annotations
+
+import sys
+from typing import Callable
+
+
+def dispatch_cache(
+    args: list[str],
+    config: dict,
+    result_cache: Callable[[dict], object],
+) -> int:
+    """Report on or clear the immutable-commit result cache."""
+    if args and args[0] in {"-h", "--help"}:
+        sys.stdout.write("usage: router cache stats|clear\n")
+        return 0
+    if not args:
+        raise RuntimeError("router cache: action is required (stats|clear)")
+    action = args[0]
+    if len(args) > 1:
+        raise RuntimeError(f"router cache: unexpected argument '{args[1]}'")
+    if action not in {"stats", "clear"}:
+        raise RuntimeError(f"router cache: unknown action '{action}' (expected stats|clear)")
+
+    cache = result_cache(config)
+    if cache is None:
+        sys.stdout.write("cache: disabled\n")
+        return 0
+    if action == "clear":
+        removed = cache.clear()
+        sys.stdout.write(f"cache: cleared entries={removed}\n")
+        return 0
+    stats = cache.stats()
+    sys.stdout.write(f"cache: {stats['path']}\n")
+    sys.stdout.write(f"entries: {stats['entries']}\n")
+    sys.stdout.write(f"bytes: {stats['bytes']}\n")
+    sys.stdout.write(f"max_bytes: {stats['max_bytes']}\n")
+    sys.stdout.write(f"hits: {stats['hits']}\n")
+    sys.stdout.write(f"misses: {stats['misses']}\n")
+    return 0
@@ -4,15 +4,26 @@ from __future__ import annotations
 import sys
 from typing import Callable
 
-from app.cli.cli_parse import _build_diff_args, _build_pathspecs, _parse_diff_style_args
-from app.compact.compact import _apply_compact_options, _render_compact_output
+from app.cli.cli_parse import _build_diff_args, _build_pathspecs, _parse_diff_style_args, _validate_budget
+from app.compact.budget import render_budget_output
+from app.compact.compact import (
+    _apply_compact_options,
+    _render_compact_output,
+    _stream_compact_output,
+    _stream_requested,
+)
+from app.compact.estimate import downgrade_args, guard_patch_output, print_estimate
 from app.config.config_loader import _load_compact_defaults, _load_compact_profiles, _resolve_noise_level
+from app.utils.result_cache import run_cached
 
 
 def dispatch_compare(
     args: list[str],
     config: dict,
     run_git: Callable[..., object],
+    stream_git: Callable[..., object] | None = None,
+    objects: Callable[[], object] | None = None,
+    result_cache: Callable[[dict], object] | None = None,
 ) -> int:
     """Compare two refs and print the filtered diff output."""
     range_ref = ""
@@ -28,7 +39,8 @@ def dispatch_compare(
             sys.stdout.write(
                 "usage: router compare <base>..<head> [--noise[=LEVEL]] [--context N] [--detail 0..3]\n"
                 "                     [--summary|--files-only|--stat|--name-status|--super-compact] [--compact[=SPEC]]\n"
-                "                     [--include PATTERN] [--exclude PATTERN] [--ops LIST]\n"
+                "                     [--include PATTERN] [--exclude PATTERN] [--ops LIST] [--stream|--no-stream]\n"
+                "                     [--budget TOKENS] [--estimate] [--no-cache]\n"
             )
             return 0
         parse_opts, positionals = _parse_diff_style_args(
@@ -53,11 +65,15 @@ def dispatch_compare(
     noise_level, noise_flags = _resolve_noise_level(config, parse_opts["noise_level"])
     detail_mode = parse_opts["detail_mode"]
     detail = parse_opts["detail"]
-    if not detail_mode and detail == 2:
+    budget = parse_opts["budget"]
+    if budget is not None:
+        # Budgeted output always starts from compact patches and demotes per file.
+        _validate_budget("compare", detail_mode)
+    elif not detail_mode and detail == 2:
         default_detail = router_cfg.get("diff_default_detail")
         if default_detail is not None:
             detail = int(default_detail)
-    compact_enabled = parse_opts["compact_enabled"]
+    compact_enabled = parse_opts["compact_enabled"] or budget is not None
     context = parse_opts["context"]
     context_set = parse_opts["context_set"]
     if not compact_enabled and context is None and not context_set:
@@ -95,27 +111,66 @@ def dispatch_compare(
         diff_args.append("--")
         diff_args.extend(pathspecs)
 
-    proc = run_git(
-        diff_args,
-        check=False,
-        capture_output=True,
-        text=True,
-        encoding="utf-8",
-        errors="replace",
-    )
-    output_text = proc.stdout or ""
-    output_text = _render_compact_output(
-        output_text,
-        compact_enabled,
-        include_patch,
-        compact_opts,
-        config,
-        "router compare: --compact requires patch output (detail 2/3)",
+    compact_headers = compact_enabled and bool(compact_opts.get("drop_headers", False))
+    if parse_opts["estimate"]:
+        return print_estimate(diff_args, run_git, config, compact_headers)
+
+    def _produce() -> int:
+        """Run git diff and write the (optionally compacted) result."""
+        if budget is not None:
+            return render_budget_output(diff_args, budget, run_git, compact_opts, config, "compare")
+        git_args, patch, compact = diff_args, include_patch, compact_enabled
+        if include_patch:
+            # Oversized patches step down to --stat/--name-status before git renders them.
+            mode = guard_patch_output(diff_args, run_git, config, "compare", compact_headers)
+            if mode != "patch":
+                git_args, patch, compact = downgrade_args(diff_args, mode), False, False
+        if stream_git is not None and _stream_requested(parse_opts["stream"], compact, config):
+            return _stream_compact_output(
+                git_args,
+                stream_git,
+                run_git,
+                compact,
+                patch,
+                compact_opts,
+                no_prefix,
+                "router compare: --compact requires patch output (detail 2/3)",
+            )
+
+        proc = run_git(
+            git_args,
+            check=False,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        output_text = proc.stdout or ""
+        output_text = _render_compact_output(
+            output_text,
+            compact,
+            patch,
+            compact_opts,
+            config,
+            "router compare: --compact requires patch output (detail 2/3)",
+        )
+        if output_text:
+            sys.stdout.write(output_text)
+        if proc.stderr:
+            sys.stderr.write(proc.stderr)
+        return proc.returncode
+
+    if parse_opts["no_cache"]:
+        return _produce()
+    # Only two-sided ranges are cached; a single ref compares against the worktree.
+    cache_options = {
+        "args": diff_args,
+        "compact": compact_enabled,
+        "compact_opts": compact_opts,
+        "budget": budget,
+    }
+    return run_cached(
+        "compare", range_ref, False, config, cache_options, _produce, result_cache, objects
     )
-    if output_text:
-        sys.stdout.write(output_text)
-    if proc.stderr:
-        sys.stderr.write(proc.stderr)
-    return proc.returncode
 
 
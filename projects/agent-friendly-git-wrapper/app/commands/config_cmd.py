@@ -0,0 +1,26 @@
+﻿"""Handle the router config command."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+from app.config.config_loader import _compile_config
+
+
+def dispatch_config(args: list[str], config: dict) -> int | None:
+    """Prebuild the compiled config snapshot; other `config` calls fall through to git."""
+    if not args or args[0] != "compile":
+        return None
+    if len(args) > 1:
+        if args[1] in {"-h", "--help"}:
+            sys.stdout.write("usage: router [--config PATH] [--profile NAME] config compile\n")
+            return 0
+        raise RuntimeError(f"router config: unexpected argument '{args[1]}'")
+    runtime = config.get("_runtime", {}) if isinstance(config.get("_runtime"), dict) else {}
+    config_path = Path(str(runtime.get("config_path", "")))
+    snapshot, sources = _compile_config(config_path, str(runtime.get("profile_arg", "")))
+    sys.stdout.write(f"config: compiled profile={runtime.get('profile') or '(none)'}\n")
+    sys.stdout.write(f"snapshot: {snapshot}\n")
+    for source in sources:
+        sys.stdout.write(f"source: {source}\n")
+    return 0
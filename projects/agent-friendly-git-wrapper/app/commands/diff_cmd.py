@@ -4,8 +4,15 @@ from __future__ import annotations
 import sys
 from typing import Callable, Sequence
 
-from app.cli.cli_parse import _build_diff_args, _build_pathspecs, _parse_diff_style_args
-from app.compact.compact import _apply_compact_options, _render_compact_output
+from app.cli.cli_parse import _build_diff_args, _build_pathspecs, _parse_diff_style_args, _validate_budget
+from app.compact.budget import render_budget_output
+from app.compact.compact import (
+    _apply_compact_options,
+    _render_compact_output,
+    _stream_compact_output,
+    _stream_requested,
+)
+from app.compact.estimate import downgrade_args, guard_patch_output, print_estimate
 from app.config.config_loader import _load_compact_defaults, _load_compact_profiles, _resolve_noise_level
 
 
@@ -13,6 +20,7 @@ def dispatch_diff(
     args: list[str],
     config: dict,
     run_git: Callable[..., object],
+    stream_git: Callable[..., object] | None = None,
 ) -> int:
     """Render a diff with configured detail, noise, and compact settings."""
     compact_opts = _load_compact_defaults(config)
@@ -26,7 +34,8 @@ def dispatch_diff(
             sys.stdout.write(
                 "usage: router diff [--noise[=LEVEL]] [--context N] [--detail 0..3]\n"
                 "                  [--summary|--files-only|--stat|--name-status|--super-compact] [--compact[=SPEC]]\n"
-                "                  [--include PATTERN] [--exclude PATTERN] [--ops LIST]\n"
+                "                  [--include PATTERN] [--exclude PATTERN] [--ops LIST] [--stream|--no-stream]\n"
+                "                  [--budget TOKENS] [--estimate]\n"
             )
             return 0
         parse_opts, _ = _parse_diff_style_args(args[idx:], config, "diff", allow_positional=False)
@@ -43,11 +52,15 @@ def dispatch_diff(
     noise_level, noise_flags = _resolve_noise_level(config, parse_opts["noise_level"])
     detail_mode = parse_opts["detail_mode"]
     detail = parse_opts["detail"]
-    if not detail_mode and detail == 2:
+    budget = parse_opts["budget"]
+    if budget is not None:
+        # Budgeted output always starts from compact patches and demotes per file.
+        _validate_budget("diff", detail_mode)
+    elif not detail_mode and detail == 2:
         default_detail = router_cfg.get("diff_default_detail")
         if default_detail is not None:
             detail = int(default_detail)
-    compact_enabled = parse_opts["compact_enabled"]
+    compact_enabled = parse_opts["compact_enabled"] or budget is not None
     context = parse_opts["context"]
     context_set = parse_opts["context_set"]
     if not compact_enabled and context is None and not context_set:
@@ -85,6 +98,30 @@ def dispatch_diff(
         diff_args.append("--")
         diff_args.extend(pathspecs)
 
+    compact_headers = compact_enabled and bool(compact_opts.get("drop_headers", False))
+    if parse_opts["estimate"]:
+        return print_estimate(diff_args, run_git, config, compact_headers)
+    if budget is not None:
+        return render_budget_output(diff_args, budget, run_git, compact_opts, config, "diff")
+    if include_patch:
+        # Oversized patches step down to --stat/--name-status before git renders them.
+        mode = guard_patch_output(diff_args, run_git, config, "diff", compact_headers)
+        if mode != "patch":
+            diff_args = downgrade_args(diff_args, mode)
+            include_patch = compact_enabled = False
+
+    if stream_git is not None and _stream_requested(parse_opts["stream"], compact_enabled, config):
+        return _stream_compact_output(
+            diff_args,
+            stream_git,
+            run_git,
+            compact_enabled,
+            include_patch,
+            compact_opts,
+            no_prefix,
+            "router diff: --compact requires patch output (detail 2/3)",
+        )
+
     proc = run_git(
         diff_args,
         check=False,
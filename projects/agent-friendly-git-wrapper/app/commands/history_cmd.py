@@ -1,6 +1,7 @@
 ﻿"""Handle the router history command."""
 from __future__ import annotations
 
+import json
 import sys
 from typing import Callable
 
@@ -8,10 +9,21 @@ from app.cli.cli_parse import (
     _build_pathspecs,
     _parse_list_arg,
     _parse_log_like_args,
+    _parse_budget,
     _parse_noise_flag,
     _parse_ops,
+    _validate_budget,
 )
-from app.compact.compact import _apply_compact_options, _render_compact_output
+from app.compact.budget import render_budget_output
+from app.compact.compact import (
+    _apply_compact_options,
+    _render_compact_output,
+    _stream_compact_output,
+    _stream_requested,
+)
+from app.compact.estimate import downgrade_args, guard_patch_output, print_estimate
+from app.compact.records import OUTPUT_FORMATS, render_records
+from app.compact.shards import render_sharded_history
 from app.config.config_loader import (
     _load_compact_defaults,
     _load_compact_profiles,
@@ -19,12 +31,19 @@ from app.config.config_loader import (
     _load_history_compact_meta_overrides,
     _resolve_noise_level,
 )
+from app.utils.commit_index import shortstat_line
+from app.utils.result_cache import run_cached
+from app.utils.walk_cursor import page_size_setting, start_walk, validate_paging, walk_page
 
 
 def dispatch_history(
     args: list[str],
     config: dict,
     run_git: Callable[..., object],
+    stream_git: Callable[..., object] | None = None,
+    objects: Callable[[], object] | None = None,
+    result_cache: Callable[[dict], object] | None = None,
+    commit_index: Callable[[dict], object] | None = None,
 ) -> int:
     """Render commit history with optional diff and compact output."""
     count = None
@@ -47,6 +66,13 @@ def dispatch_history(
     ops = ""
     compact_enabled = False
     compact_spec = ""
+    stream = None
+    no_cache = False
+    budget = None
+    estimate = False
+    jobs = None
+    output_format = "text"
+    per_commit_max_tokens = None
     compact_opts = _load_compact_defaults(config)
     compact_profiles = _load_compact_profiles(config)
 
@@ -56,7 +82,10 @@ def dispatch_history(
             "                     [--patch|--no-patch] [--summary|--files-only|--stat|--name-status]\n"
             "                     [--noise[=LEVEL]] [--context N] [--compact[=SPEC]] [--ops LIST]\n"
             "                     [--commit-meta MODE] [--short-hash] [--no-hash] [--no-author]\n"
-            "                     [--no-date] [--no-subject]\n"
+            "                     [--no-date] [--no-subject] [--stream|--no-stream]\n"
+            "                     [--budget TOKENS] [--estimate] [--jobs N] [--no-cache]\n"
+            "                     [--format text|json|toon] [--per-commit-max-tokens TOKENS]\n"
+            "                     [--page-size N] [--after-cursor CURSOR]\n"
         )
         return 0
 
@@ -66,6 +95,8 @@ def dispatch_history(
     rev_range = parsed["rev_range"]
     path = parsed["path"]
     short_hash = parsed["short_hash"]
+    after_cursor = parsed["after_cursor"]
+    page_size = parsed["page_size"]
     args = remaining
 
     idx = 0
@@ -142,6 +173,54 @@ def dispatch_history(
             else:
                 idx += 1
             continue
+        if token in {"--stream", "--no-stream"}:
+            stream = token == "--stream"
+            idx += 1
+            continue
+        if token == "--no-cache":
+            no_cache = True
+            idx += 1
+            continue
+        if token == "--estimate":
+            estimate = True
+            idx += 1
+            continue
+        if token == "--jobs":
+            if idx + 1 >= len(args):
+                raise RuntimeError("router history: --jobs requires a value")
+            try:
+                jobs = int(args[idx + 1])
+            except ValueError:
+                raise RuntimeError("router history: --jobs requires an integer")
+            if jobs < 0:
+                raise RuntimeError("router history: --jobs must be 0 (one per CPU) or more")
+            idx += 2
+            continue
+        if token == "--format":
+            if idx + 1 >= len(args):
+                raise RuntimeError("router history: --format requires a value")
+            output_format = args[idx + 1].strip().lower()
+            if output_format not in OUTPUT_FORMATS:
+                raise RuntimeError("router history: --format must be text|json|toon")
+            idx += 2
+            continue
+        if token == "--per-commit-max-tokens":
+            if idx + 1 >= len(args):
+                raise RuntimeError("router history: --per-commit-max-tokens requires a value")
+            try:
+                per_commit_max_tokens = int(args[idx + 1])
+            except ValueError:
+                per_commit_max_tokens = 0
+            if per_commit_max_tokens <= 0:
+                raise RuntimeError("router history: --per-commit-max-tokens must be a positive token count")
+            idx += 2
+            continue
+        if token == "--budget":
+            if idx + 1 >= len(args):
+                raise RuntimeError("router history: --budget requires a value")
+            budget = _parse_budget(args[idx + 1], "history")
+            idx += 2
+            continue
         if token == "--include":
             if idx + 1 >= len(args):
                 raise RuntimeError("router history: --include requires a value")
@@ -164,10 +243,25 @@ def dispatch_history(
 
     if rev_range and since:
         raise RuntimeError("router history: use either --since or --range, not both")
+    paged = page_size is not None or bool(after_cursor)
+    if paged:
+        validate_paging(count, since, rev_range, after_cursor, "history")
+
+    # Record output parses commits one by one instead of passing git's text through.
+    structured = output_format != "text" or per_commit_max_tokens is not None
+    if structured and budget is not None:
+        raise RuntimeError("router history: --budget cannot be combined with --format/--per-commit-max-tokens")
 
     router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
     noise_level, noise_flags = _resolve_noise_level(config, noise_level)
 
+    if budget is not None:
+        # Budgeted output always starts from compact patches and demotes per file.
+        _validate_budget("history", detail_mode)
+        if include_patch is False:
+            raise RuntimeError("router history: --budget requires patch output")
+        include_patch = True
+        compact_enabled = True
     if include_patch is None:
         include_patch = bool(router_cfg.get("history_default_patch", True))
 
@@ -232,15 +326,41 @@ def dispatch_history(
         format_parts.append("%an")
     if include_date:
         format_parts.append("%ad")
+    record_meta = [
+        field
+        for field, included in (
+            ("short" if short_hash else "hash", include_hash),
+            ("subject", include_subject),
+            ("author", include_author),
+            ("date", include_date),
+        )
+        if included
+    ]
 
-    log_args = ["log"]
+    pathspecs = _build_pathspecs(includes, excludes)
+    if path:
+        pathspecs.append(path)
+
+    rev_args: list[str] = []
     if count is not None:
-        log_args.append(f"--max-count={count}")
+        rev_args.append(f"--max-count={count}")
 
     if rev_range:
-        log_args.append(rev_range)
+        rev_args.append(rev_range)
     elif since:
-        log_args.append(f"{since}..HEAD")
+        rev_args.append(f"{since}..HEAD")
+
+    cursor = None
+    if paged:
+        # The page's commits are walked first, then rendered as an explicit list.
+        diff_filter = ops if include_patch and not detail_mode else ""
+        oids, cursor = _history_page(
+            rev_args, after_cursor, page_size_setting(config, page_size, "history"), pathspecs, diff_filter, run_git
+        )
+        if not oids:
+            return 0
+        rev_args = ["--no-walk=unsorted", *oids]
+    log_args = ["log", *rev_args]
 
     format_str = " ".join(format_parts)
     log_args.append(f"--pretty=format:{format_str}")
@@ -274,34 +394,154 @@ def dispatch_history(
         if ops:
             log_args.append(f"--diff-filter={ops}")
 
-    pathspecs = _build_pathspecs(includes, excludes)
-    if path:
-        pathspecs.append(path)
     if pathspecs:
         log_args.append("--")
         log_args.extend(pathspecs)
 
-    proc = run_git(
-        log_args,
-        check=False,
-        capture_output=True,
-        text=True,
-        encoding="utf-8",
-        errors="replace",
-    )
-    output_text = proc.stdout or ""
-    output_text = _render_compact_output(
-        output_text,
-        compact_enabled,
-        include_patch,
-        compact_opts,
-        config,
-        "router history: --compact requires patch output",
-    )
-    if output_text:
-        sys.stdout.write(output_text)
-    if proc.stderr:
-        sys.stderr.write(proc.stderr)
-    return proc.returncode
+    compact_headers = compact_enabled and bool(compact_opts.get("drop_headers", False))
+    if estimate:
+        return print_estimate(log_args, run_git, config, compact_headers)
 
+    def _produce() -> int:
+        """Run git log and write the (optionally compacted) result."""
+        if budget is not None:
+            return render_budget_output(log_args, budget, run_git, compact_opts, config, "history")
+        git_args, patch, compact = log_args, include_patch, compact_enabled
+        if include_patch:
+            # Oversized patches step down to --stat/--name-status before git renders them.
+            mode = guard_patch_output(log_args, run_git, config, "history", compact_headers)
+            if mode != "patch":
+                git_args, patch, compact = downgrade_args(log_args, mode), False, False
+        if detail_mode == "summary" and not structured and not ops and not paged and commit_index is not None:
+            # Shortstat totals come from the commit index instead of diffing every commit.
+            index = commit_index(config)
+            if index is not None:
+                try:
+                    selected = index.select(
+                        rev_args, count, format_str, ["--date=short"] if include_date else [], pathspecs
+                    )
+                finally:
+                    index.close()
+                if selected is not None:
+                    pieces = []
+                    for item in selected:
+                        stat = f"{shortstat_line(item.files, item.added, item.deleted)}\n" if item.files else ""
+                        # Like git, an empty header adds no line of its own.
+                        pieces.append(f"{item.header}\n{stat}" if item.header and stat else item.header or stat)
+                    sys.stdout.write("\n".join(pieces))
+                    return 0
+        if structured:
+            return render_records(
+                git_args,
+                run_git,
+                output_format,
+                record_meta,
+                compact_opts if compact else None,
+                per_commit_max_tokens,
+                config,
+            )
+        if patch:
+            # Long ranges render as parallel per-chunk logs with identical output.
+            sharded = render_sharded_history(
+                git_args, rev_args, run_git, compact, compact_opts, no_prefix, config, jobs
+            )
+            if sharded is not None:
+                return sharded
+        if stream_git is not None and _stream_requested(stream, compact, config):
+            return _stream_compact_output(
+                git_args,
+                stream_git,
+                run_git,
+                compact,
+                patch,
+                compact_opts,
+                no_prefix,
+                "router history: --compact requires patch output",
+            )
 
+        proc = run_git(
+            git_args,
+            check=False,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        output_text = proc.stdout or ""
+        output_text = _render_compact_output(
+            output_text,
+            compact,
+            patch,
+            compact_opts,
+            config,
+            "router history: --compact requires patch output",
+        )
+        if output_text:
+            sys.stdout.write(output_text)
+        if proc.stderr:
+            sys.stderr.write(proc.stderr)
+        return proc.returncode
+
+    if no_cache:
+        returncode = _produce()
+    else:
+        # History is a pure function of its endpoint commits once they are resolved to oids.
+        revision = rev_args[1] if paged else rev_range or (f"{since}..HEAD" if since else "HEAD")
+        cache_options = {
+            "args": log_args,
+            "compact": compact_enabled,
+            "compact_opts": compact_opts,
+            "budget": budget,
+            "format": output_format,
+            "per_commit_max_tokens": per_commit_max_tokens,
+        }
+        returncode = run_cached("history", revision, True, config, cache_options, _produce, result_cache, objects)
+    if cursor:
+        _write_cursor(cursor, output_format)
+    return returncode
+
+
+def _history_page(
+    rev_args: list[str],
+    after_cursor: str,
+    page_size: int,
+    pathspecs: list[str],
+    diff_filter: str,
+    run_git: Callable[..., object],
+) -> tuple[list[str], str | None]:
+    """Walk one page of history; returns its oids and the next cursor."""
+    keep = None
+    if diff_filter:
+        def keep(walked: list[tuple[str, str]]) -> set[str]:
+            """Keep walked commits that --diff-filter would show."""
+            proc = run_git(
+                [
+                    "log",
+                    "--no-walk=unsorted",
+                    "--format=%H",
+                    f"--diff-filter={diff_filter}",
+                    *[oid for oid, _ in walked],
+                    "--",
+                    *pathspecs,
+                ],
+                check=False,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            )
+            return set((proc.stdout or "").split())
+
+    frontier, negatives = start_walk(run_git, rev_args, after_cursor, pathspecs, "history")
+    return walk_page(run_git, frontier, negatives, pathspecs, page_size, keep)
+
+
+def _write_cursor(cursor: str, output_format: str) -> None:
+    """Write the next page's cursor after the page, in the page's output format."""
+    if output_format == "json":
+        # One more JSON Lines record; `type` tells it apart from the commit objects (which carry `oid`).
+        sys.stdout.write(json.dumps({"type": "cursor", "next_cursor": cursor}) + "\n")
+    elif output_format == "toon":
+        sys.stdout.write(f'\nnext_cursor: "{cursor}"\n')
+    else:
+        sys.stdout.write(f"\nnext_cursor: {cursor}\n")
@@ -0,0 +1,63 @@
+﻿"""Handle the router index command."""
+from __future__ import annotations
+
+import sys
+from typing import Callable
+
+from app.utils.commit_index import CommitIndex, index_path
+
+
+def dispatch_index(
+    args: list[str],
+    config: dict,
+    run_git: Callable[..., object],
+    git_common_dir: Callable[[], str],
+) -> int:
+    """Build, report on, or drop the SQLite commit index."""
+    if args and args[0] in {"-h", "--help"}:
+        sys.stdout.write("usage: router index build|status|drop\n")
+        return 0
+    if not args:
+        raise RuntimeError("router index: action is required (build|status|drop)")
+    action = args[0]
+    if len(args) > 1:
+        raise RuntimeError(f"router index: unexpected argument '{args[1]}'")
+    if action not in {"build", "status", "drop"}:
+        raise RuntimeError(f"router index: unknown action '{action}' (expected build|status|drop)")
+
+    path = index_path(git_common_dir)
+    if path is None:
+        raise RuntimeError("router index: not inside a git repository")
+    if action == "drop":
+        removed = 0
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            target = path.with_name(path.name + suffix)
+            if target.exists():
+                target.unlink()
+                removed += 1
+        sys.stdout.write("index: dropped\n" if removed else "index: not built\n")
+        return 0
+    if action == "status" and not path.exists():
+        sys.stdout.write("index: not built (run `router index build`)\n")
+        return 0
+
+    index = CommitIndex(path, run_git)
+    try:
+        if action == "build":
+            added = index.update()
+            sys.stdout.write(f"index: added commits={added}\n")
+        stats = index.status()
+    finally:
+        index.close()
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    index_cfg = router_cfg.get("commit_index", {})
+    enabled = index_cfg.get("enabled", True) if isinstance(index_cfg, dict) else True
+    sys.stdout.write(f"index: {stats['path']}\n")
+    sys.stdout.write(f"enabled: {str(bool(enabled)).lower()}\n")
+    sys.stdout.write(f"commits: {stats['commits']}\n")
+    sys.stdout.write(f"numstat_rows: {stats['numstat_rows']}\n")
+    sys.stdout.write(f"tips: {stats['tips']}\n")
+    sys.stdout.write(f"stale: {str(stats['stale']).lower()}\n")
+    sys.stdout.write(f"subject_search: {'fts5' if stats['fts'] else 'like'}\n")
+    sys.stdout.write(f"bytes: {stats['bytes']}\n")
+    return 0
@@ -5,51 +5,98 @@ import sys
 from typing import Callable
 
 from app.cli.cli_parse import _parse_log_like_args
+from app.utils.walk_cursor import page_size_setting, start_walk, validate_paging, walk_page
+
+
+def _subject_matches(subject: str, words: list[str]) -> bool:
+    """Return True when the subject contains every (lowercased) search word."""
+    subject = subject.lower()
+    return all(word in subject for word in words)
 
 
 def dispatch_log(
     args: list[str],
     config: dict,
     run_git: Callable[..., object],
+    commit_index: Callable[[dict], object] | None = None,
 ) -> int:
     """Render a concise git log based on the provided options."""
     if "-h" in args or "--help" in args:
         sys.stdout.write(
             "usage: router log --n N [--since REF|--range A..B] [--path PATH] [--short-hash]\n"
+            "                  [--search WORDS] [--page-size N] [--after-cursor CURSOR]\n"
         )
         return 0
 
     parsed, rest = _parse_log_like_args(args, "log")
-    if rest:
-        raise RuntimeError(f"router log: unknown argument '{rest[0]}'")
+    search: list[str] = []
+    idx = 0
+    while idx < len(rest):
+        token = rest[idx]
+        if token == "--search":
+            if idx + 1 >= len(rest):
+                raise RuntimeError("router log: --search requires a value")
+            search = rest[idx + 1].split()
+            if not search:
+                raise RuntimeError("router log: --search requires at least one word")
+            idx += 2
+            continue
+        raise RuntimeError(f"router log: unknown argument '{token}'")
     count = parsed["count"]
     since = parsed["since"]
     rev_range = parsed["rev_range"]
     path = parsed["path"]
     short_hash = parsed["short_hash"]
+    after_cursor = parsed["after_cursor"]
+    page_size = parsed["page_size"]
 
     if rev_range and since:
         raise RuntimeError("router log: use either --since or --range, not both")
+    paged = page_size is not None or bool(after_cursor)
+    if paged:
+        validate_paging(count, since, rev_range, after_cursor, "log")
 
-    log_args = ["log"]
+    rev_args: list[str] = []
     if count is not None:
-        log_args.append(f"--max-count={count}")
+        rev_args.append(f"--max-count={count}")
 
     if rev_range:
-        log_args.append(rev_range)
+        rev_args.append(rev_range)
     elif since:
-        log_args.append(f"{since}..HEAD")
+        rev_args.append(f"{since}..HEAD")
+    # --grep matches whole messages, so a subject search filters git's output and applies the count itself.
+    log_args = ["log", *(arg for arg in rev_args if not (search and arg.startswith("--max-count=")))]
 
+    header_format = "%h %s" if short_hash else "%H %s"
     if short_hash:
         log_args.append("--abbrev-commit")
-        log_args.append("--pretty=format:%h %s")
-    else:
-        log_args.append("--pretty=format:%H %s")
+    log_args.append(f"--pretty=format:{header_format}")
+    if search:
+        log_args.extend(["-i", "--fixed-strings", "--all-match", *(f"--grep={word}" for word in search)])
 
     if path:
         log_args.append("--")
         log_args.append(path)
 
+    if paged:
+        return _log_page(
+            rev_args, after_cursor, page_size_setting(config, page_size, "log"), path, search, short_hash, header_format,
+            run_git,
+        )
+
+    if (path or search) and commit_index is not None:
+        index = commit_index(config)
+        if index is not None:
+            try:
+                selected = index.select(
+                    rev_args, count, header_format, [], [path] if path else [], search or None, totals=False
+                )
+            finally:
+                index.close()
+            if selected is not None:
+                sys.stdout.write("\n".join(item.header for item in selected))
+                return 0
+
     proc = run_git(
         log_args,
         check=False,
@@ -58,10 +105,62 @@ def dispatch_log(
         encoding="utf-8",
         errors="replace",
     )
-    if proc.stdout:
-        sys.stdout.write(proc.stdout)
+    output = proc.stdout or ""
+    if search and output:
+        words = [word.lower() for word in search]
+        lines = [line for line in output.split("\n") if _subject_matches(line.partition(" ")[2], words)]
+        output = "\n".join(lines[:count] if count is not None else lines)
+    if output:
+        sys.stdout.write(output)
     if proc.stderr:
         sys.stderr.write(proc.stderr)
     return proc.returncode
 
 
+def _log_page(
+    rev_args: list[str],
+    after_cursor: str,
+    page_size: int,
+    path: str,
+    search: list[str],
+    short_hash: bool,
+    header_format: str,
+    run_git: Callable[..., object],
+) -> int:
+    """Write one page of the log and, when more commits remain, a `next_cursor:` line."""
+    words = [word.lower() for word in search]
+    keep = None
+    if words:
+        def keep(walked: list[tuple[str, str]]) -> set[str]:
+            """Keep walked commits whose subjects match the search words."""
+            return {oid for oid, subject in walked if _subject_matches(subject, words)}
+
+    pathspecs = [path] if path else []
+    frontier, negatives = start_walk(run_git, rev_args, after_cursor, pathspecs, "log")
+    oids, cursor = walk_page(run_git, frontier, negatives, pathspecs, page_size, keep)
+    returncode = 0
+    if oids:
+        proc = run_git(
+            [
+                "log",
+                "--no-walk=unsorted",
+                *(["--abbrev-commit"] if short_hash else []),
+                f"--pretty=format:{header_format}",
+                *oids,
+                "--",
+                *pathspecs,
+            ],
+            check=False,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        if proc.stdout:
+            sys.stdout.write(proc.stdout)
+        if proc.stderr:
+            sys.stderr.write(proc.stderr)
+        returncode = proc.returncode
+    if cursor:
+        sys.stdout.write(f"\nnext_cursor: {cursor}\n")
+    return returncode
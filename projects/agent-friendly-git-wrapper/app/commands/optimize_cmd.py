@@ -0,0 +1,203 @@
+﻿"""Handle the router optimize command."""
+from __future__ import annotations
+
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from app.utils.repo_features import FEATURES, enable_features, inspect_features
+
+MAIN_SCRIPT = Path(__file__).resolve().parents[1] / "main.py"
+DEFAULT_BENCH_RUNS = 3
+# Read paths that gain from the features: status (untracked cache, fsmonitor,
+# index v4), path-limited walks (Bloom filters), and reachability (graph, bitmaps).
+DEFAULT_BENCH_COMMANDS = (
+    "state",
+    "log --n 200 --path {path}",
+    "history --n 50 --files-only --path {path}",
+    "branch audit-unmerged --base HEAD --local-only --no-fetch",
+)
+
+
+def _optimize_cfg(config: dict) -> dict:
+    """Return the router.optimize config section."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    optimize_cfg = router_cfg.get("optimize", {})
+    return optimize_cfg if isinstance(optimize_cfg, dict) else {}
+
+
+def _bench_path(run_git: Callable[..., object]) -> str:
+    """Return a path HEAD's commit touched, for the path-limited benchmark commands."""
+    proc = run_git(
+        ["log", "-1", "--format=", "--name-only", "--no-renames"],
+        check=False,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    return next((line for line in (proc.stdout or "").splitlines() if line), "")
+
+
+def _bench_commands(config: dict, run_git: Callable[..., object]) -> tuple[list[str], str]:
+    """Return the benchmark commands and the path substituted for `{path}`.
+
+    Commands using `{path}` are dropped when HEAD touches no path.
+    """
+    commands = _optimize_cfg(config).get("bench_commands", list(DEFAULT_BENCH_COMMANDS))
+    if not isinstance(commands, list):
+        raise RuntimeError("router.optimize.bench_commands must be a list")
+    commands = [str(command) for command in commands]
+    path = _bench_path(run_git) if any("{path}" in command for command in commands) else ""
+    return [command for command in commands if path or "{path}" not in command], path
+
+
+def _time_command(command: str, path: str, config: dict, runs: int) -> float | None:
+    """Return the median wall time in ms of `router <command>` run in a fresh process, or None if it fails.
+
+    One untimed run first warms the OS and router caches for both sides of the comparison.
+    """
+    runtime = config.get("_runtime", {}) if isinstance(config.get("_runtime"), dict) else {}
+    argv = [sys.executable, str(MAIN_SCRIPT), "router", "--unpaged"]
+    if runtime.get("config_path"):
+        argv.extend(["--config", str(runtime["config_path"])])
+    argv.extend(shlex.split(command.replace("{path}", shlex.quote(path))))
+    samples: list[float] = []
+    for attempt in range(runs + 1):
+        started = time.perf_counter()
+        proc = subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=os.environ.copy())
+        elapsed = (time.perf_counter() - started) * 1000
+        if proc.returncode != 0:
+            return None
+        if attempt:
+            samples.append(elapsed)
+    return statistics.median(samples)
+
+
+def _format_ms(value: float | None) -> str:
+    """Format a timing cell."""
+    return "error" if value is None else f"{value:.1f}"
+
+
+def _write_table(commands: list[str], before: list[float | None], after: list[float | None] | None) -> None:
+    """Print the benchmark table (one timing column, or before/after with the change)."""
+    width = max([len("command"), *(len(command) for command in commands)])
+    if after is None:
+        sys.stdout.write(f"{'command':<{width}}  {'ms':>9}\n")
+        for command, value in zip(commands, before):
+            sys.stdout.write(f"{command:<{width}}  {_format_ms(value):>9}\n")
+        return
+    sys.stdout.write(f"{'command':<{width}}  {'before_ms':>9}  {'after_ms':>9}  {'change':>7}\n")
+    for command, old, new in zip(commands, before, after):
+        change = f"{(new - old) / old * 100:+.0f}%" if old and new is not None else "-"
+        sys.stdout.write(f"{command:<{width}}  {_format_ms(old):>9}  {_format_ms(new):>9}  {change:>7}\n")
+
+
+def _write_bench_header(runs: int, path: str) -> None:
+    """Print the benchmark heading and the path used for `{path}`."""
+    sys.stdout.write(f"benchmark (median of {runs} runs, ms):\n")
+    if path:
+        sys.stdout.write(f"path: {path}\n")
+
+
+def _write_features(states: list) -> None:
+    """Print one `name: status (detail)` line per feature."""
+    for state in states:
+        detail = f" ({state.detail})" if state.detail else ""
+        sys.stdout.write(f"  {state.name}: {state.status}{detail}\n")
+
+
+def dispatch_optimize(
+    args: list[str],
+    config: dict,
+    run_git: Callable[..., object],
+) -> int:
+    """Inspect, and with --apply enable, the git features behind fast router reads; benchmark around it."""
+    apply = False
+    bench = True
+    only: list[str] = []
+    runs = None
+    idx = 0
+    while idx < len(args):
+        token = args[idx]
+        if token in {"-h", "--help"}:
+            sys.stdout.write("usage: router optimize [--apply] [--only FEATURE,...] [--runs N] [--no-bench]\n")
+            return 0
+        if token == "--apply":
+            apply = True
+            idx += 1
+            continue
+        if token == "--no-bench":
+            bench = False
+            idx += 1
+            continue
+        if token in {"--only", "--runs"}:
+            if idx + 1 >= len(args):
+                raise RuntimeError(f"router optimize: {token} requires a value")
+            value = args[idx + 1]
+            if token == "--only":
+                only = [name.strip() for name in value.split(",") if name.strip()]
+                unknown = [name for name in only if name not in FEATURES]
+                if unknown:
+                    raise RuntimeError(
+                        f"router optimize: unknown feature '{unknown[0]}' (expected {', '.join(FEATURES)})"
+                    )
+            else:
+                try:
+                    runs = int(value)
+                except ValueError:
+                    raise RuntimeError("router optimize: --runs requires an integer")
+                if runs < 1:
+                    raise RuntimeError("router optimize: --runs must be positive")
+            idx += 2
+            continue
+        raise RuntimeError(f"router optimize: unknown argument '{token}'")
+
+    runtime = config.get("_runtime", {}) if isinstance(config.get("_runtime"), dict) else {}
+    if apply and runtime.get("safe_mode", False) and not runtime.get("override", False):
+        raise RuntimeError("router optimize --apply blocked by safe mode (use --override to proceed)")
+    if runs is None:
+        try:
+            runs = int(_optimize_cfg(config).get("bench_runs", DEFAULT_BENCH_RUNS))
+        except (TypeError, ValueError):
+            raise RuntimeError("router.optimize.bench_runs must be an integer")
+        runs = max(1, runs)
+
+    states = [state for state in inspect_features(run_git) if not only or state.name in only]
+    sys.stdout.write("features:\n")
+    _write_features(states)
+    commands, path = _bench_commands(config, run_git) if bench else ([], "")
+    before = [_time_command(command, path, config, runs) for command in commands]
+
+    if not apply:
+        if any(state.status in {"missing", "partial"} and state.enable for state in states):
+            sys.stdout.write("hint: run `router optimize --apply` to enable the missing features\n")
+        if commands:
+            _write_bench_header(runs, path)
+            _write_table(commands, before, None)
+        return 0
+
+    rc = 0
+    sys.stdout.write("applied:\n")
+    results = enable_features(states, run_git)
+    for names, git_args, error in results:
+        outcome = f"error: {error}" if error else "ok"
+        sys.stdout.write(f"  {names}: git {' '.join(git_args)} -> {outcome}\n")
+        if error:
+            rc = 1
+    if not results:
+        sys.stdout.write("  nothing to do\n")
+    else:
+        wanted = {state.name for state in states}
+        sys.stdout.write("features after:\n")
+        _write_features([state for state in inspect_features(run_git) if state.name in wanted])
+    if commands:
+        after = [_time_command(command, path, config, runs) for command in commands]
+        _write_bench_header(runs, path)
+        _write_table(commands, before, after)
+    return rc
@@ -0,0 +1,97 @@
+﻿"""Handle the router page command."""
+from __future__ import annotations
+
+import sys
+from typing import Callable
+
+from app.utils.spill_store import page_lines
+
+
+def _parse_count(value: str, flag: str) -> int:
+    """Parse a positive integer flag value."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise RuntimeError(f"router page: {flag} requires an integer")
+    if number < 1:
+        raise RuntimeError(f"router page: {flag} must be positive")
+    return number
+
+
+def _path_matches(shown: str, wanted: str) -> bool:
+    """Match a requested path against an indexed section path (which may carry a common-prefix token)."""
+    if shown == wanted:
+        return True
+    _, _, tail = shown.partition("/")
+    return bool(tail) and (wanted == tail or wanted.endswith(f"/{tail}"))
+
+
+def dispatch_page(
+    args: list[str],
+    config: dict,
+    spill_store: Callable[[dict], object],
+) -> int:
+    """Serve a slice of a spilled history/compare/diff output by cursor id."""
+    if not args or args[0] in {"-h", "--help"}:
+        if not args:
+            raise RuntimeError("router page: cursor id is required")
+        sys.stdout.write("usage: router page <id> [--from N] [--lines M] [--file PATH] [--files]\n")
+        return 0
+    cursor = args[0]
+    start = 1
+    count = 0
+    file_path = ""
+    list_files = False
+    idx = 1
+    while idx < len(args):
+        token = args[idx]
+        if token in {"--from", "--lines", "--file"}:
+            if idx + 1 >= len(args):
+                raise RuntimeError(f"router page: {token} requires a value")
+            value = args[idx + 1]
+            if token == "--from":
+                start = _parse_count(value, token)
+            elif token == "--lines":
+                count = _parse_count(value, token)
+            else:
+                file_path = value
+            idx += 2
+            continue
+        if token == "--files":
+            list_files = True
+            idx += 1
+            continue
+        raise RuntimeError(f"router page: unknown argument '{token}'")
+    if file_path and (list_files or count or start != 1):
+        raise RuntimeError("router page: --file cannot be combined with --from/--lines/--files")
+
+    store = spill_store(config)
+    if store is None:
+        raise RuntimeError("router page: not in a git repository")
+    spill = store.open(cursor)
+    try:
+        total = spill.line_count
+        if list_files:
+            for path, first, end in spill.files():
+                sys.stdout.write(f"{path} lines {first + 1}-{end}\n")
+            return 0
+        if file_path:
+            sections = [(first, end) for path, first, end in spill.files() if _path_matches(path, file_path)]
+            if not sections:
+                raise RuntimeError(f"router page: no file section for '{file_path}' in {spill.spill_id}")
+            for first, end in sections:
+                sys.stdout.write(spill.lines(first, end - first))
+            return 0
+        if start > total:
+            raise RuntimeError(f"router page: --from {start} is past the end ({total} lines)")
+        count = count or page_lines(config)
+        end = min(total, start - 1 + count)
+        sys.stdout.write(spill.lines(start - 1, end - start + 1))
+        if end < total:
+            sys.stdout.write(
+                f"cursor: {spill.spill_id} lines {start}-{end} of {total}; "
+                f"next: router page {spill.spill_id} --from {end + 1}\n"
+            )
+        return 0
+    finally:
+        spill.close()
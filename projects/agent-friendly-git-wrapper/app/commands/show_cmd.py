@@ -5,12 +5,15 @@ import sys
 from typing import Callable
 
 from app.cli.cli_parse import _validate_stat_name_status
+from app.utils.result_cache import run_cached
 
 
 def dispatch_show(
     args: list[str],
     config: dict,
     run_git: Callable[..., object],
+    objects: Callable[[], object] | None = None,
+    result_cache: Callable[[dict], object] | None = None,
 ) -> int:
     """Show commit metadata and optional diff details."""
     commit = ""
@@ -19,6 +22,7 @@ def dispatch_show(
     include_name_status = False
     oneline = False
     short_hash = False
+    no_cache = False
 
     idx = 0
     while idx < len(args):
@@ -26,6 +30,7 @@ def dispatch_show(
         if token in {"-h", "--help"}:
             sys.stdout.write(
                 "usage: router show <sha> [--patch] [--stat] [--name-status] [--oneline] [--short-hash]\n"
+                "                  [--no-cache]\n"
             )
             return 0
         if token == "--patch":
@@ -48,6 +53,10 @@ def dispatch_show(
             short_hash = True
             idx += 1
             continue
+        if token == "--no-cache":
+            no_cache = True
+            idx += 1
+            continue
         if token.startswith("-"):
             raise RuntimeError(f"router show: unknown argument '{token}'")
         if not commit:
@@ -78,16 +87,22 @@ def dispatch_show(
     else:
         show_args.append("--no-patch")
 
-    proc = run_git(
-        show_args,
-        check=False,
-        capture_output=True,
-        text=True,
-        encoding="utf-8",
-        errors="replace",
-    )
-    if proc.stdout:
-        sys.stdout.write(proc.stdout)
-    if proc.stderr:
-        sys.stderr.write(proc.stderr)
-    return proc.returncode
+    def _produce() -> int:
+        """Run git show and write its output."""
+        proc = run_git(
+            show_args,
+            check=False,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        if proc.stdout:
+            sys.stdout.write(proc.stdout)
+        if proc.stderr:
+            sys.stderr.write(proc.stderr)
+        return proc.returncode
+
+    if no_cache:
+        return _produce()
+    return run_cached("show", commit, True, config, {"args": show_args}, _produce, result_cache, objects)
@@ -1,10 +1,14 @@
 ﻿"""Handle the router state command."""
 from __future__ import annotations
 
+import subprocess
 import sys
 from pathlib import Path
 from typing import Callable, Sequence
 
+from app.utils.exec_utils import ObjectServer
+from app.utils.refs import Repo, discover
+
 
 def _detect_ops(git_dir: Path) -> list[str]:
     """Detect in-progress git operations based on git-dir markers."""
@@ -22,19 +26,108 @@ def _detect_ops(git_dir: Path) -> list[str]:
     return ops
 
 
+def _parse_porcelain_v2(text: str) -> dict:
+    """Parse `git status --porcelain=v2 --branch` into head/upstream/entry fields."""
+    info = {"oid": "", "head": "", "upstream": "", "ahead": "", "behind": "", "entries": 0}
+    has_ab = False
+    for line in text.splitlines():
+        if not line.startswith("# "):
+            if line:
+                info["entries"] += 1
+            continue
+        key, _, value = line[2:].partition(" ")
+        if key == "branch.oid":
+            info["oid"] = "" if value == "(initial)" else value
+        elif key == "branch.head":
+            info["head"] = "HEAD" if value == "(detached)" else value
+        elif key == "branch.upstream":
+            info["upstream"] = value
+        elif key == "branch.ab":
+            parts = value.split()
+            if len(parts) == 2:
+                info["ahead"] = parts[0].lstrip("+")
+                info["behind"] = parts[1].lstrip("-")
+                has_ab = True
+    if not has_ab:
+        # git omits branch.ab when the upstream ref is gone; treat it as unset.
+        info["upstream"] = ""
+    return info
+
+
+def _branch_from_refs(repo: Repo | None, branch: str) -> tuple[str, str] | None:
+    """Return (oid, `branch@{u}` short name or "") for a local branch read from the ref files.
+
+    Returns None when `branch` is not an unambiguous local branch name or its
+    upstream cannot be resolved without git.
+    """
+    if repo is None:
+        return None
+    ref = f"refs/heads/{branch}"
+    oid = repo.resolve(ref)
+    if oid is None or repo.shorten(ref) != branch:
+        return None
+    upstream = repo.upstream(branch)
+    if upstream is None:
+        return None
+    # `@{u}` fails (reported as no upstream) when the tracking ref does not exist.
+    if not upstream or not repo.has_ref(upstream):
+        return oid, ""
+    short = repo.shorten(upstream)
+    if short is None:
+        return None
+    return oid, short
+
+
+def _run_queries(
+    queries: dict[str, list[str]],
+    git_output: Callable[[Sequence[str]], str],
+    run_many: Callable[[Sequence[Sequence[str]]], list[subprocess.CompletedProcess]] | None,
+) -> dict[str, tuple[bool, str]]:
+    """Run named git queries, concurrently when possible, as (ok, output) pairs."""
+    results: dict[str, tuple[bool, str]] = {}
+    if run_many is None:
+        for name, query in queries.items():
+            try:
+                results[name] = (True, git_output(query))
+            except RuntimeError as exc:
+                results[name] = (False, str(exc))
+        return results
+    for name, proc in zip(queries, run_many(list(queries.values()))):
+        if proc.returncode == 0:
+            results[name] = (True, proc.stdout.strip())
+        else:
+            results[name] = (False, proc.stderr.strip() or f"git {' '.join(queries[name])} failed")
+    return results
+
+
+def _required(results: dict[str, tuple[bool, str]], name: str) -> str:
+    """Return a query's output, raising its error when the query failed."""
+    ok, output = results[name]
+    if not ok:
+        raise RuntimeError(output)
+    return output
+
+
 def dispatch_state(
     args: list[str],
     config: dict,
     git_output: Callable[[Sequence[str]], str],
+    objects: Callable[[], ObjectServer] | None = None,
+    run_many: Callable[[Sequence[Sequence[str]]], list[subprocess.CompletedProcess]] | None = None,
 ) -> int:
     """Print a compact snapshot of repo state and worktree status."""
     branch = ""
     base = ""
+    untracked = None
+    untracked_cache = None
     idx = 0
     while idx < len(args):
         token = args[idx]
         if token in {"-h", "--help"}:
-            sys.stdout.write("usage: router state [--branch NAME] [--base NAME]\n")
+            sys.stdout.write(
+                "usage: router state [--branch NAME] [--base NAME] [--no-untracked|--untracked]\n"
+                "                    [--untracked-cache|--no-untracked-cache]\n"
+            )
             return 0
         if token == "--branch":
             if idx + 1 >= len(args):
@@ -48,44 +141,91 @@ def dispatch_state(
             base = args[idx + 1]
             idx += 2
             continue
+        if token in {"--untracked", "--no-untracked"}:
+            untracked = token == "--untracked"
+            idx += 1
+            continue
+        if token in {"--untracked-cache", "--no-untracked-cache"}:
+            untracked_cache = token == "--untracked-cache"
+            idx += 1
+            continue
         raise RuntimeError(f"router state: unknown argument '{token}'")
 
-    repo_root = git_output(["rev-parse", "--show-toplevel"])
-    current_branch = git_output(["rev-parse", "--abbrev-ref", "HEAD"])
-    target_branch = branch or current_branch
-    head_full = git_output(["rev-parse", target_branch])
-    head_short = git_output(["rev-parse", "--short", target_branch])
-
-    worktree_dirty = False
-    dirty_count = 0
-    status = git_output(["status", "--porcelain"]).splitlines()
-    if status:
-        worktree_dirty = True
-        dirty_count = len(status)
-
     router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
     if not base:
         base = str(router_cfg.get("default_base", "")).strip()
+    if untracked is None:
+        untracked = bool(router_cfg.get("state_untracked", True))
+    if untracked_cache is None:
+        untracked_cache = bool(router_cfg.get("state_untracked_cache", False))
+
+    # One porcelain v2 status call supplies head oid, branch, upstream and entry
+    # count; the remaining queries are independent and run alongside it.
+    target_ref = branch or "HEAD"
+    status_args = ["status", "--porcelain=v2", "--branch"]
+    if not untracked:
+        status_args.append("--untracked-files=no")
+    if untracked_cache:
+        status_args = ["-c", "core.untrackedCache=true", *status_args]
+    # Repo paths, and a named branch's oid/upstream, come from the ref files
+    # when they can be read safely; git answers otherwise.
+    repo = discover()
+    branch_refs = _branch_from_refs(repo, branch) if branch else None
+    queries: dict[str, list[str]] = {"status": status_args}
+    if repo is not None:
+        queries["meta"] = ["rev-parse", "--short", target_ref]
+    else:
+        queries["meta"] = ["rev-parse", "--show-toplevel", "--git-dir", "--short", target_ref]
+    if base:
+        queries["counts"] = ["rev-list", "--left-right", "--count", f"{base}...{target_ref}"]
+    if branch and branch_refs is None:
+        queries["upstream"] = ["rev-parse", "--abbrev-ref", "--symbolic-full-name", f"{branch}@{{u}}"]
+    results = _run_queries(queries, git_output, run_many)
+
+    if repo is not None:
+        repo_root, git_dir_raw = str(repo.work_tree), str(repo.git_dir)
+        head_short = _required(results, "meta")
+    else:
+        repo_root, git_dir_raw, head_short = _required(results, "meta").splitlines()
+    snapshot = _parse_porcelain_v2(_required(results, "status"))
+    current_branch = snapshot["head"]
+    target_branch = branch or current_branch
+    if branch_refs is not None:
+        head_full, upstream = branch_refs
+        upstream_ahead = upstream_behind = ""
+    elif branch:
+        # Object lookups go through the cat-file object server, not another process.
+        if objects is not None:
+            head_full = objects().resolve(branch)
+        else:
+            head_full = git_output(["rev-parse", branch])
+        ok, upstream = results["upstream"]
+        if not ok:
+            upstream = ""
+        upstream_ahead = upstream_behind = ""
+    else:
+        head_full = snapshot["oid"]
+        upstream = snapshot["upstream"]
+        upstream_ahead = snapshot["ahead"]
+        upstream_behind = snapshot["behind"]
+
+    dirty_count = snapshot["entries"]
+    worktree_dirty = dirty_count > 0
+
     ahead = "?"
     behind = "?"
     base_exists = True
     if base:
-        try:
-            counts = git_output(["rev-list", "--left-right", "--count", f"{base}...{target_branch}"])
+        ok, counts = results["counts"]
+        if ok:
             parts = counts.split()
             if len(parts) >= 2:
                 behind = parts[0]
                 ahead = parts[1]
-        except RuntimeError:
+        else:
             base_exists = False
 
-    upstream = ""
-    try:
-        upstream = git_output(["rev-parse", "--abbrev-ref", "--symbolic-full-name", f"{target_branch}@{{u}}"])
-    except RuntimeError:
-        upstream = ""
-
-    git_dir = Path(git_output(["rev-parse", "--git-dir"]))
+    git_dir = Path(git_dir_raw)
     if not git_dir.is_absolute():
         git_dir = Path(repo_root) / git_dir
     ops = _detect_ops(git_dir)
@@ -106,6 +246,9 @@ def dispatch_state(
         sys.stdout.write(f"ahead: {ahead}\n")
     if upstream:
         sys.stdout.write(f"upstream: {upstream}\n")
+        if upstream_ahead:
+            sys.stdout.write(f"upstream_behind: {upstream_behind}\n")
+            sys.stdout.write(f"upstream_ahead: {upstream_ahead}\n")
     sys.stdout.write(f"ops: {','.join(ops) if ops else 'none'}\n")
     return 0
 
@@ -0,0 +1,355 @@
+"""Token-budgeted diff output: pick a compact patch, stat line or name per file."""
+from __future__ import annotations
+
+import fnmatch
+import sys
+from typing import Callable
+
+from app.compact.compact import _compact_output, _measure_text
+
+LEVELS = ("omitted", "name", "stat", "patch")
+DEFAULT_ENCODING = "cl100k_base"
+
+_COMMIT_MARK = "\x1e"
+_FIELD_MARK = "\x1f"
+
+
+class _BudgetFile:
+    """One changed file (per commit, for history) and its candidate renderings."""
+
+    __slots__ = ("group", "index", "path", "old_path", "added", "deleted", "binary", "priority", "texts", "costs", "level")
+
+    def __init__(self, group: int, index: int, added: str, deleted: str, path: str, old_path: str) -> None:
+        """Store a numstat entry; `texts`/`costs` are filled per level later."""
+        self.group = group
+        self.index = index
+        self.path = path
+        self.old_path = old_path
+        self.binary = added == "-" or deleted == "-"
+        self.added = 0 if self.binary else int(added)
+        self.deleted = 0 if self.binary else int(deleted)
+        self.priority = 0.0
+        self.texts: dict[str, str] = {}
+        self.costs: dict[str, int] = {}
+        self.level = "omitted"
+
+    def label(self) -> str:
+        """Return the display name, showing both sides of a rename."""
+        return f"{self.old_path} => {self.path}" if self.old_path else self.path
+
+    def stat_text(self) -> str:
+        """Return the one-line stat rendering."""
+        if self.binary:
+            return f"{self.label()} | bin\n"
+        return f"{self.label()} | +{self.added} -{self.deleted}\n"
+
+    def rank(self) -> tuple:
+        """Sort key: configured priority first, then change size, then git order."""
+        return (-self.priority, -(self.added + self.deleted), self.group, self.index)
+
+
+def _budget_cfg(config: dict) -> dict:
+    """Return the router.budget config section."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    budget_cfg = router_cfg.get("budget", {})
+    return budget_cfg if isinstance(budget_cfg, dict) else {}
+
+
+def _path_priority(path: str, priorities: dict) -> float:
+    """Return the highest priority among the configured globs matching `path` (0 when none)."""
+    matched = [float(weight) for pattern, weight in priorities.items() if fnmatch.fnmatch(path, str(pattern))]
+    return max(matched) if matched else 0.0
+
+
+def _parse_numstat_z(text: str) -> list[tuple[str, str, str, str]]:
+    """Parse `--numstat -z` records into (added, deleted, path, old_path) tuples."""
+    fields = text.split("\0")
+    entries: list[tuple[str, str, str, str]] = []
+    idx = 0
+    while idx < len(fields):
+        record = fields[idx].lstrip("\n")
+        idx += 1
+        if not record:
+            continue
+        added, deleted, path = record.split("\t", 2)
+        old_path = ""
+        if not path:
+            # Renames and copies carry the old and new paths as the next two fields.
+            old_path, path = fields[idx], fields[idx + 1]
+            idx += 2
+        entries.append((added, deleted, path, old_path))
+    return entries
+
+
+def _split_args(git_args: list[str]) -> tuple[list[str], list[str], list[str]]:
+    """Split patch-mode args into (selection, patch options, pathspecs) around `--patch` and `--`."""
+    patch_at = git_args.index("--patch")
+    sep_at = git_args.index("--") if "--" in git_args else len(git_args)
+    select = [arg for arg in git_args[:patch_at] if arg != "--stat"]
+    options = [arg for arg in git_args[patch_at + 1:sep_at] if arg != "--stat"]
+    return select, options, git_args[sep_at + 1:]
+
+
+def _split_sections(text: str) -> list[str]:
+    """Split patch text into per-file sections at `diff --git` lines."""
+    sections: list[str] = []
+    for line in text.splitlines(keepends=True):
+        if line.startswith("diff --git ") or not sections:
+            sections.append(line)
+        else:
+            sections[-1] += line
+    return [section for section in sections if section.startswith("diff --git ")]
+
+
+def _split_commit(chunk: str) -> tuple[str, str, str]:
+    """Split a marked log chunk into (full hash, meta line, body)."""
+    cut = min((pos for pos in (chunk.find("\n"), chunk.find("\0")) if pos >= 0), default=len(chunk))
+    commit, _, header = chunk[:cut].partition(_FIELD_MARK)
+    return commit, header, chunk[cut + 1:]
+
+
+def _summary_line(budget: int, counts: dict[str, int]) -> str:
+    """Return the budget summary line for per-level file counts."""
+    summary = ", ".join(f"{counts[level]} {level}" for level in reversed(LEVELS) if counts[level])
+    return f"budget: {budget} tokens, {summary or 'no changes'}\n"
+
+
+def _literal_pathspecs(files: list[_BudgetFile]) -> list[str]:
+    """Pathspecs matching exactly these files (both sides of renames, so detection still pairs them)."""
+    paths: list[str] = []
+    for item in files:
+        paths.append(item.path)
+        if item.old_path:
+            paths.append(item.old_path)
+    return [f":(literal){path}" for path in dict.fromkeys(paths)]
+
+
+def _run(run_git: Callable[..., object], args: list[str]):
+    """Run git capturing text output."""
+    return run_git(args, check=False, capture_output=True, text=True, encoding="utf-8", errors="replace")
+
+
+class _BudgetRun:
+    """Collect numstat entries, fetch candidate patches, and allocate levels against a token budget."""
+
+    def __init__(
+        self,
+        git_args: list[str],
+        budget: int,
+        run_git: Callable[..., object],
+        compact_opts: dict,
+        config: dict,
+        command: str,
+    ) -> None:
+        """Prepare the selection and measurement settings for one budgeted render."""
+        self.command = command
+        self.select, self.options, self.pathspecs = _split_args(git_args)
+        self.history = self.select[0] == "log"
+        self.budget = budget
+        self.run_git = run_git
+        # Files are shown or demoted one by one, so no path table or shared
+        # prefix token that would have to cover files left out of the output.
+        self.compact_opts = {**compact_opts, "path_table": False, "path_common_prefix": False}
+        self.config = config
+        budget_cfg = _budget_cfg(config)
+        self.encoding = str(budget_cfg.get("encoding", DEFAULT_ENCODING)).strip() or DEFAULT_ENCODING
+        priorities = budget_cfg.get("path_priorities", {})
+        self.priorities = priorities if isinstance(priorities, dict) else {}
+        if self.history:
+            for idx, arg in enumerate(self.select):
+                if arg.startswith("--pretty=format:"):
+                    # Mark each commit with its full hash so patch chunks can be matched back.
+                    self.select[idx] = f"--pretty=format:%x1e%H%x1f{arg[len('--pretty=format:'):]}"
+        self.headers: list[str] = []
+        self.hashes: list[str] = []
+        self.files: list[_BudgetFile] = []
+        self.stderr = ""
+
+    def measure(self, text: str) -> int:
+        """Count tokens with the configured encoding."""
+        return _measure_text(text, "tokens", self.encoding, self.config)
+
+    def collect(self) -> int:
+        """Read numstat for the selection; return git's exit code."""
+        # `--unified` implies `--patch`, so it only goes on the patch fetch.
+        options = [arg for arg in self.options if not arg.startswith("--unified")]
+        args = [*self.select, "--numstat", "-z", *options]
+        if self.pathspecs:
+            args.extend(["--", *self.pathspecs])
+        proc = _run(self.run_git, args)
+        self.stderr += proc.stderr or ""
+        if proc.returncode != 0:
+            return proc.returncode
+        text = proc.stdout or ""
+        chunks = text.split(_COMMIT_MARK)[1:] if self.history else [text]
+        for group, chunk in enumerate(chunks):
+            body = chunk
+            if self.history:
+                commit, header, body = _split_commit(chunk)
+                self.hashes.append(commit)
+                self.headers.append(f"{header}\n" if header else "")
+            for index, entry in enumerate(_parse_numstat_z(body)):
+                item = _BudgetFile(group, index, *entry)
+                item.priority = _path_priority(item.path, self.priorities)
+                self.files.append(item)
+        for item in self.files:
+            # Demoted history entries name their commit, since they are listed after the patches.
+            prefix = f"{self.hashes[item.group][:7]} " if self.history else ""
+            item.texts["name"] = f"{prefix}{item.label()}\n"
+            item.texts["stat"] = f"{prefix}{item.stat_text()}"
+            for level in ("name", "stat"):
+                item.costs[level] = self.measure(item.texts[level])
+        return 0
+
+    def fetch_patches(self, candidates: list[_BudgetFile]) -> None:
+        """Fetch and compact patch text for `candidates` with one git call."""
+        if not candidates:
+            return
+        if self.history:
+            hashes = [self.hashes[group] for group in dict.fromkeys(item.group for item in candidates)]
+            select = ["log", "--no-walk=unsorted"]
+            select.extend(arg for arg in self.select[1:] if arg.startswith("--pretty=") or arg.startswith("--date="))
+            args = [*select, "--patch", *self.options, *hashes]
+        else:
+            args = [*self.select, "--patch", *self.options]
+        args.extend(["--", *_literal_pathspecs(candidates)])
+        proc = _run(self.run_git, args)
+        if proc.returncode != 0:
+            self.stderr += proc.stderr or ""
+            return
+        text = proc.stdout or ""
+        by_group: dict[int, list[str]] = {}
+        if self.history:
+            group_of = {commit: group for group, commit in enumerate(self.hashes)}
+            for chunk in text.split(_COMMIT_MARK)[1:]:
+                commit, _, body = _split_commit(chunk)
+                if commit in group_of:
+                    by_group[group_of[commit]] = _split_sections(body)
+        else:
+            by_group[0] = _split_sections(text)
+        wanted: dict[int, list[_BudgetFile]] = {}
+        for item in candidates:
+            wanted.setdefault(item.group, []).append(item)
+        for group, items in wanted.items():
+            sections = by_group.get(group, [])
+            # git emits sections in numstat order; anything else means the
+            # pathspec changed what it reports, so those files stay unpatched.
+            if len(sections) != len(items):
+                continue
+            for item, section in zip(sorted(items, key=lambda f: f.index), sections):
+                if self.history and section.endswith("\n\n"):
+                    section = section[:-1]
+                patch = _compact_output(section, self.compact_opts)
+                item.texts["patch"] = patch if patch.endswith("\n") else f"{patch}\n"
+                item.costs["patch"] = self.measure(item.texts["patch"])
+
+    def render(self) -> str:
+        """Render patches in git order, then the demoted files and the budget summary."""
+        parts: list[str] = []
+        group = -1
+        for item in self.files:
+            if self.history and item.group != group:
+                parts.extend(self.headers[group + 1:item.group + 1])
+                group = item.group
+            if item.level == "patch":
+                parts.append(item.texts["patch"])
+        if self.history:
+            parts.extend(self.headers[group + 1:])
+        demoted = [item.texts[item.level] for item in self.files if item.level in {"name", "stat"}]
+        if demoted:
+            parts.append("demoted:\n")
+            parts.extend(demoted)
+        parts.append(self.summary())
+        return "".join(parts)
+
+    def summary(self) -> str:
+        """Return the closing line with the budget and the count of files per level."""
+        counts = {level: 0 for level in LEVELS}
+        for item in self.files:
+            counts[item.level] += 1
+        return _summary_line(self.budget, counts)
+
+    def allocate(self) -> str:
+        """Choose a level per file and return the rendered output that fits the budget."""
+        ranked = sorted(self.files, key=_BudgetFile.rank)
+        remaining = self.budget - sum(self.measure(header) for header in self.headers)
+        # Reserve the demoted heading and the widest summary line: every level with the full file count.
+        widest = _summary_line(self.budget, {level: len(self.files) for level in LEVELS})
+        remaining -= self.measure("demoted:\n") + self.measure(widest)
+
+        # Floor: every file as a stat line if they all fit, else names in rank order.
+        floor = "stat" if sum(item.costs["stat"] for item in ranked) <= remaining else "name"
+        for item in ranked:
+            cost = item.costs[floor]
+            if cost <= remaining:
+                item.level = floor
+                remaining -= cost
+            else:
+                item.level = "omitted"
+
+        # Every changed line costs at least one token, so numstat alone rules
+        # out patches that cannot fit; only the rest are fetched from git.
+        candidates = [
+            item
+            for item in ranked
+            if not item.binary
+            and item.level != "omitted"
+            and item.added + item.deleted <= remaining + item.costs[item.level]
+        ]
+        self.fetch_patches(candidates)
+
+        # Upgrade in rank order: full patch first, then stat lines when the floor was names.
+        for item in ranked:
+            if "patch" in item.costs and item.level != "omitted":
+                delta = item.costs["patch"] - item.costs[item.level]
+                if delta <= remaining:
+                    remaining -= delta
+                    item.level = "patch"
+        if floor == "name":
+            for item in ranked:
+                if item.level == "name":
+                    delta = item.costs["stat"] - item.costs["name"]
+                    if delta <= remaining:
+                        remaining -= delta
+                        item.level = "stat"
+
+        # Token counts of joined parts can differ slightly from the sum of the
+        # parts; demote the lowest-ranked files until the whole output fits.
+        output = self.render()
+        while self.measure(output) > self.budget:
+            target = None
+            for item in reversed(ranked):
+                if item.level != "omitted" and (target is None or LEVELS.index(item.level) > LEVELS.index(target.level)):
+                    target = item
+            if target is None:
+                # Only commit headers and the summary are left, and they alone exceed the budget.
+                raise RuntimeError(
+                    f"router {self.command}: --budget {self.budget} is below the {self.measure(output)} tokens "
+                    "needed for commit headers and the budget summary; raise --budget or select fewer commits"
+                )
+            target.level = LEVELS[LEVELS.index(target.level) - 1]
+            output = self.render()
+        return output
+
+
+def render_budget_output(
+    git_args: list[str],
+    budget: int,
+    run_git: Callable[..., object],
+    compact_opts: dict,
+    config: dict,
+    command: str = "diff",
+) -> int:
+    """Write the budgeted rendering of a `git diff`/`git log --patch` invocation and return git's exit code.
+
+    Raises RuntimeError when the commit headers and summary alone exceed `budget`.
+    """
+    run = _BudgetRun(git_args, budget, run_git, compact_opts, config, command)
+    try:
+        returncode = run.collect()
+        if returncode == 0:
+            sys.stdout.write(run.allocate())
+    finally:
+        if run.stderr:
+            sys.stderr.write(run.stderr)
+    return returncode
@@ -1,12 +1,14 @@
 ﻿"""Compact diff helpers for router output shaping."""
 from __future__ import annotations
 
+import re
+import sys
+from typing import Callable
+
 from app.config.config_loader import _load_compact_profiles, _merge_compact_options
+from app.utils.tokens import count_tokens, estimate_tokens
 
-try:
-    import tiktoken  # type: ignore
-except ModuleNotFoundError:  # pragma: no cover
-    tiktoken = None  # type: ignore
+_HUNK_HEADER_RE = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@.*")
 
 
 def _apply_compact_options(
@@ -42,19 +44,132 @@ def _render_compact_output(
     return output_text
 
 
-def _measure_text(text: str, metric: str, encoding: str) -> int:
-    """Measure text size using characters or tokens."""
+def _measure_text(text: str, metric: str, encoding: str, config: dict | None = None) -> int:
+    """Measure text size using characters or tokens (estimated when tiktoken is unavailable)."""
     metric = (metric or "chars").strip().lower()
     if metric == "tokens":
-        if tiktoken is None:
-            return len(text)
-        enc = tiktoken.get_encoding(encoding or "cl100k_base")
-        return len(enc.encode(text))
+        return count_tokens(text, encoding or "cl100k_base", config)
     return len(text)
 
 
+# Candidates whose estimated scores are this close are compared on exact measurements.
+DEFAULT_TIE_MARGIN = 0.02
+
+
+def _body_line(line: str) -> bool:
+    """Return True for patch body lines that only `prefix_first_only` rewrites."""
+    return line.startswith(("+", "-", " ")) and not line.startswith(("--- ", "+++ "))
+
+
+def _line_class(line: str) -> str:
+    """Classify a non-body diff line for per-class size weights."""
+    if line.startswith("@@ "):
+        return "hunk"
+    if line.startswith(("diff --git ", "--- ", "+++ ")):
+        return "file"
+    return "meta"
+
+
+class _DiffModel:
+    """A diff parsed once for auto-tune size estimates.
+
+    Lines every compact option can rewrite (file/index/hunk headers, mode and
+    rename lines, ...) are kept verbatim; runs of +/-/context body lines are
+    folded into (count, chars, repeated-prefix count, first prefix, last
+    prefix) tuples, which is all `prefix_first_only` needs.
+    """
+
+    __slots__ = ("items", "ends_newline", "class_chars", "class_texts")
+
+    def __init__(self, text: str) -> None:
+        """Split the diff into structural lines and aggregated body runs."""
+        self.items: list = []
+        self.ends_newline = text.endswith("\n")
+        self.class_chars = {"body": 0, "file": 0, "hunk": 0, "meta": 0}
+        self.class_texts: dict[str, list[str]] = {"body": [], "file": [], "hunk": [], "meta": []}
+        run: list = []
+        for line in text.splitlines():
+            if _body_line(line):
+                prefix = line[0]
+                if run:
+                    run[0] += 1
+                    run[1] += len(line)
+                    run[2] += prefix == run[4]
+                    run[4] = prefix
+                else:
+                    run = [1, len(line), 0, prefix, prefix]
+                self.class_texts["body"].append(line)
+                continue
+            if run:
+                self.items.append(tuple(run))
+                run = []
+            self.items.append(line)
+            self.class_texts[_line_class(line)].append(line)
+        if run:
+            self.items.append(tuple(run))
+        for name, lines in self.class_texts.items():
+            self.class_chars[name] = sum(len(line) for line in lines)
+
+    def structural_lines(self) -> list[str]:
+        """Return the verbatim (non-body) lines in order."""
+        return [item for item in self.items if isinstance(item, str)]
+
+    def estimate(self, options: dict, weights: dict[str, float]) -> float:
+        """Estimate the compact output size for `options` without rendering it.
+
+        With every weight at 1.0 the result is exactly the character length of
+        `_compact_output(text, options)`.
+        """
+        lines = self.structural_lines()
+        paths = _collect_diff_paths(lines, options) if _compact_needs_paths(options) else None
+        rules = _CompactRules(options, paths)
+        table = rules.table_lines()
+        total = sum(len(line) for line in table) * weights["file"]
+        count = len(table)
+        newline_weight = weights["meta"]
+        for item in self.items:
+            if isinstance(item, str):
+                compacted = rules.apply(item)
+                if compacted is None:
+                    continue
+                total += len(compacted) * weights[_line_class(item)]
+                count += 1
+                continue
+            run_count, run_chars, repeats, first, last = item
+            if rules.prefix_first_only:
+                run_chars -= repeats + (first == rules.last_prefix)
+                rules.last_prefix = last
+            total += run_chars * weights["body"]
+            count += run_count
+        if count:
+            total += (count - 1 + self.ends_newline) * newline_weight
+        return total
+
+
+def _class_weights(model: _DiffModel, metric: str, encoding: str) -> dict[str, float]:
+    """Return per-class size-per-character weights for the chosen metric.
+
+    Characters weigh 1.0; for tokens each class's estimated tokens-per-char
+    ratio on the original diff applies to its rewritten lines too.
+    """
+    weights = {name: 1.0 for name in model.class_chars}
+    if metric != "tokens":
+        return weights
+    for name, lines in model.class_texts.items():
+        chars = model.class_chars[name]
+        if chars:
+            weights[name] = estimate_tokens("\n".join(lines), encoding) / chars
+    return weights
+
+
 def _auto_tune_compact(text: str, options: dict, config: dict) -> str:
-    """Try optional compact tweaks and keep the smallest result."""
+    """Pick the smallest compact variant from one parse of the diff and render only it.
+
+    Candidates are applied greedily in order (each builds on the current best)
+    and scored with `_DiffModel.estimate`. Estimates are exact for the chars
+    metric; for tokens, candidates within `tie_margin` of the best are rendered
+    and counted (exactly when tiktoken is available) before deciding.
+    """
     if not text:
         return text
     router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
@@ -63,27 +178,47 @@ def _auto_tune_compact(text: str, options: dict, config: dict) -> str:
         return _compact_output(text, options)
     metric = str(auto_cfg.get("metric", "tokens")).strip().lower()
     encoding = str(auto_cfg.get("encoding", "cl100k_base")).strip()
+    tie_margin = float(auto_cfg.get("tie_margin", DEFAULT_TIE_MARGIN))
     candidates = auto_cfg.get("candidates", [])
     if not isinstance(candidates, list):
         raise RuntimeError("router compact_auto_tune candidates must be a list")
     profiles = _load_compact_profiles(config)
 
+    model = _DiffModel(text)
+    weights = _class_weights(model, metric, encoding)
+    estimates_exact = metric != "tokens"
+    # id -> (options, output, exact score); holding the options keeps ids unique.
+    rendered: dict[int, tuple[dict, str, int]] = {}
+
+    def _exact(opts: dict) -> int:
+        """Render and measure one option set (memoized per options object)."""
+        key = id(opts)
+        if key not in rendered:
+            output = _compact_output(text, opts)
+            rendered[key] = (opts, output, _measure_text(output, metric, encoding, config))
+        return rendered[key][2]
+
     best_options = dict(options)
-    best_output = _compact_output(text, best_options)
-    best_score = _measure_text(best_output, metric, encoding)
+    best_score = model.estimate(best_options, weights)
 
     for candidate in candidates:
         if not isinstance(candidate, str) or not candidate.strip():
             continue
         candidate_opts = _parse_compact_spec(candidate.strip(), best_options, profiles)
-        candidate_output = _compact_output(text, candidate_opts)
-        candidate_score = _measure_text(candidate_output, metric, encoding)
+        candidate_score = model.estimate(candidate_opts, weights)
+        if not estimates_exact and abs(candidate_score - best_score) <= tie_margin * max(best_score, 1.0):
+            best_exact = _exact(best_options)
+            candidate_exact = _exact(candidate_opts)
+            if candidate_exact < best_exact:
+                best_options, best_score = candidate_opts, candidate_score
+            continue
         if candidate_score < best_score:
             best_score = candidate_score
-            best_output = candidate_output
             best_options = candidate_opts
 
-    return best_output
+    if id(best_options) in rendered:
+        return rendered[id(best_options)][1]
+    return _compact_output(text, best_options)
 
 
 def _parse_compact_spec(spec: str, defaults: dict, profiles: dict) -> dict:
@@ -197,190 +332,360 @@ def _parse_compact_spec(spec: str, defaults: dict, profiles: dict) -> dict:
     return options
 
 
-def _compact_output(text: str, options: dict) -> str:
-    """Transform a diff into a compact form based on options."""
-    if not text:
-        return text
-    drop_headers = bool(options.get("drop_headers", False))
-    drop_diff_header = bool(options.get("drop_diff_header", False))
-    drop_hunk_header = bool(options.get("drop_hunk_header", False))
-    short_diff_header = bool(options.get("short_diff_header", False))
-    short_hunk_header = bool(options.get("short_hunk_header", False))
-    drop_filemode = bool(options.get("drop_filemode", False))
-    drop_rename = bool(options.get("drop_rename", False))
-    drop_similarity = bool(options.get("drop_similarity", False))
-    drop_binary = bool(options.get("drop_binary", False))
+def _extract_diff_path(diff_line: str, options: dict) -> str:
+    """Extract the file path from a `diff --git` header line."""
+    parts = diff_line.split()
+    if len(parts) < 4:
+        return ""
     path_strip = str(options.get("path_strip", "") or "")
-    path_basename = bool(options.get("path_basename", False))
-    path_table = bool(options.get("path_table", False))
-    path_common_prefix = bool(options.get("path_common_prefix", False))
-    path_prefix_token = str(options.get("path_prefix_token", "...") or "...")
-    hunk_new_only = bool(options.get("hunk_new_only", False))
-    prefix_first_only = bool(options.get("prefix_first_only", False))
+    a_path = parts[2]
+    b_path = parts[3]
+    path = b_path if b_path.startswith("b/") else a_path
+    if path.startswith("a/") or path.startswith("b/"):
+        path = path[2:]
+    if path_strip and path.startswith(path_strip):
+        path = path[len(path_strip) :]
+        if path.startswith("/"):
+            path = path[1:]
+    if bool(options.get("path_basename", False)):
+        path = path.rsplit("/", 1)[-1]
+    return path
 
-    lines = text.splitlines()
-    kept: list[str] = []
-    last_prefix = ""
 
-    path_ids: dict[str, int] = {}
-    path_display: dict[str, str] = {}
+def _compact_needs_paths(options: dict) -> bool:
+    """Return True when compact options need the full path list up front."""
+    return bool(options.get("path_table", False)) or bool(options.get("path_common_prefix", False))
 
-    def _extract_path(diff_line: str) -> str:
-        """Extract the file path from a diff header line."""
-        parts = diff_line.split()
-        if len(parts) < 4:
-            return ""
-        a_path = parts[2]
-        b_path = parts[3]
-        path = b_path if b_path.startswith("b/") else a_path
-        if path.startswith("a/") or path.startswith("b/"):
-            path = path[2:]
-        if path_strip and path.startswith(path_strip):
-            path = path[len(path_strip) :]
-            if path.startswith("/"):
-                path = path[1:]
-        if path_basename:
-            path = path.rsplit("/", 1)[-1]
-        return path
 
-    paths: list[str] = []
+def _collect_diff_paths(lines, options: dict) -> list[str]:
+    """Collect unique diff paths in first-appearance order."""
+    seen: dict[str, None] = {}
     for line in lines:
         if line.startswith("diff --git "):
-            path = _extract_path(line)
-            if path and path not in paths:
-                paths.append(path)
+            path = _extract_diff_path(line, options)
+            if path and path not in seen:
+                seen[path] = None
+    return list(seen)
 
-    def _common_dir_prefix(items: list[str]) -> str:
-        """Find the shared directory prefix across file paths."""
-        if not items:
-            return ""
-        dirs: list[list[str]] = []
-        for item in items:
-            if "/" not in item:
-                return ""
-            parts = item.split("/")[:-1]
-            if not parts:
-                return ""
-            dirs.append(parts)
-        if not dirs:
-            return ""
-        min_len = min(len(parts) for parts in dirs)
-        if min_len == 0:
+
+def _paths_prepass_args(args: list[str]) -> list[str]:
+    """Turn patch-producing git args into a cheap `--name-status` pre-pass."""
+    prepass: list[str] = []
+    replaced = False
+    for arg in args:
+        if arg == "--":
+            if not replaced:
+                prepass.append("--name-status")
+                replaced = True
+            prepass.append(arg)
+            continue
+        if arg in {"--patch", "--stat"}:
+            if not replaced:
+                prepass.append("--name-status")
+                replaced = True
+            continue
+        if arg.startswith("--unified=") or arg == "--no-prefix":
+            continue
+        if arg.startswith("--pretty=format:"):
+            prepass.append("--pretty=format:")
+            continue
+        prepass.append(arg)
+    if not replaced:
+        prepass.append("--name-status")
+    return prepass
+
+
+def _paths_from_name_status(text: str, options: dict, no_prefix: bool) -> list[str]:
+    """Resolve compact paths from `--name-status` output without reading the patch.
+
+    Each entry is turned back into the `diff --git` header git would print for
+    it, so the result matches what `_collect_diff_paths` finds in the patch.
+    """
+    a_prefix, b_prefix = ("", "") if no_prefix else ("a/", "b/")
+
+    def _with_prefix(prefix: str, path: str) -> str:
+        """Prefix a (possibly quoted) path the way diff headers do."""
+        if path.startswith('"'):
+            return f'"{prefix}{path[1:]}'
+        return f"{prefix}{path}"
+
+    headers: list[str] = []
+    for line in text.splitlines():
+        parts = line.split("\t")
+        if len(parts) < 2 or not parts[0]:
+            continue
+        old_path = parts[1]
+        new_path = parts[2] if len(parts) > 2 else parts[1]
+        headers.append(f"diff --git {_with_prefix(a_prefix, old_path)} {_with_prefix(b_prefix, new_path)}")
+    return _collect_diff_paths(headers, options)
+
+
+def _common_dir_prefix(items: list[str]) -> str:
+    """Find the shared directory prefix across file paths."""
+    if not items:
+        return ""
+    dirs: list[list[str]] = []
+    for item in items:
+        if "/" not in item:
             return ""
-        idx = 0
-        while idx < min_len and all(parts[idx] == dirs[0][idx] for parts in dirs):
-            idx += 1
-        if idx == 0:
+        parts = item.split("/")[:-1]
+        if not parts:
             return ""
-        return "/".join(dirs[0][:idx]) + "/"
+        dirs.append(parts)
+    if not dirs:
+        return ""
+    min_len = min(len(parts) for parts in dirs)
+    if min_len == 0:
+        return ""
+    idx = 0
+    while idx < min_len and all(parts[idx] == dirs[0][idx] for parts in dirs):
+        idx += 1
+    if idx == 0:
+        return ""
+    return "/".join(dirs[0][:idx]) + "/"
+
+
+class _CompactRules:
+    """Per-line compaction rules for one option set.
+
+    `apply` maps one diff line to its compact form (None when dropped) and
+    tracks the +/-/context run state that `prefix_first_only` depends on.
+    """
 
-    common_prefix = _common_dir_prefix(paths) if path_common_prefix else ""
+    __slots__ = (
+        "options",
+        "drop_headers",
+        "drop_diff_header",
+        "drop_hunk_header",
+        "short_diff_header",
+        "short_hunk_header",
+        "drop_filemode",
+        "drop_rename",
+        "drop_similarity",
+        "drop_binary",
+        "path_table",
+        "path_prefix_token",
+        "hunk_new_only",
+        "prefix_first_only",
+        "common_prefix",
+        "path_ids",
+        "path_display",
+        "last_prefix",
+    )
 
-    def _apply_common_prefix(path: str) -> str:
+    def __init__(self, options: dict, paths: list[str] | None) -> None:
+        """Read option flags and build the path table / common prefix."""
+        self.options = options
+        self.drop_headers = bool(options.get("drop_headers", False))
+        self.drop_diff_header = bool(options.get("drop_diff_header", False))
+        self.drop_hunk_header = bool(options.get("drop_hunk_header", False))
+        self.short_diff_header = bool(options.get("short_diff_header", False))
+        self.short_hunk_header = bool(options.get("short_hunk_header", False))
+        self.drop_filemode = bool(options.get("drop_filemode", False))
+        self.drop_rename = bool(options.get("drop_rename", False))
+        self.drop_similarity = bool(options.get("drop_similarity", False))
+        self.drop_binary = bool(options.get("drop_binary", False))
+        self.path_table = bool(options.get("path_table", False))
+        self.path_prefix_token = str(options.get("path_prefix_token", "...") or "...")
+        self.hunk_new_only = bool(options.get("hunk_new_only", False))
+        self.prefix_first_only = bool(options.get("prefix_first_only", False))
+        paths = paths or []
+        path_common_prefix = bool(options.get("path_common_prefix", False))
+        self.common_prefix = _common_dir_prefix(paths) if path_common_prefix else ""
+        self.path_ids: dict[str, int] = {}
+        self.path_display: dict[str, str] = {}
+        self.last_prefix = ""
+        if self.path_table:
+            for path in paths:
+                self.path_ids[path] = len(self.path_ids) + 1
+                self.path_display[path] = self._apply_common_prefix(path)
+
+    def _apply_common_prefix(self, path: str) -> str:
         """Apply the common prefix token to shorten a path."""
+        common_prefix = self.common_prefix
         if common_prefix and path.startswith(common_prefix):
             trimmed = path[len(common_prefix) :].lstrip("/")
             if trimmed:
-                return f"{path_prefix_token}/{trimmed}"
-            return path_prefix_token
+                return f"{self.path_prefix_token}/{trimmed}"
+            return self.path_prefix_token
         return path
 
-    if path_table and paths:
-        for path in paths:
-            path_ids[path] = len(path_ids) + 1
-            path_display[path] = _apply_common_prefix(path)
-        kept.append(f"files[{len(path_ids)}]{{id,path}}:")
-        for path, idx in path_ids.items():
-            kept.append(f"  {idx},{path_display.get(path, path)}")
-    for line in lines:
-        if drop_headers:
+    def table_lines(self) -> list[str]:
+        """Return the leading path table lines (empty unless path_table is on)."""
+        if not self.path_ids:
+            return []
+        lines = [f"files[{len(self.path_ids)}]{{id,path}}:"]
+        for path, idx in self.path_ids.items():
+            lines.append(f"  {idx},{self.path_display.get(path, path)}")
+        return lines
+
+    def apply(self, line: str) -> str | None:
+        """Return the compact form of one diff line, or None when it is dropped."""
+        if self.drop_headers:
             if line.startswith("index "):
-                continue
+                return None
             if line.startswith("--- "):
-                continue
+                return None
             if line.startswith("+++ "):
-                continue
-        if drop_filemode:
+                return None
+        if self.drop_filemode:
             if line.startswith("new file mode "):
-                continue
+                return None
             if line.startswith("deleted file mode "):
-                continue
-        if drop_similarity:
+                return None
+        if self.drop_similarity:
             if line.startswith("similarity index "):
-                continue
+                return None
             if line.startswith("dissimilarity index "):
-                continue
-        if drop_rename:
+                return None
+        if self.drop_rename:
             if line.startswith("rename from "):
-                continue
+                return None
             if line.startswith("rename to "):
-                continue
+                return None
             if line.startswith("copy from "):
-                continue
+                return None
             if line.startswith("copy to "):
-                continue
-        if drop_binary:
+                return None
+        if self.drop_binary:
             if line.startswith("Binary files "):
-                continue
+                return None
             if line.startswith("GIT binary patch"):
-                continue
+                return None
         if line.startswith("diff --git "):
-            if drop_diff_header:
-                continue
-            if short_diff_header:
-                path = _extract_path(line)
-                if path_table and path in path_ids:
-                    kept.append(f"f {path_ids[path]}")
-                    last_prefix = ""
-                    continue
+            if self.drop_diff_header:
+                return None
+            if self.short_diff_header:
+                path = _extract_diff_path(line, self.options)
+                if self.path_table and path in self.path_ids:
+                    self.last_prefix = ""
+                    return f"f {self.path_ids[path]}"
                 if path:
-                    kept.append(f"f {_apply_common_prefix(path)}".rstrip())
-                    last_prefix = ""
-                    continue
+                    self.last_prefix = ""
+                    return f"f {self._apply_common_prefix(path)}".rstrip()
         if line.startswith("@@ "):
-            if short_hunk_header:
-                import re
-
-                match = re.match(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@.*", line)
+            if self.short_hunk_header:
+                match = _HUNK_HEADER_RE.match(line)
                 if match:
                     old_start = match.group(1)
                     old_len = match.group(2) or "1"
                     new_start = match.group(3)
                     new_len = match.group(4) or "1"
-                    if hunk_new_only:
-                        kept.append(f"@ {new_start}")
-                    else:
-                        kept.append(f"@ {old_start},{old_len} {new_start},{new_len}")
-                    last_prefix = ""
-                    continue
-            if drop_hunk_header:
-                last_prefix = ""
-                continue
-        if prefix_first_only:
+                    self.last_prefix = ""
+                    if self.hunk_new_only:
+                        return f"@ {new_start}"
+                    return f"@ {old_start},{old_len} {new_start},{new_len}"
+            if self.drop_hunk_header:
+                self.last_prefix = ""
+                return None
+        if self.prefix_first_only:
             if line.startswith(("+", "-", " ")):
                 prefix = line[0]
-                body = line[1:]
-                if prefix == last_prefix:
-                    kept.append(body)
-                else:
-                    kept.append(line)
-                last_prefix = prefix
-                continue
-            last_prefix = ""
-        if path_table and line.startswith(("--- ", "+++ ")):
-            if line.startswith("--- "):
-                prefix = "--- "
-                path = line[len(prefix):]
-            else:
-                prefix = "+++ "
-                path = line[len(prefix):]
+                same = prefix == self.last_prefix
+                self.last_prefix = prefix
+                return line[1:] if same else line
+            self.last_prefix = ""
+        if self.path_table and line.startswith(("--- ", "+++ ")):
+            prefix = line[:4]
+            path = line[4:]
             if path.startswith("a/") or path.startswith("b/"):
                 path = path[2:]
-            path = _apply_common_prefix(path)
-            if path in path_ids:
-                kept.append(prefix + f"{path_ids[path]}")
-                continue
-        kept.append(line)
+            path = self._apply_common_prefix(path)
+            if path in self.path_ids:
+                return prefix + f"{self.path_ids[path]}"
+        return line
 
+
+def _iter_compact_lines(lines, options: dict, paths: list[str] | None):
+    """Yield compacted lines for an iterable of diff lines.
+
+    `paths` is the full path list (needed by path tables and common-prefix
+    shortening); pass None when the options do not need it.
+    """
+    rules = _CompactRules(options, paths)
+    yield from rules.table_lines()
+    apply = rules.apply
+    for line in lines:
+        compacted = apply(line)
+        if compacted is not None:
+            yield compacted
+
+
+def _compact_output(text: str, options: dict) -> str:
+    """Transform a diff into a compact form based on options."""
+    if not text:
+        return text
+    lines = text.splitlines()
+    paths = _collect_diff_paths(lines, options) if _compact_needs_paths(options) else None
+    kept = _iter_compact_lines(lines, options, paths)
     return "\n".join(kept) + ("\n" if text.endswith("\n") else "")
 
+
+def _stream_requested(stream_flag: bool | None, compact_enabled: bool, config: dict) -> bool:
+    """Return True when output should be streamed from git line by line."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    stream = bool(router_cfg.get("stream_output", False)) if stream_flag is None else stream_flag
+    if not stream or not compact_enabled:
+        return stream
+    auto_cfg = router_cfg.get("compact_auto_tune", {})
+    # Auto-tune compares whole candidate outputs, so it needs the buffered text.
+    return not (isinstance(auto_cfg, dict) and auto_cfg.get("enabled", False))
+
+
+def _write_compact_stream(chunks, compact_enabled: bool, options: dict, paths: list[str] | None, out) -> None:
+    """Compact newline-terminated chunks as they arrive and write them to `out`.
+
+    Produces exactly what `_compact_output` returns for the joined chunks while
+    holding only the current line in memory.
+    """
+    if not compact_enabled:
+        for chunk in chunks:
+            out.write(chunk)
+        return
+    state = {"ends_newline": False}
+
+    def _lines():
+        """Split each chunk the way str.splitlines splits the whole text."""
+        for chunk in chunks:
+            if chunk:
+                state["ends_newline"] = chunk.endswith("\n")
+            yield from chunk.splitlines()
+
+    started = False
+    for line in _iter_compact_lines(_lines(), options, paths):
+        out.write(f"\n{line}" if started else line)
+        started = True
+    if state["ends_newline"]:
+        out.write("\n")
+
+
+def _stream_compact_output(
+    git_args: list[str],
+    stream_git: Callable[..., object],
+    run_git: Callable[..., object],
+    compact_enabled: bool,
+    include_patch: bool,
+    options: dict,
+    no_prefix: bool,
+    error_message: str,
+) -> int:
+    """Stream git output through the compactor and return git's exit code."""
+    if compact_enabled and not include_patch:
+        raise RuntimeError(error_message)
+    paths = None
+    if compact_enabled and _compact_needs_paths(options):
+        prepass = run_git(
+            _paths_prepass_args(git_args),
+            check=False,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        paths = _paths_from_name_status(prepass.stdout or "", options, no_prefix)
+    with stream_git(git_args) as stream:
+        _write_compact_stream(stream, compact_enabled, options, paths, sys.stdout)
+        returncode = stream.wait()
+    if stream.stderr:
+        sys.stderr.write(stream.stderr)
+    return returncode
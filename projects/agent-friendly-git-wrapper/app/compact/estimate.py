@@ -0,0 +1,278 @@
+"""Pre-flight output size estimates from --numstat and the router.max_output_tokens guard."""
+from __future__ import annotations
+
+import sys
+from typing import Callable
+
+from app.compact.budget import _COMMIT_MARK, _parse_numstat_z, _split_args, _split_commit
+from app.utils.tokens import count_tokens
+
+# Patch size model, fitted on the text file sections of the
+# benchmark_history_compaction unified outputs and pooled with this repo's
+# own history. Per-line bytes vary by codebase, so whole-query predictions are
+# typically within about 35% before the sample correction below.
+_HEADER_BYTES = 78.2
+_HEADER_BYTES_PER_PATH_CHAR = 3.55
+_CHANGED_LINE_BYTES = 56.0
+_CONTEXT_LINE_BYTES = 36.8
+_HUNK_HEADER_BYTES = 50.7
+_HUNKS_SCALE = 1.03
+_HUNKS_EXPONENT = 0.39
+# Exact cl100k_base and o200k_base counts on the same outputs.
+_BYTES_PER_TOKEN = 3.92
+_DEFAULT_CONTEXT = 3
+# A few mid-sized files are diffed for real to rescale the model to the repo at
+# hand; the correction is clamped so one odd file cannot swing it too far.
+_SAMPLE_FILES = 4
+_SAMPLE_LINES = 200
+_SAMPLE_CLAMP = (0.25, 4.0)
+
+_DETAIL_FLAGS = {"--patch", "--stat", "--name-status", "--name-only", "--shortstat"}
+DOWNGRADE_MODES = ("stat", "name-status")
+
+
+class SizeEstimate:
+    """Predicted sizes for the patch, stat and name-status renderings of one query."""
+
+    __slots__ = ("commits", "files", "added", "deleted", "patch_bytes", "patch_tokens", "stat_tokens", "name_status_tokens")
+
+    def __init__(self) -> None:
+        """Start with an empty estimate."""
+        self.commits = 0
+        self.files = 0
+        self.added = 0
+        self.deleted = 0
+        self.patch_bytes = 0
+        self.patch_tokens = 0
+        self.stat_tokens = 0
+        self.name_status_tokens = 0
+
+    def tokens(self, mode: str) -> int:
+        """Return the predicted token count for `patch`, `stat` or `name-status` output."""
+        if mode == "stat":
+            return self.stat_tokens
+        if mode == "name-status":
+            return self.name_status_tokens
+        return self.patch_tokens
+
+
+def _max_output_tokens(config: dict) -> int | None:
+    """Return router.max_output_tokens, or None when the guard is off."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    limit = router_cfg.get("max_output_tokens")
+    if limit in (None, "", 0):
+        return None
+    return int(limit)
+
+
+def _max_output_action(config: dict) -> str:
+    """Return router.max_output_action (`downgrade` or `refuse`)."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    action = str(router_cfg.get("max_output_action", "downgrade")).strip().lower()
+    if action not in {"downgrade", "refuse"}:
+        raise RuntimeError("router: max_output_action must be downgrade|refuse")
+    return action
+
+
+def _context_lines(git_args: list[str]) -> int:
+    """Return the unified context from the args (git's default when unset)."""
+    for arg in git_args:
+        if arg.startswith("--unified="):
+            return int(arg.split("=", 1)[1])
+    return _DEFAULT_CONTEXT
+
+
+def _numstat_args(git_args: list[str]) -> list[str]:
+    """Turn any diff/log invocation into its `--numstat -z` pre-flight query."""
+    sep_at = git_args.index("--") if "--" in git_args else len(git_args)
+    head: list[str] = []
+    for arg in git_args[:sep_at]:
+        # `--unified` implies `--patch`, so it is dropped along with the detail flags.
+        if arg in _DETAIL_FLAGS or arg.startswith("--unified="):
+            continue
+        if arg.startswith("--pretty=format:"):
+            arg = f"--pretty=format:%x1e%H%x1f{arg[len('--pretty=format:'):]}"
+        head.append(arg)
+    return [*head, "--numstat", "-z", *git_args[sep_at:]]
+
+
+def _patch_file_bytes(path: str, changed: int, context: int, compact_headers: bool) -> float:
+    """Predict the bytes of one file's patch section from its numstat line."""
+    if compact_headers:
+        # Compact output keeps only the `diff --git` line (no index/---/+++ lines).
+        header = 12 + 2 * len(path) + 2
+    else:
+        header = _HEADER_BYTES + _HEADER_BYTES_PER_PATH_CHAR * len(path)
+    if changed == 0:
+        return header
+    hunks = min(changed, max(1.0, _HUNKS_SCALE * changed**_HUNKS_EXPONENT))
+    return header + _CHANGED_LINE_BYTES * changed + hunks * (_HUNK_HEADER_BYTES + 2 * context * _CONTEXT_LINE_BYTES)
+
+
+def _literal_paths(paths: list[str]) -> list[str]:
+    """Return `:(literal)` pathspecs for repo-relative paths."""
+    return [f":(literal){path}" for path in dict.fromkeys(paths)]
+
+
+def _sample_ratio(git_args: list[str], entries: list[tuple[str, str, str, int, float]], run_git: Callable[..., object]) -> float:
+    """Diff a small sample of files for real and return measured / predicted bytes.
+
+    `entries` holds (commit, path, old_path, changed lines, predicted bytes) per
+    file; returns 1.0 when there is no patch to sample or the sample fails.
+    """
+    if "--patch" not in git_args:
+        return 1.0
+    picked: list[tuple[str, str, str, int, float]] = []
+    lines = 0
+    for entry in sorted(entries, key=lambda item: -item[3]):
+        if len(picked) >= _SAMPLE_FILES:
+            break
+        if 0 < entry[3] and lines + entry[3] <= _SAMPLE_LINES:
+            picked.append(entry)
+            lines += entry[3]
+    if not picked:
+        return 1.0
+    select, options, _ = _split_args(git_args)
+    commits = [commit for commit in dict.fromkeys(entry[0] for entry in picked) if commit]
+    if commits:
+        args = ["log", "--no-walk=unsorted", "--pretty=format:", "--patch", *options, *commits]
+    else:
+        args = [*select, "--patch", *options]
+    paths = [path for entry in picked for path in (entry[1], entry[2]) if path]
+    args.extend(["--", *_literal_paths(paths)])
+    proc = run_git(args, check=False, capture_output=True, text=True, encoding="utf-8", errors="replace")
+    if proc.returncode != 0 or not proc.stdout:
+        return 1.0
+    # Every file the sample pathspecs select in the sampled commits is in the output.
+    wanted = set(paths)
+    predicted = sum(
+        entry[4]
+        for entry in entries
+        if (not commits or entry[0] in commits) and (entry[1] in wanted or entry[2] in wanted)
+    )
+    if predicted <= 0:
+        return 1.0
+    low, high = _SAMPLE_CLAMP
+    return min(high, max(low, len(proc.stdout.encode("utf-8")) / predicted))
+
+
+def estimate_output(
+    git_args: list[str],
+    run_git: Callable[..., object],
+    config: dict,
+    compact_headers: bool = False,
+) -> SizeEstimate:
+    """Predict output sizes for `git_args` from a `--numstat` query and a small patch sample."""
+    args = _numstat_args(git_args)
+    proc = run_git(args, check=False, capture_output=True, text=True, encoding="utf-8", errors="replace")
+    if proc.returncode != 0:
+        raise RuntimeError((proc.stderr or "").strip() or f"git {' '.join(args)} failed")
+    text = proc.stdout or ""
+    history = args[0] == "log"
+    context = _context_lines(git_args)
+    result = SizeEstimate()
+    stat_lines: list[str] = []
+    name_lines: list[str] = []
+    meta_bytes = 0
+    entries: list[tuple[str, str, str, int, float]] = []
+    file_bytes = 0.0
+    chunks = text.split(_COMMIT_MARK)[1:] if history else [text]
+    for chunk in chunks:
+        body = chunk
+        commit = ""
+        if history:
+            commit, header, body = _split_commit(chunk)
+            result.commits += 1
+            if header:
+                # Commit lines appear in every rendering, followed by a blank separator line.
+                meta_bytes += len(header) + 2
+                stat_lines.append(header)
+                name_lines.append(header)
+        for added, deleted, path, old_path in _parse_numstat_z(body):
+            result.files += 1
+            binary = added == "-" or deleted == "-"
+            changed = 0
+            if not binary:
+                result.added += int(added)
+                result.deleted += int(deleted)
+                changed = int(added) + int(deleted)
+            file_bytes += _patch_file_bytes(path, changed, context, compact_headers)
+            entries.append((commit, path, old_path, changed, _patch_file_bytes(path, changed, context, False)))
+            label = f"{old_path} => {path}" if old_path else path
+            graph = "Bin" if binary else f"{changed} {'+' * min(int(added), 40)}{'-' * min(int(deleted), 40)}"
+            stat_lines.append(f" {label} | {graph}")
+            name_lines.append(f"{'R' if old_path else 'M'}\t{label}")
+    result.patch_bytes = round(file_bytes * _sample_ratio(git_args, entries, run_git)) + meta_bytes
+    result.patch_tokens = round(result.patch_bytes / _BYTES_PER_TOKEN)
+    # Stat and name-status text is cheap to synthesize, so it is counted directly.
+    stat_lines.append(f" {result.files} files changed, {result.added} insertions(+), {result.deleted} deletions(-)")
+    result.stat_tokens = count_tokens("\n".join(stat_lines) + "\n", config=config)
+    result.name_status_tokens = count_tokens("\n".join(name_lines) + "\n", config=config) if name_lines else 0
+    return result
+
+
+def print_estimate(
+    git_args: list[str],
+    run_git: Callable[..., object],
+    config: dict,
+    compact_headers: bool = False,
+) -> int:
+    """Write the pre-flight estimate for `git_args` and what the output guard would do."""
+    estimate = estimate_output(git_args, run_git, config, compact_headers)
+    summary = f"estimate: {estimate.files} files, +{estimate.added} -{estimate.deleted}"
+    if estimate.commits:
+        summary += f", {estimate.commits} commits"
+    sys.stdout.write(f"{summary}\n")
+    sys.stdout.write(f"patch: ~{estimate.patch_bytes} bytes, ~{estimate.patch_tokens} tokens\n")
+    sys.stdout.write(f"stat: ~{estimate.stat_tokens} tokens\n")
+    sys.stdout.write(f"name-status: ~{estimate.name_status_tokens} tokens\n")
+    limit = _max_output_tokens(config)
+    if limit is not None:
+        mode = next((m for m in ("patch", *DOWNGRADE_MODES) if estimate.tokens(m) <= limit), "refuse")
+        if _max_output_action(config) == "refuse" and mode != "patch":
+            mode = "refuse"
+        sys.stdout.write(f"max_output_tokens: {limit} -> {mode}\n")
+    return 0
+
+
+def guard_patch_output(
+    git_args: list[str],
+    run_git: Callable[..., object],
+    config: dict,
+    command: str,
+    compact_headers: bool = False,
+) -> str:
+    """Check a patch request against router.max_output_tokens before running it.
+
+    Returns `patch` when it fits (or no limit is set), otherwise the detail mode
+    to step down to after writing a notice to stderr. Raises when the action is
+    `refuse` or even name-status output would not fit.
+    """
+    limit = _max_output_tokens(config)
+    if limit is None:
+        return "patch"
+    estimate = estimate_output(git_args, run_git, config, compact_headers)
+    if estimate.patch_tokens <= limit:
+        return "patch"
+    over = f"predicted ~{estimate.patch_tokens} tokens of patch output exceeds router.max_output_tokens ({limit})"
+    if _max_output_action(config) == "refuse":
+        raise RuntimeError(f"router {command}: {over}; narrow the paths, use --stat, or use --budget")
+    for mode in DOWNGRADE_MODES:
+        if estimate.tokens(mode) <= limit:
+            sys.stderr.write(f"router {command}: {over}; showing --{mode} instead (~{estimate.tokens(mode)} tokens)\n")
+            return mode
+    raise RuntimeError(f"router {command}: {over}, and --name-status would not fit either; narrow the paths")
+
+
+def downgrade_args(git_args: list[str], mode: str) -> list[str]:
+    """Replace patch output in `git_args` with `--stat` or `--name-status`."""
+    sep_at = git_args.index("--") if "--" in git_args else len(git_args)
+    args: list[str] = []
+    for arg in git_args[:sep_at]:
+        if arg == "--patch":
+            args.append(f"--{mode}")
+            continue
+        if arg == "--stat" or arg == "--no-prefix" or arg.startswith("--unified="):
+            continue
+        args.append(arg)
+    return [*args, *git_args[sep_at:]]
@@ -0,0 +1,187 @@
+"""Structured `router history`: per-commit records parsed from a NUL-delimited log."""
+from __future__ import annotations
+
+import json
+import sys
+from typing import Callable
+
+from app.compact.budget import DEFAULT_ENCODING, _budget_cfg
+from app.compact.compact import _CompactRules, _extract_diff_path
+from app.utils.tokens import count_tokens_batch
+
+# Every record starts with a NUL and carries these fields, each closed by a NUL;
+# git writes the commit's patch (or stat/name lines) after the last one. NUL is
+# the one byte text patches cannot contain (git shows such files as binary).
+RECORD_MARK = b"\0"
+RECORD_FIELDS = ("oid", "short", "subject", "author", "date")
+RECORD_FORMAT = "--pretty=format:%x00%H%x00%h%x00%s%x00%an%x00%ad%x00"
+OUTPUT_FORMATS = ("text", "json", "toon")
+
+
+class CommitRecord:
+    """One commit: its meta fields and the byte span of its body in the log output."""
+
+    __slots__ = ("oid", "short", "subject", "author", "date", "start", "end")
+
+    def __init__(self, oid: str, short: str, subject: str, author: str, date: str, start: int, end: int) -> None:
+        """Store the meta fields and body offsets (`start`..`end` in the raw output bytes)."""
+        self.oid = oid
+        self.short = short
+        self.subject = subject
+        self.author = author
+        self.date = date
+        self.start = start
+        self.end = end
+
+
+def record_log_args(log_args: list[str]) -> list[str]:
+    """Rewrite a history `git log` invocation to emit NUL-delimited commit records."""
+    sep_at = log_args.index("--") if "--" in log_args else len(log_args)
+    head = [arg for arg in log_args[:sep_at] if not arg.startswith(("--pretty=", "--date="))]
+    return [*head, RECORD_FORMAT, "--date=short", *log_args[sep_at:]]
+
+
+def parse_records(data: bytes) -> list[CommitRecord]:
+    """Split NUL-delimited `git log` output into CommitRecords without copying bodies."""
+    records: list[CommitRecord] = []
+    pos = data.find(RECORD_MARK)
+    while pos != -1:
+        fields: list[str] = []
+        cursor = pos + 1
+        for _ in RECORD_FIELDS:
+            mark = data.find(RECORD_MARK, cursor)
+            if mark == -1:
+                raise RuntimeError("router history: malformed record output from git")
+            fields.append(data[cursor:mark].decode("utf-8", "replace"))
+            cursor = mark + 1
+        following = data.find(RECORD_MARK, cursor)
+        end = len(data) if following == -1 else following
+        # The body starts after the header's newline; trailing newlines separate commits.
+        start = cursor + 1 if data[cursor : cursor + 1] == b"\n" else cursor
+        stop = end
+        while stop > start and data[stop - 1] == 0x0A:
+            stop -= 1
+        records.append(CommitRecord(*fields, start, stop))
+        pos = following
+    return records
+
+
+def _body_sections(body: str, compact_opts: dict | None) -> list[tuple[str, str]]:
+    """Split one commit body into (path, text) file sections, compacting each line.
+
+    Lines before the first `diff --git` (stat or name output) form one section
+    with an empty path. Path tables and common prefixes are off: every commit
+    stands on its own.
+    """
+    rules = None
+    if compact_opts is not None:
+        rules = _CompactRules({**compact_opts, "path_table": False, "path_common_prefix": False}, None)
+    sections: list[tuple[str, list[str]]] = []
+    # Split on newlines only: str.splitlines() would also break lines at control bytes in patch text.
+    lines = body.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    for line in lines:
+        if line.startswith("diff --git ") or not sections:
+            path = _extract_diff_path(line, {}) if line.startswith("diff --git ") else ""
+            sections.append((path, []))
+        if rules is not None:
+            compacted = rules.apply(line)
+            if compacted is None:
+                continue
+            line = compacted
+        sections[-1][1].append(line)
+    return [(path, "".join(f"{line}\n" for line in lines)) for path, lines in sections]
+
+
+def _cap_sections(
+    sections: list[tuple[str, str]],
+    max_tokens: int,
+    encoding: str,
+    config: dict,
+) -> tuple[str, list[str]]:
+    """Keep whole file sections, in git order, while they fit `max_tokens`.
+
+    Returns the kept text and the paths of the sections that did not fit.
+    """
+    kept: list[str] = []
+    omitted: list[str] = []
+    used = 0
+    for (path, text), cost in zip(sections, count_tokens_batch([text for _, text in sections], encoding, config)):
+        if used + cost <= max_tokens:
+            kept.append(text)
+            used += cost
+        else:
+            omitted.append(path or "(summary)")
+    return "".join(kept), omitted
+
+
+def _toon_string(value: str) -> str:
+    """Return a quoted TOON-safe scalar string."""
+    return json.dumps(str(value), ensure_ascii=False)
+
+
+def render_records(
+    log_args: list[str],
+    run_git: Callable[..., object],
+    output_format: str,
+    meta: list[str],
+    compact_opts: dict | None,
+    max_tokens: int | None,
+    config: dict,
+) -> int:
+    """Render history as per-commit records in text, JSON Lines or TOON.
+
+    `meta` lists the commit fields to show (`hash`, `short`, `subject`,
+    `author`, `date`). Each commit's body is compacted on its own and, with
+    `max_tokens`, trimmed to the file sections that fit; the trimmed paths
+    are reported per commit.
+    """
+    proc = run_git(record_log_args(log_args), check=False, capture_output=True)
+    if proc.stderr:
+        sys.stderr.write(proc.stderr.decode("utf-8", "replace"))
+    data = proc.stdout or b""
+    encoding = str(_budget_cfg(config).get("encoding", DEFAULT_ENCODING))
+    texts: list[str] = []
+    toon_items: list[str] = []
+    for record in parse_records(data):
+        body = data[record.start : record.end].decode("utf-8", "replace")
+        body = f"{body}\n" if body else ""
+        omitted: list[str] = []
+        if body and (compact_opts is not None or max_tokens is not None):
+            sections = _body_sections(body, compact_opts)
+            if max_tokens is None:
+                body = "".join(text for _, text in sections)
+            else:
+                body, omitted = _cap_sections(sections, max_tokens, encoding, config)
+        if output_format == "text":
+            header = " ".join(record.oid if field == "hash" else getattr(record, field) for field in meta)
+            if omitted:
+                body += f"omitted: {len(omitted)} files over --per-commit-max-tokens {max_tokens}: {', '.join(omitted)}\n"
+            # Like git, an empty header adds no line of its own.
+            texts.append(f"{header}\n{body}" if header and body else header or body)
+            continue
+        item: dict[str, object] = {"oid": record.oid}
+        for field in meta:
+            if field not in {"hash", "short"}:
+                item[field] = getattr(record, field)
+        item["body"] = body
+        if omitted:
+            item["omitted"] = omitted
+        if output_format == "json":
+            texts.append(json.dumps(item, ensure_ascii=False))
+            continue
+        lines = [f"  - oid: {_toon_string(record.oid)}"]
+        for key, value in list(item.items())[1:]:
+            if isinstance(value, list):
+                lines.append(f"    {key}[{len(value)}]: {','.join(_toon_string(entry) for entry in value)}")
+            else:
+                lines.append(f"    {key}: {_toon_string(value)}")
+        toon_items.append("\n".join(lines))
+    if output_format == "json":
+        sys.stdout.write("".join(f"{text}\n" for text in texts))
+    elif output_format == "toon":
+        sys.stdout.write("\n".join([f"commits[{len(toon_items)}]:", *toon_items]) + "\n")
+    else:
+        sys.stdout.write("\n".join(texts))
+    return proc.returncode
@@ -0,0 +1,209 @@
+"""Sharded `router history`: commit chunks rendered in parallel and stitched back in order."""
+from __future__ import annotations
+
+import os
+import sys
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+from app.compact.compact import _CompactRules, _compact_needs_paths, _paths_from_name_status, _paths_prepass_args
+
+DEFAULT_MIN_COMMITS = 64
+# More chunks than workers keeps every worker busy when commit sizes are uneven.
+CHUNKS_PER_WORKER = 4
+
+
+def _shard_cfg(config: dict) -> dict:
+    """Return the router.history_shards config section."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    shard_cfg = router_cfg.get("history_shards", {})
+    return shard_cfg if isinstance(shard_cfg, dict) else {}
+
+
+def shard_workers(config: dict, jobs: int | None = None) -> int:
+    """Return the worker count: `--jobs`, else router.history_shards.workers (0 means one per CPU)."""
+    if jobs is None:
+        try:
+            jobs = int(_shard_cfg(config).get("workers", 0) or 0)
+        except (TypeError, ValueError):
+            raise RuntimeError("router.history_shards.workers must be an integer")
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return jobs
+
+
+def _min_commits(config: dict) -> int:
+    """Return router.history_shards.min_commits."""
+    try:
+        return int(_shard_cfg(config).get("min_commits", DEFAULT_MIN_COMMITS))
+    except (TypeError, ValueError):
+        raise RuntimeError("router.history_shards.min_commits must be an integer")
+
+
+def _split_chunks(oids: list[str], count: int) -> list[list[str]]:
+    """Split oids into `count` contiguous, near-equal chunks (order preserved)."""
+    count = max(1, min(count, len(oids)))
+    size, extra = divmod(len(oids), count)
+    chunks: list[list[str]] = []
+    start = 0
+    for idx in range(count):
+        end = start + size + (1 if idx < extra else 0)
+        chunks.append(oids[start:end])
+        start = end
+    return chunks
+
+
+def _compact_chunk(text: str, options: dict, paths: list[str] | None, first: bool) -> tuple[str, int]:
+    """Compact one chunk of `git log --patch` output; returns (joined lines, line count).
+
+    Runs in a worker process. Only the first chunk carries the path table, so
+    the stitched lines equal what `_compact_output` yields for the whole log.
+    """
+    rules = _CompactRules(options, paths)
+    kept: list[str] = rules.table_lines() if first else []
+    apply = rules.apply
+    for line in text.splitlines():
+        compacted = apply(line)
+        if compacted is not None:
+            kept.append(compacted)
+    return "\n".join(kept), len(kept)
+
+
+def _stitch_safe(options: list[str], compact_enabled: bool, compact_opts: dict, config: dict) -> bool:
+    """Return True when per-chunk compaction provably matches compacting the whole log."""
+    if not compact_enabled:
+        return True
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    auto_cfg = router_cfg.get("compact_auto_tune", {})
+    if isinstance(auto_cfg, dict) and auto_cfg.get("enabled", False):
+        # Auto-tune picks options from the whole output.
+        return False
+    if not compact_opts.get("prefix_first_only", False):
+        return True
+    # prefix_first_only carries +/- state from line to line; a chunk's first line
+    # only starts fresh when it is a hash (or empty) commit line.
+    fmt = next((arg[len("--pretty=format:"):] for arg in options if arg.startswith("--pretty=format:")), "")
+    return not fmt or fmt.startswith(("%h", "%H"))
+
+
+def _noop() -> None:
+    """Warm-up task that makes the pool start its workers."""
+
+
+def _process_pool(workers: int) -> Executor | None:
+    """Start a process pool for compaction, or return None where one cannot be created."""
+    try:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        # Fork the workers now, before any git threads exist in this process.
+        pool.submit(_noop).result()
+    except (OSError, NotImplementedError, ImportError):
+        return None
+    return pool
+
+
+def render_sharded_history(
+    log_args: list[str],
+    rev_args: list[str],
+    run_git: Callable[..., object],
+    compact_enabled: bool,
+    compact_opts: dict,
+    no_prefix: bool,
+    config: dict,
+    jobs: int | None = None,
+) -> int | None:
+    """Render `git log --patch` as parallel per-chunk logs; None when sharding does not apply.
+
+    `log_args` is `["log", *rev_args, ...]`. Commit oids come from one
+    `git log --format=%H` over the same selection, each contiguous chunk is rendered by
+    `git log --no-walk=unsorted` (git runs concurrently) and compacted in a
+    process pool, and the results are written in order. git separates commits
+    with one newline, so the stitched text is byte-identical to the single log.
+    """
+    workers = shard_workers(config, jobs)
+    if workers < 2 or log_args[1:1 + len(rev_args)] != rev_args:
+        return None
+    rest = log_args[1 + len(rev_args):]
+    sep_at = rest.index("--") if "--" in rest else len(rest)
+    options, pathspecs = rest[:sep_at], rest[sep_at:]
+    if not _stitch_safe(options, compact_enabled, compact_opts, config):
+        return None
+    filters = [arg for arg in options if arg.startswith("--diff-filter=")]
+    # `git log --format=%H` rather than rev-list: only log accepts --diff-filter.
+    listing = run_git(
+        ["log", "--format=%H", *rev_args, *filters, *pathspecs],
+        check=False,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    if listing.returncode != 0:
+        # Let the single log report the error.
+        return None
+    oids = (listing.stdout or "").split()
+    if len(oids) < max(2, _min_commits(config)):
+        return None
+
+    paths = None
+    if compact_enabled and _compact_needs_paths(compact_opts):
+        prepass = run_git(
+            _paths_prepass_args(log_args),
+            check=False,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        paths = _paths_from_name_status(prepass.stdout or "", compact_opts, no_prefix)
+    pool = _process_pool(workers) if compact_enabled else None
+
+    def _log(chunk: list[str]):
+        """Run git log for one chunk of commits."""
+        return run_git(
+            ["log", "--no-walk=unsorted", *options, *chunk, *pathspecs],
+            check=False,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+
+    returncode = 0
+    # Per chunk: the compacted (text, line count) or its pending future, and
+    # whether a blank line follows it in the joined log (an empty chunk, or
+    # one ending in a newline, leaves one before the next chunk's first line).
+    pieces: list[Future | tuple[str, int]] = []
+    blank_after: list[bool] = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            logs = [threads.submit(_log, chunk) for chunk in _split_chunks(oids, workers * CHUNKS_PER_WORKER)]
+            for index, future in enumerate(logs):
+                proc = future.result()
+                text = proc.stdout or ""
+                if proc.stderr:
+                    sys.stderr.write(proc.stderr)
+                if proc.returncode != 0 and returncode == 0:
+                    returncode = proc.returncode
+                if not compact_enabled:
+                    sys.stdout.write(f"\n{text}" if index else text)
+                    continue
+                if pool is not None:
+                    pieces.append(pool.submit(_compact_chunk, text, compact_opts, paths, index == 0))
+                else:
+                    pieces.append(_compact_chunk(text, compact_opts, paths, index == 0))
+                blank_after.append(not text or text.endswith("\n"))
+        started = False
+        for index, piece in enumerate(pieces):
+            text, count = piece.result() if isinstance(piece, Future) else piece
+            if count:
+                sys.stdout.write(f"\n{text}" if started else text)
+                started = True
+            if index < len(pieces) - 1 and blank_after[index]:
+                sys.stdout.write("\n" if started else "")
+                started = True
+        if pieces and blank_after[-1]:
+            sys.stdout.write("\n")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return returncode
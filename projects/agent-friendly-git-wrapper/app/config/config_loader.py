@@ -1,19 +1,49 @@
 """Configuration helpers for router CLI."""
 from __future__ import annotations
 
+import copy
+import hashlib
+import marshal
+import os
+import sys
 from pathlib import Path
 
-try:
-    import yaml  # type: ignore
-except ModuleNotFoundError:  # pragma: no cover
-    yaml = None  # type: ignore
+from app.policy.guardrails import GuardrailPolicy
+from app.routing.routing import RoutingTable
 
+# Parsed YAML documents keyed by path; entries are reused until mtime/size change.
+_YAML_CACHE: dict[str, tuple[int, int, object]] = {}
 
-def _load_config(path: Path) -> dict:
-    """Load a YAML config file into a dict."""
-    if yaml is None:  # pragma: no cover
+# Bump when the compiled snapshot layout or merge semantics change.
+COMPILED_CONFIG_VERSION = 2
+COMPILED_CONFIG_SUFFIX = ".config.marshal"
+
+
+def _read_yaml(path: Path) -> object:
+    """Parse a YAML file, reusing the last parse while the file is unchanged.
+
+    Long-lived router processes (the daemon) call this on every request, so a
+    stat is all it costs until the file is edited. Callers get a deep copy and
+    may mutate the result freely. PyYAML is imported here, not at module load,
+    so runs served from a compiled config never import it.
+    """
+    try:
+        import yaml  # type: ignore
+    except ModuleNotFoundError:  # pragma: no cover
         raise RuntimeError("PyYAML is required to load router config.")
+    key = str(path.resolve())
+    stat = path.stat()
+    cached = _YAML_CACHE.get(key)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return copy.deepcopy(cached[2])
     data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    _YAML_CACHE[key] = (stat.st_mtime_ns, stat.st_size, data)
+    return copy.deepcopy(data)
+
+
+def _load_config(path: Path) -> dict:
+    """Load a YAML config file into a dict."""
+    data = _read_yaml(path)
     if not isinstance(data, dict):
         raise RuntimeError("Router config must be a YAML dict.")
     return data
@@ -30,20 +60,26 @@ def _deep_merge(base: dict, override: dict) -> dict:
     return merged
 
 
-def _merge_custom_commands(config: dict, config_path: Path) -> None:
-    """Add custom commands from a separate file into the active config."""
+def _custom_commands_path(config: dict, config_path: Path) -> Path | None:
+    """Return the configured custom commands file path, if any."""
     router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
     custom_file = str(router_cfg.get("custom_commands_file", "")).strip()
     if not custom_file:
-        return
+        return None
     custom_path = Path(custom_file)
     if not custom_path.is_absolute():
         custom_path = (config_path.parent / custom_file).resolve()
+    return custom_path
+
+
+def _merge_custom_commands(config: dict, config_path: Path) -> None:
+    """Add custom commands from a separate file into the active config."""
+    custom_path = _custom_commands_path(config, config_path)
+    if custom_path is None:
+        return
     if not custom_path.exists():
         raise RuntimeError(f"Custom commands file not found: {custom_path}")
-    if yaml is None:  # pragma: no cover
-        raise RuntimeError("PyYAML is required to load router config.")
-    custom_doc = yaml.safe_load(custom_path.read_text(encoding="utf-8")) or {}
+    custom_doc = _read_yaml(custom_path)
     if not isinstance(custom_doc, dict):
         raise RuntimeError("Custom commands file must be a YAML dict.")
     custom_commands = custom_doc.get("custom_commands", {})
@@ -56,6 +92,141 @@ def _merge_custom_commands(config: dict, config_path: Path) -> None:
         config["custom_commands"][str(key).strip().lower()] = value
 
 
+def _build_effective_config(config_path: Path, profile_arg: str) -> tuple[dict, str, list[Path]]:
+    """Load, profile-merge, and custom-merge a config from YAML.
+
+    Returns the merged config, the selected profile name, and every source file
+    the result depends on (for compiled snapshot invalidation).
+    """
+    config = _load_config(config_path)
+    profiles = config.get("profiles", {}) if isinstance(config.get("profiles"), dict) else {}
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    profile = profile_arg.strip().lower() or str(router_cfg.get("default_profile", "")).strip().lower()
+    if profile:
+        if profile not in profiles:
+            raise RuntimeError(f"router: unknown profile '{profile}'")
+        profile_cfg = profiles.get(profile, {})
+        if not isinstance(profile_cfg, dict):
+            raise RuntimeError(f"router: profile '{profile}' must be a dict")
+        config = _deep_merge(config, profile_cfg)
+    _merge_custom_commands(config, config_path)
+    # Routing/guardrail tables ride along in the snapshot so warm starts skip rebuilding them.
+    config["_compiled"] = {
+        "routing": RoutingTable.from_config(config).state(),
+        "guardrails": GuardrailPolicy.from_config(config).state(),
+    }
+    sources = [config_path]
+    custom_path = _custom_commands_path(config, config_path)
+    if custom_path is not None:
+        sources.append(custom_path)
+    return config, profile, sources
+
+
+def _compiled_config_dir() -> Path:
+    """Return the directory holding compiled config snapshots."""
+    override = os.environ.get("ROUTER_CACHE_DIR", "").strip()
+    if override:
+        return Path(override)
+    base = os.environ.get("XDG_CACHE_HOME", "").strip() or str(Path.home() / ".cache")
+    return Path(base) / "agent-friendly-git-wrapper"
+
+
+def _compiled_config_path(config_path: Path, profile_arg: str) -> Path:
+    """Return the snapshot path for a config file and --profile value."""
+    key = f"{Path(config_path).resolve()}\0{profile_arg.strip().lower()}\0{sys.version_info[:2]}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+    return _compiled_config_dir() / f"{digest}{COMPILED_CONFIG_SUFFIX}"
+
+
+def _source_stamps(sources: list[Path]) -> list[tuple[str, int, int]]:
+    """Return (path, mtime_ns, size) for each config source file.
+
+    Stamps come from the stat taken before each file was parsed, so an edit that
+    lands mid-build invalidates the snapshot instead of being baked into it.
+    """
+    stamps = []
+    for source in sources:
+        key = str(Path(source).resolve())
+        cached = _YAML_CACHE.get(key)
+        if cached is None:
+            stat = Path(source).stat()
+            cached = (stat.st_mtime_ns, stat.st_size, None)
+        stamps.append((key, cached[0], cached[1]))
+    return stamps
+
+
+def _read_compiled_config(snapshot: Path) -> tuple[dict, str] | None:
+    """Return (config, profile) from a snapshot whose sources are unchanged, else None."""
+    try:
+        version, stamps, profile, config = marshal.loads(snapshot.read_bytes())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if version != COMPILED_CONFIG_VERSION or not isinstance(config, dict):
+        return None
+    for path, mtime_ns, size in stamps:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+            return None
+    return config, profile
+
+
+def _write_compiled_config(snapshot: Path, config: dict, profile: str, sources: list[Path]) -> bool:
+    """Write a snapshot atomically; return False when the config cannot be marshalled or saved."""
+    try:
+        payload = marshal.dumps((COMPILED_CONFIG_VERSION, _source_stamps(sources), profile, config))
+    except (OSError, ValueError):
+        # Non-marshallable YAML values (dates, custom tags) just stay uncompiled.
+        return False
+    tmp = snapshot.with_name(f"{snapshot.name}.{os.getpid()}.tmp")
+    try:
+        snapshot.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(payload)
+        os.replace(tmp, snapshot)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def _compiled_config_enabled() -> bool:
+    """Return False when ROUTER_CONFIG_CACHE disables compiled snapshots."""
+    return os.environ.get("ROUTER_CONFIG_CACHE", "").strip().lower() not in {"0", "false", "no", "off"}
+
+
+def _load_effective_config(config_path: Path, profile_arg: str = "") -> tuple[dict, str]:
+    """Return the merged config and profile, served from a compiled snapshot when fresh.
+
+    The snapshot is keyed by the config path and --profile value and is
+    invalidated whenever the main config or custom commands file changes
+    (path, mtime, or size), so a warm start skips YAML entirely.
+    """
+    if not _compiled_config_enabled():
+        config, profile, _sources = _build_effective_config(config_path, profile_arg)
+        return config, profile
+    snapshot = _compiled_config_path(config_path, profile_arg)
+    cached = _read_compiled_config(snapshot)
+    if cached is not None:
+        return cached
+    config, profile, sources = _build_effective_config(config_path, profile_arg)
+    _write_compiled_config(snapshot, config, profile, sources)
+    return config, profile
+
+
+def _compile_config(config_path: Path, profile_arg: str = "") -> tuple[Path, list[Path]]:
+    """Rebuild the compiled snapshot from YAML and return its path and sources."""
+    config, profile, sources = _build_effective_config(config_path, profile_arg)
+    snapshot = _compiled_config_path(config_path, profile_arg)
+    if not _write_compiled_config(snapshot, config, profile, sources):
+        raise RuntimeError(f"router config: could not write compiled config to {snapshot}")
+    return snapshot, sources
+
+
 def _load_noise_flags(config: dict, level: str) -> list[str]:
     """Read the noise flag list for a named noise level."""
     router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
@@ -22,7 +22,21 @@ def build_parser() -> argparse.ArgumentParser:
     router.add_argument("--config", default="")
     router.add_argument("--tool", choices=["git", "gh"], default="")
     router.add_argument("--check", action="store_true", help="Check routing decision only.")
+    router.add_argument(
+        "--unpaged",
+        action="store_true",
+        help="Print oversized diff/compare/history output in full instead of paging it.",
+    )
     router.add_argument("args", nargs=argparse.REMAINDER)
+
+    daemon = sub.add_parser("daemon", help="Manage the resident router daemon for this repo")
+    daemon.add_argument("action", choices=["start", "stop", "status", "serve"])
+    daemon.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=1800.0,
+        help="Exit after this many idle seconds (0 disables).",
+    )
     return parser
 
 
@@ -36,9 +50,18 @@ def run(argv: Sequence[str] | None = None) -> int:
                 *([f"--config={args.config}"] if args.config else []),
                 *([f"--tool={args.tool}"] if args.tool else []),
                 *(["--check"] if args.check else []),
+                *(["--unpaged"] if args.unpaged else []),
                 *args.args,
             ]
         )
+    if args.command == "daemon":
+        from app.cli import router_daemon
+
+        try:
+            return router_daemon.dispatch_daemon(args.action, args.idle_timeout)
+        except RuntimeError as exc:
+            sys.stderr.write(f"{exc}\n")
+            return 2
     parser.error("Unsupported command")
     return 2
 
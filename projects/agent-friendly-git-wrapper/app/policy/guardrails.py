@@ -1,9 +1,13 @@
 """Guardrails helpers for git command enforcement."""
 from __future__ import annotations
 
-from fnmatch import fnmatch
+import fnmatch
+import os
+import re
 from typing import Callable
 
+from app.utils.refs import current_branch
+
 
 def get_guardrails(config: dict) -> dict:
     """Return guardrails configuration from the router config."""
@@ -13,15 +17,69 @@ def get_guardrails(config: dict) -> dict:
     return guard
 
 
+# Untracked probe: stop at the first entry instead of listing every untracked file.
+_UNTRACKED_PROBE = ["ls-files", "--others", "--exclude-standard", "--directory", "--no-empty-directory", "--", ":/"]
+
+
 def _current_branch(git_output: Callable[[list[str]], str]) -> str:
-    """Return the current git branch name."""
-    return git_output(["rev-parse", "--abbrev-ref", "HEAD"])
+    """Return the current git branch name, reading HEAD directly when possible."""
+    return current_branch(git_output)
+
+
+def _untracked_hidden(run_git: Callable[..., object]) -> bool:
+    """Return True when `status.showUntrackedFiles` is `no`, so status reports no untracked files."""
+    proc = run_git(
+        ["config", "--get", "status.showUntrackedFiles"], check=False, capture_output=True, text=True
+    )
+    # Besides `no`, git reads boolean false spellings as `no`.
+    return (proc.stdout or "").strip().lower() in {"no", "false", "off", "0"}
+
+
+def _has_untracked(git_output: Callable[[list[str]], str], stream_git: Callable[..., object] | None) -> bool:
+    """Return True when any non-ignored untracked file exists (stops at the first one)."""
+    if stream_git is None:
+        return git_output(_UNTRACKED_PROBE).strip() != ""
+    with stream_git(_UNTRACKED_PROBE) as stream:
+        for _line in stream:
+            # Leaving the block kills git, so the probe never lists the whole tree.
+            return True
+        if stream.wait() != 0:
+            return git_output(["status", "--porcelain"]).strip() != ""
+    return False
+
+
+def _worktree_clean(
+    git_output: Callable[[list[str]], str],
+    run_git: Callable[..., object] | None = None,
+    stream_git: Callable[..., object] | None = None,
+) -> bool:
+    """Return True when the working tree has no local changes (including untracked files).
+
+    With run_git available this uses `diff-index --quiet --cached` and
+    `diff-files --quiet` plus a bounded untracked probe instead of a full
+    `status --porcelain`. Anything unexpected (unborn HEAD, git errors) falls
+    back to status.
+    """
+    if run_git is None:
+        return git_output(["status", "--porcelain"]).strip() == ""
 
+    def _quiet(args: list[str]) -> int:
+        """Run a --quiet git check and return its exit code."""
+        return run_git(args, check=False, capture_output=True, text=True).returncode
 
-def _worktree_clean(git_output: Callable[[list[str]], str]) -> bool:
-    """Return True when the working tree has no local changes."""
-    status = git_output(["status", "--porcelain"])
-    return status.strip() == ""
+    staged = _quiet(["diff-index", "--quiet", "--cached", "HEAD", "--"])
+    if staged == 1:
+        return False
+    if staged != 0:
+        return git_output(["status", "--porcelain"]).strip() == ""
+    if _quiet(["diff-files", "--quiet"]) != 0:
+        # diff-files trusts stat data; confirm with a content compare before calling it dirty.
+        if _quiet(["diff", "--quiet"]) != 0:
+            return False
+    if _untracked_hidden(run_git):
+        # Match `status --porcelain`, which lists no untracked files under this setting.
+        return True
+    return not _has_untracked(git_output, stream_git)
 
 
 def _is_branch_delete(cmd: str, args: list[str]) -> bool:
@@ -34,12 +92,9 @@ def _is_branch_delete(cmd: str, args: list[str]) -> bool:
     return False
 
 
-def _matches_safe_block(cmd: str, args: list[str], patterns: list[str]) -> bool:
-    """Return True when a command matches a safe-mode block pattern."""
-    for pattern in patterns:
-        parts = [p for p in pattern.split(" ") if p]
-        if not parts:
-            continue
+def _matches_safe_block(cmd: str, args: list[str], rules: tuple[tuple[str, ...], ...]) -> bool:
+    """Return True when a command matches a safe-mode block rule (command + required args)."""
+    for parts in rules:
         if parts[0] != cmd:
             continue
         if len(parts) == 1:
@@ -49,9 +104,133 @@ def _matches_safe_block(cmd: str, args: list[str], patterns: list[str]) -> bool:
     return False
 
 
-def _branch_matches(name: str, patterns: list[str]) -> bool:
-    """Return True when a branch name matches any pattern."""
-    return any(fnmatch(name, pattern) for pattern in patterns)
+def _strip_list(values: object) -> tuple[str, ...]:
+    """Return stripped, non-empty string items from a config list."""
+    return tuple(str(item).strip() for item in (values or []) if str(item).strip())
+
+
+def _compile_patterns(patterns: tuple[str, ...]) -> re.Pattern | None:
+    """Combine fnmatch patterns into one alternation regex (None when empty)."""
+    if not patterns:
+        return None
+    # fnmatch() folds case where the OS does (Windows); keep that behavior.
+    flags = re.IGNORECASE if os.path.normcase("A") != "A" else 0
+    return re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns), flags)
+
+
+# Leading GuardrailPolicy slots stored in state(); the compiled regexes are derived.
+_POLICY_STATE_FIELDS = 9
+
+
+class GuardrailPolicy:
+    """Guardrail rules normalized once per config.
+
+    Lists become frozensets, branch patterns become one combined regex each,
+    and merge policies are grouped by target branch. `state()` keeps only
+    plain values so the policy can live in the compiled config snapshot.
+    """
+
+    __slots__ = (
+        "active",
+        "protected_branches",
+        "protected_pattern_list",
+        "protected_ops",
+        "require_clean_ops",
+        "safe_block_rules",
+        "enforce_name_ops",
+        "branch_pattern_list",
+        "merge_rules",
+        "protected_regex",
+        "branch_regex",
+    )
+
+    def __init__(
+        self,
+        active: bool,
+        protected_branches: frozenset[str],
+        protected_pattern_list: tuple[str, ...],
+        protected_ops: frozenset[str],
+        require_clean_ops: frozenset[str],
+        safe_block_rules: tuple[tuple[str, ...], ...],
+        enforce_name_ops: frozenset[str],
+        branch_pattern_list: tuple[str, ...],
+        merge_rules: dict[str, tuple[tuple[str, ...], ...]],
+    ) -> None:
+        """Store normalized rules and compile the branch pattern regexes."""
+        self.active = active
+        self.protected_branches = protected_branches
+        self.protected_pattern_list = protected_pattern_list
+        self.protected_ops = protected_ops
+        self.require_clean_ops = require_clean_ops
+        self.safe_block_rules = safe_block_rules
+        self.enforce_name_ops = enforce_name_ops
+        self.branch_pattern_list = branch_pattern_list
+        self.merge_rules = merge_rules
+        self.protected_regex = _compile_patterns(protected_pattern_list)
+        self.branch_regex = _compile_patterns(branch_pattern_list)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "GuardrailPolicy":
+        """Normalize the `guardrails` section."""
+        guard = get_guardrails(config)
+        merge_rules: dict[str, list[tuple[str, ...]]] = {}
+        for rule in guard.get("merge_policies", []) or []:
+            if not isinstance(rule, dict):
+                continue
+            target = str(rule.get("target", "")).strip()
+            allowed = _strip_list(rule.get("allowed_sources", []))
+            if target and allowed:
+                merge_rules.setdefault(target, []).append(allowed)
+        safe_block_rules = tuple(
+            tuple(part for part in pattern.split(" ") if part)
+            for pattern in _strip_list(guard.get("safe_block_ops", []))
+        )
+        return cls(
+            bool(guard),
+            frozenset(_strip_list(guard.get("protected_branches", []))),
+            _strip_list(guard.get("protected_patterns", [])),
+            frozenset(_strip_list(guard.get("protected_ops", []))),
+            frozenset(_strip_list(guard.get("require_clean_ops", []))),
+            tuple(parts for parts in safe_block_rules if parts),
+            frozenset(_strip_list(guard.get("enforce_branch_name_ops", []))),
+            _strip_list(guard.get("branch_name_patterns", [])),
+            {target: tuple(rules) for target, rules in merge_rules.items()},
+        )
+
+    def state(self) -> tuple:
+        """Return a marshal-friendly snapshot (regexes are rebuilt on restore)."""
+        return tuple(getattr(self, name) for name in self.__slots__[:_POLICY_STATE_FIELDS])
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "GuardrailPolicy":
+        """Rebuild a policy from `state()` output."""
+        return cls(*state)
+
+    def protected(self, branch: str) -> bool:
+        """Return True when a branch is protected by name or pattern."""
+        if branch in self.protected_branches:
+            return True
+        return self.protected_regex is not None and self.protected_regex.match(branch) is not None
+
+    def name_allowed(self, branch: str) -> bool:
+        """Return True when a branch matches the allowed name patterns."""
+        return self.branch_regex is None or self.branch_regex.match(branch) is not None
+
+
+def guardrail_policy(config: dict) -> GuardrailPolicy:
+    """Return the config's guardrail policy, building (or restoring) it on first use."""
+    compiled = config.get("_compiled")
+    if not isinstance(compiled, dict):
+        compiled = config["_compiled"] = {}
+    policy = compiled.get("guardrails")
+    if isinstance(policy, GuardrailPolicy):
+        return policy
+    if isinstance(policy, tuple) and len(policy) == _POLICY_STATE_FIELDS:
+        policy = GuardrailPolicy.from_state(policy)
+    else:
+        policy = GuardrailPolicy.from_config(config)
+    compiled["guardrails"] = policy
+    return policy
 
 
 def guardrails_block(
@@ -59,16 +238,20 @@ def guardrails_block(
     args: list[str],
     config: dict,
     git_output: Callable[[list[str]], str],
+    run_git: Callable[..., object] | None = None,
+    stream_git: Callable[..., object] | None = None,
 ) -> str | None:
     """Return a guardrail error message when a command should be blocked.
 
     This evaluates guardrail rules (safe mode, protected branches, clean worktree)
-    and returns a user-facing message when the command should not run.
+    and returns a user-facing message when the command should not run. The
+    worktree and current branch are only inspected when a rule for this command
+    needs them.
     """
-    guard = get_guardrails(config)
-    if not guard or not args:
+    if not args or tool != "git":
         return None
-    if tool != "git":
+    policy = guardrail_policy(config)
+    if not policy.active:
         return None
 
     runtime = config.get("_runtime", {}) if isinstance(config.get("_runtime"), dict) else {}
@@ -76,15 +259,6 @@ def guardrails_block(
     safe_mode = bool(runtime.get("safe_mode", False))
     require_clean_flag = bool(runtime.get("require_clean", False))
 
-    protected_branches = [str(item).strip() for item in guard.get("protected_branches", []) if str(item).strip()]
-    protected_patterns = [str(item).strip() for item in guard.get("protected_patterns", []) if str(item).strip()]
-    protected_ops = [str(item).strip() for item in guard.get("protected_ops", []) if str(item).strip()]
-    require_clean_ops = [str(item).strip() for item in guard.get("require_clean_ops", []) if str(item).strip()]
-    safe_block_ops = [str(item).strip() for item in guard.get("safe_block_ops", []) if str(item).strip()]
-    enforce_name_ops = [str(item).strip() for item in guard.get("enforce_branch_name_ops", []) if str(item).strip()]
-    branch_patterns = [str(item).strip() for item in guard.get("branch_name_patterns", []) if str(item).strip()]
-    merge_policies = guard.get("merge_policies", [])
-
     cmd = args[0]
     cmd_args = args[1:]
 
@@ -92,40 +266,40 @@ def guardrails_block(
         return None
 
     if safe_mode:
-        if _matches_safe_block(cmd, cmd_args, safe_block_ops):
+        if _matches_safe_block(cmd, cmd_args, policy.safe_block_rules):
             return "router guardrails: blocked by safe mode"
 
     branch_delete = _is_branch_delete(cmd, cmd_args)
-    needs_clean = require_clean_flag or cmd in require_clean_ops
+    needs_clean = require_clean_flag or cmd in policy.require_clean_ops
     if cmd == "branch":
         needs_clean = needs_clean and branch_delete
     if needs_clean:
-        if not _worktree_clean(git_output):
+        if not _worktree_clean(git_output, run_git, stream_git):
             return "router guardrails: worktree not clean (use --override to proceed)"
 
+    check_protected = (policy.protected_branches or policy.protected_regex is not None) and (
+        (cmd in policy.protected_ops and cmd != "branch") or (cmd == "branch" and branch_delete)
+    )
+    check_name = bool(policy.branch_pattern_list) and cmd in policy.enforce_name_ops
+    check_merge = cmd == "merge" and bool(policy.merge_rules)
+    if not (check_protected or check_name or check_merge):
+        return None
+
     branch = _current_branch(git_output)
-    if branch in protected_branches or _branch_matches(branch, protected_patterns):
-        if (cmd in protected_ops and cmd != "branch") or (cmd == "branch" and branch_delete):
-            return f"router guardrails: blocked on protected branch '{branch}'"
+    if check_protected and policy.protected(branch):
+        return f"router guardrails: blocked on protected branch '{branch}'"
 
-    if branch_patterns and (cmd in enforce_name_ops):
-        if not _branch_matches(branch, branch_patterns):
-            return "router guardrails: branch name does not match allowed patterns"
+    if check_name and not policy.name_allowed(branch):
+        return "router guardrails: branch name does not match allowed patterns"
 
-    if cmd == "merge":
-        for rule in merge_policies or []:
-            if not isinstance(rule, dict):
-                continue
-            target = str(rule.get("target", "")).strip()
-            if target and target == branch:
-                allowed = [str(item).strip() for item in rule.get("allowed_sources", []) if str(item).strip()]
-                if allowed:
-                    source = ""
-                    for token in cmd_args:
-                        if token.startswith("-"):
-                            continue
-                        source = token
-                    if source and source not in allowed:
-                        return f"router guardrails: merge into {branch} allowed only from {', '.join(allowed)}"
+    if check_merge:
+        for allowed in policy.merge_rules.get(branch, ()):
+            source = ""
+            for token in cmd_args:
+                if token.startswith("-"):
+                    continue
+                source = token
+            if source and source not in allowed:
+                return f"router guardrails: merge into {branch} allowed only from {', '.join(allowed)}"
 
     return None
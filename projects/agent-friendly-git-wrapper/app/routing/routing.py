@@ -60,9 +60,9 @@ def load_commands(config: dict) -> Dict[str, dict]:
     return commands
 
 
-def _lower_set(values: Sequence[str] | None) -> set[str]:
-    """Convert a list of strings into a lowercase set."""
-    return {str(v).strip().lower() for v in (values or []) if str(v).strip()}
+def _lower_set(values: Sequence[str] | None) -> frozenset[str]:
+    """Convert a list of strings into a lowercase frozenset."""
+    return frozenset(str(v).strip().lower() for v in (values or []) if str(v).strip())
 
 
 def _normalize_overrides(section: dict | None) -> Dict[str, bool]:
@@ -78,53 +78,128 @@ def _normalize_overrides(section: dict | None) -> Dict[str, bool]:
     return overrides
 
 
+def _resolve_tool(preferred: str, enable_git: bool, enable_gh: bool) -> str:
+    """Return the preferred tool when enabled, else whichever tool is enabled."""
+    if preferred == "git" and enable_git:
+        return "git"
+    if preferred == "gh" and enable_gh:
+        return "gh"
+    if enable_git:
+        return "git"
+    if enable_gh:
+        return "gh"
+    return preferred
+
+
+class RoutingTable:
+    """Routing decisions precomputed once per config.
+
+    Tool selection, tool enablement, and allow/deny overrides become single
+    dict/frozenset lookups. `state()` is a plain tuple so the table can be
+    stored in the compiled config snapshot and restored with `from_state()`.
+    """
+
+    __slots__ = ("tools", "fallback_tool", "passthrough", "enabled_tools", "allowed", "denied", "default_enabled", "commands")
+
+    def __init__(
+        self,
+        tools: Dict[str, str],
+        fallback_tool: str,
+        passthrough: bool,
+        enabled_tools: frozenset[str],
+        allowed: Dict[str, frozenset[str]],
+        denied: Dict[str, frozenset[str]],
+        default_enabled: bool,
+        commands: Dict[str, dict],
+    ) -> None:
+        """Store precomputed routing lookups."""
+        self.tools = tools
+        self.fallback_tool = fallback_tool
+        self.passthrough = passthrough
+        self.enabled_tools = enabled_tools
+        self.allowed = allowed
+        self.denied = denied
+        self.default_enabled = default_enabled
+        self.commands = commands
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RoutingTable":
+        """Build the table from router, overlap, *_only, override, and command sections."""
+        router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+        overlap_default = str(router_cfg.get("overlap_default", "git")).strip().lower() or "git"
+        enable_git = bool(router_cfg.get("enable_git", True))
+        enable_gh = bool(router_cfg.get("enable_gh", True))
+        unknown_policy = str(router_cfg.get("unknown_command_policy", "passthrough")).strip().lower()
+
+        # Later inserts win, mirroring the lookup order overlap > git-only > gh-only.
+        tools: Dict[str, str] = {}
+        for cmd in _lower_set(config.get("gh_only_commands", [])):
+            tools[cmd] = "gh"
+        for cmd in _lower_set(config.get("git_only_commands", [])):
+            tools[cmd] = "git"
+        overlap = config.get("overlap_commands", {}) if isinstance(config.get("overlap_commands"), dict) else {}
+        for key, value in overlap.items():
+            if isinstance(value, dict):
+                preferred = str(value.get("default", overlap_default)).strip().lower()
+                tools[str(key).strip().lower()] = _resolve_tool(preferred, enable_git, enable_gh)
+
+        overrides = config.get("command_overrides", {}) if isinstance(config.get("command_overrides"), dict) else {}
+        allowed: Dict[str, frozenset[str]] = {}
+        denied: Dict[str, frozenset[str]] = {}
+        for tool_key, section in overrides.items():
+            tool = str(tool_key).strip().lower()
+            tool_overrides = _normalize_overrides(section)
+            allowed[tool] = frozenset(cmd for cmd, value in tool_overrides.items() if value)
+            denied[tool] = frozenset(cmd for cmd, value in tool_overrides.items() if not value)
+
+        enabled_tools = frozenset(tool for tool, on in (("git", enable_git), ("gh", enable_gh)) if on)
+        return cls(
+            tools,
+            _resolve_tool(overlap_default, enable_git, enable_gh),
+            unknown_policy == "passthrough",
+            enabled_tools,
+            allowed,
+            denied,
+            bool(router_cfg.get("default_command_enabled", True)),
+            load_commands(config),
+        )
+
+    def state(self) -> tuple:
+        """Return a marshal-friendly snapshot of the table."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "RoutingTable":
+        """Rebuild a table from `state()` output."""
+        return cls(*state)
+
+
+def routing_table(config: dict) -> RoutingTable:
+    """Return the config's routing table, building (or restoring) it on first use."""
+    compiled = config.get("_compiled")
+    if not isinstance(compiled, dict):
+        compiled = config["_compiled"] = {}
+    table = compiled.get("routing")
+    if isinstance(table, RoutingTable):
+        return table
+    if isinstance(table, tuple) and len(table) == len(RoutingTable.__slots__):
+        table = RoutingTable.from_state(table)
+    else:
+        table = RoutingTable.from_config(config)
+    compiled["routing"] = table
+    return table
+
+
 def pick_tool(command: str, tool_override: str, config: dict) -> str:
     """Pick git or gh for a command using config and overrides."""
-    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
-    overlap_default = str(router_cfg.get("overlap_default", "git")).strip().lower() or "git"
-    enable_git = bool(router_cfg.get("enable_git", True))
-    enable_gh = bool(router_cfg.get("enable_gh", True))
-    unknown_policy = str(router_cfg.get("unknown_command_policy", "passthrough")).strip().lower()
-
     if tool_override:
         return tool_override
-
-    overlap = config.get("overlap_commands", {}) if isinstance(config.get("overlap_commands"), dict) else {}
-    overlap_defaults = {
-        str(k).strip().lower(): str(v.get("default", overlap_default)).strip().lower()
-        for k, v in overlap.items()
-        if isinstance(v, dict)
-    }
-    git_only = _lower_set(config.get("git_only_commands", []))
-    gh_only = _lower_set(config.get("gh_only_commands", []))
-
-    if command in overlap_defaults:
-        preferred = overlap_defaults[command]
-        if preferred == "git" and enable_git:
-            return "git"
-        if preferred == "gh" and enable_gh:
-            return "gh"
-        if enable_git:
-            return "git"
-        if enable_gh:
-            return "gh"
-        return preferred
-
-    if command in git_only:
-        return "git"
-    if command in gh_only:
-        return "gh"
-
-    if unknown_policy == "passthrough":
-        if overlap_default == "git" and enable_git:
-            return "git"
-        if overlap_default == "gh" and enable_gh:
-            return "gh"
-        if enable_git:
-            return "git"
-        if enable_gh:
-            return "gh"
-        return overlap_default
+    table = routing_table(config)
+    tool = table.tools.get(command)
+    if tool is not None:
+        return tool
+    if table.passthrough:
+        return table.fallback_tool
 
     suggestions = suggest_commands(command, config) if command else []
     message = f"router: unrecognized command '{command}'."
@@ -135,23 +210,17 @@ def pick_tool(command: str, tool_override: str, config: dict) -> str:
 
 def command_allowed(tool: str, command: str, config: dict) -> bool:
     """Return True when a command is allowed for the tool."""
-    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
-    default_enabled = bool(router_cfg.get("default_command_enabled", True))
-    overrides = config.get("command_overrides", {}) if isinstance(config.get("command_overrides"), dict) else {}
-    tool_overrides = _normalize_overrides(overrides.get(tool, {}))
-    if command in tool_overrides:
-        return tool_overrides[command]
-    return default_enabled
+    table = routing_table(config)
+    if command in table.denied.get(tool, ()):
+        return False
+    if command in table.allowed.get(tool, ()):
+        return True
+    return table.default_enabled
 
 
 def tool_enabled(tool: str, config: dict) -> bool:
     """Return True when a tool is enabled in config."""
-    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
-    if tool == "git":
-        return bool(router_cfg.get("enable_git", True))
-    if tool == "gh":
-        return bool(router_cfg.get("enable_gh", True))
-    return False
+    return tool in routing_table(config).enabled_tools
 
 
 def dispatch_custom(
@@ -219,8 +288,7 @@ def dispatch_builtin(
     handlers: dict[str, Callable[[list[str], dict], int]],
 ) -> int | None:
     """Run a built-in router command when configured."""
-    commands = load_commands(config)
-    meta = commands.get(command)
+    meta = routing_table(config).commands.get(command)
     if meta is None:
         return None
     if not bool(meta.get("enabled", True)):
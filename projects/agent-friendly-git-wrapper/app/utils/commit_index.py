@@ -0,0 +1,494 @@
+"""Per-repo SQLite index of commit metadata and numstat rows for history queries.
+
+The index lives at `<git-common-dir>/router-index.sqlite` and only exists after
+`router index build`. It holds every commit reachable from HEAD, local and
+remote branches (oid, parents, author, date, subject, per-commit totals), one
+numstat row per changed file, the paths each merge changes against each of its
+parents, and an FTS5 table over subjects when SQLite provides it. Updates walk
+only the commits added since the stored tips.
+"""
+from __future__ import annotations
+
+import fnmatch
+import os
+import sqlite3
+from pathlib import Path
+from typing import Callable
+
+from app.compact.budget import _COMMIT_MARK, _FIELD_MARK, _parse_numstat_z
+
+INDEX_FILE = "router-index.sqlite"
+SCHEMA_VERSION = 1
+_INDEX_FORMAT = "--format=%x1e%H%x1f%P%x1f%an%x1f%aI%x1f%s"
+_BATCH = 500
+_WILDCARDS = ("*", "?", "[")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS tips (oid TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    oid TEXT NOT NULL UNIQUE,
+    parents TEXT NOT NULL,
+    author TEXT NOT NULL,
+    date TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    deleted INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS numstat (
+    commit_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    old_path TEXT NOT NULL,
+    added INTEGER,
+    deleted INTEGER
+);
+CREATE INDEX IF NOT EXISTS numstat_commit ON numstat (commit_id);
+CREATE INDEX IF NOT EXISTS numstat_path ON numstat (path);
+CREATE INDEX IF NOT EXISTS numstat_old_path ON numstat (old_path);
+CREATE TABLE IF NOT EXISTS merge_paths (
+    commit_id INTEGER NOT NULL,
+    parent INTEGER NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS merge_paths_commit ON merge_paths (commit_id);
+"""
+# Trigram tokens give substring matches, the same semantics as `git log --grep --fixed-strings -i`.
+_FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS subjects"
+    " USING fts5(subject, content='commits', content_rowid='id', tokenize='trigram')"
+)
+# Trigram queries need at least three characters per term.
+_FTS_MIN_TERM = 3
+
+
+class IndexedCommit:
+    """One commit selected by an index query: its formatted header and change totals."""
+
+    __slots__ = ("oid", "header", "shown", "files", "added", "deleted")
+
+    def __init__(self, oid: str, header: str) -> None:
+        """Start with no changes counted."""
+        self.oid = oid
+        self.header = header
+        self.shown = True
+        self.files = 0
+        self.added = 0
+        self.deleted = 0
+
+
+def _run(run_git: Callable[..., object], args: list[str], **kwargs):
+    """Run git capturing text output."""
+    return run_git(args, check=False, capture_output=True, text=True, encoding="utf-8", errors="replace", **kwargs)
+
+
+def _index_cfg(config: dict) -> dict:
+    """Return the router.commit_index config section."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    index_cfg = router_cfg.get("commit_index", {})
+    return index_cfg if isinstance(index_cfg, dict) else {}
+
+
+def _pathspec_matcher(pathspecs: list[str], prefix: str) -> Callable[[str], bool] | None:
+    """Build a matcher for plain and `:(exclude)` pathspecs, relative to the cwd `prefix`.
+
+    Mirrors git's default (non-glob) matching: a pattern without wildcards
+    matches the path or a leading directory, otherwise fnmatch with `*`
+    crossing `/`. Returns None for magic the index cannot reproduce.
+    """
+    includes: list[str] = []
+    excludes: list[str] = []
+    for spec in pathspecs:
+        target = includes
+        if spec.startswith((":(exclude)", ":!", ":^")):
+            target = excludes
+            spec = spec[len(":(exclude)"):] if spec.startswith(":(") else spec[2:]
+        if spec.startswith(":") or "\\" in spec or "[!" in spec:
+            return None
+        target.append(os.path.normpath(prefix + spec).replace(os.sep, "/") if spec not in {"", "."} else prefix.rstrip("/"))
+
+    def _matches(pattern: str, path: str) -> bool:
+        """Match one normalized pattern the way git does without glob magic."""
+        if not pattern or pattern == ".":
+            return True
+        if any(char in pattern for char in _WILDCARDS):
+            return fnmatch.fnmatchcase(path, pattern)
+        return path == pattern or path.startswith(pattern.rstrip("/") + "/")
+
+    def _match(path: str) -> bool:
+        """Return True when the pathspecs select `path`."""
+        if includes and not any(_matches(pattern, path) for pattern in includes):
+            return False
+        return not any(_matches(pattern, path) for pattern in excludes)
+
+    return _match
+
+
+class CommitIndex:
+    """SQLite commit index for one repository."""
+
+    __slots__ = ("path", "run_git", "conn", "fts")
+
+    def __init__(self, path: Path, run_git: Callable[..., object]) -> None:
+        """Open (creating when missing) the index database at `path`."""
+        self.path = path
+        self.run_git = run_git
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path), timeout=30)
+        self.conn.executescript(_SCHEMA)
+        try:
+            self.conn.execute(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite without FTS5 (or before 3.34, without trigrams): subject search falls back to LIKE.
+            self.fts = False
+        version = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is None:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('version', ?)", (str(SCHEMA_VERSION),))
+            self.conn.commit()
+        elif version[0] != str(SCHEMA_VERSION):
+            raise RuntimeError(f"router index: {path} has schema {version[0]}; run `router index drop` and rebuild")
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
+
+    def current_tips(self) -> list[str]:
+        """Return the oids of HEAD, local branches and remote-tracking branches."""
+        refs = _run(self.run_git, ["for-each-ref", "--format=%(objectname)", "refs/heads", "refs/remotes"])
+        if refs.returncode != 0:
+            raise RuntimeError((refs.stderr or "").strip() or "router index: git for-each-ref failed")
+        tips = set((refs.stdout or "").split())
+        head = _run(self.run_git, ["rev-parse", "--verify", "-q", "HEAD"])
+        if head.returncode == 0 and head.stdout.strip():
+            tips.add(head.stdout.strip())
+        return sorted(tips)
+
+    def stored_tips(self) -> list[str]:
+        """Return the tips recorded by the last update."""
+        return [row[0] for row in self.conn.execute("SELECT oid FROM tips ORDER BY oid")]
+
+    def update(self) -> int:
+        """Index commits reachable from the current tips but not the stored ones; returns the count added."""
+        tips = self.current_tips()
+        stored = self.stored_tips()
+        if tips == stored:
+            return 0
+        added = 0
+        if tips:
+            args = ["log", "-z", "--numstat", "--ignore-missing", _INDEX_FORMAT, *tips]
+            if stored:
+                args.extend(["--not", *stored])
+            proc = _run(self.run_git, args)
+            if proc.returncode != 0:
+                raise RuntimeError((proc.stderr or "").strip() or "router index: git log failed")
+            added = self._insert(proc.stdout or "")
+        with self.conn:
+            self.conn.execute("DELETE FROM tips")
+            self.conn.executemany("INSERT INTO tips (oid) VALUES (?)", [(oid,) for oid in tips])
+        return added
+
+    def _insert(self, text: str) -> int:
+        """Insert the commits of one `git log -z --numstat` run in a single transaction."""
+        added = 0
+        merges: list[tuple[int, str, list[str]]] = []
+        with self.conn:
+            for chunk in text.split(_COMMIT_MARK)[1:]:
+                cut = chunk.find("\0")
+                cut = len(chunk) if cut < 0 else cut
+                oid, parents, author, date, subject = chunk[:cut].split(_FIELD_MARK, 4)
+                entries = _parse_numstat_z(chunk[cut + 1:])
+                binary = [added_ == "-" or deleted_ == "-" for added_, deleted_, _, _ in entries]
+                total_added = sum(int(entry[0]) for entry, is_bin in zip(entries, binary) if not is_bin)
+                total_deleted = sum(int(entry[1]) for entry, is_bin in zip(entries, binary) if not is_bin)
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO commits (oid, parents, author, date, subject, files, added, deleted)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (oid, parents, author, date, subject, len(entries), total_added, total_deleted),
+                )
+                if not cursor.rowcount:
+                    continue
+                commit_id = cursor.lastrowid
+                added += 1
+                if " " in parents:
+                    merges.append((commit_id, oid, parents.split()))
+                self.conn.executemany(
+                    "INSERT INTO numstat (commit_id, path, old_path, added, deleted) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (commit_id, path, old_path, None if is_bin else int(a), None if is_bin else int(d))
+                        for (a, d, path, old_path), is_bin in zip(entries, binary)
+                    ],
+                )
+                if self.fts:
+                    self.conn.execute("INSERT INTO subjects (rowid, subject) VALUES (?, ?)", (commit_id, subject))
+            if merges:
+                self._insert_merge_paths(merges)
+        return added
+
+    def _insert_merge_paths(self, merges: list[tuple[int, str, list[str]]]) -> None:
+        """Record the paths each merge changes against each parent (for history simplification).
+
+        `git log -m` skips parents with an empty diff, so one `diff-tree
+        --stdin --always` run lists every (merge, parent) pair explicitly.
+        """
+        pairs = [(commit_id, oid, index, parent) for commit_id, oid, parents in merges for index, parent in enumerate(parents)]
+        proc = _run(
+            self.run_git,
+            ["diff-tree", "--stdin", "--always", "-z", "-r", "--no-renames", "--name-only"],
+            input="".join(f"{oid} {parent}\n" for _, oid, _, parent in pairs),
+        )
+        if proc.returncode != 0:
+            raise RuntimeError((proc.stderr or "").strip() or "router index: git diff-tree failed")
+        tokens = (proc.stdout or "").split("\0")
+        rows: list[tuple[int, int, str]] = []
+        pos = 0
+        for number, (commit_id, oid, index, _) in enumerate(pairs):
+            if pos >= len(tokens) or tokens[pos] != oid:
+                raise RuntimeError("router index: unexpected git diff-tree output")
+            pos += 1
+            following = pairs[number + 1][1] if number + 1 < len(pairs) else None
+            while pos < len(tokens) and tokens[pos] and tokens[pos] != following:
+                rows.append((commit_id, index, tokens[pos]))
+                pos += 1
+        self.conn.executemany("INSERT INTO merge_paths (commit_id, parent, path) VALUES (?, ?, ?)", rows)
+
+    def status(self) -> dict:
+        """Return counts, size and staleness for `router index status`."""
+        commits = self.conn.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+        rows = self.conn.execute("SELECT COUNT(*) FROM numstat").fetchone()[0]
+        return {
+            "path": str(self.path),
+            "commits": commits,
+            "numstat_rows": rows,
+            "tips": len(self.stored_tips()),
+            "stale": self.current_tips() != self.stored_tips(),
+            "fts": self.fts,
+            "bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
+
+    def covers(self, rev_args: list[str]) -> tuple[bool, str, list[str]]:
+        """Return (every commit the revisions select is indexed, cwd prefix, positive endpoint oids).
+
+        Indexed commits always have their ancestors indexed, so checking the
+        positive endpoints is enough.
+        """
+        revisions = [arg for arg in rev_args if not arg.startswith("-")] or ["HEAD"]
+        proc = _run(self.run_git, ["rev-parse", "--show-prefix", "--revs-only", *revisions])
+        if proc.returncode != 0:
+            return False, "", []
+        lines = (proc.stdout or "").split("\n")
+        prefix = lines[0]
+        positive = [line for line in lines[1:] if line and not line.startswith("^")]
+        for start in range(0, len(positive), _BATCH):
+            batch = positive[start:start + _BATCH]
+            marks = ",".join("?" * len(batch))
+            found = self.conn.execute(f"SELECT COUNT(*) FROM commits WHERE oid IN ({marks})", batch).fetchone()[0]
+            if found != len(set(batch)):
+                return False, prefix, positive
+        return True, prefix, positive
+
+    def select(
+        self,
+        rev_args: list[str],
+        count: int | None,
+        header_format: str,
+        extra_args: list[str],
+        pathspecs: list[str],
+        search: list[str] | None = None,
+        totals: bool = True,
+    ) -> list[IndexedCommit] | None:
+        """Select commits like `git log <rev_args> -- <pathspecs>` with totals from the index.
+
+        git walks the revisions without diffing (and formats the headers); the
+        index decides which commits touch the pathspecs, replaying git's
+        default history simplification, filters by subject words, and supplies
+        change totals. Returns None when the index cannot answer exactly, so
+        the caller runs git instead.
+        """
+        covered, prefix, positive = self.covers(rev_args)
+        if not covered:
+            return None
+        match = _pathspec_matcher(pathspecs, prefix) if pathspecs else None
+        if pathspecs and match is None:
+            return None
+        searched = self._search(search) if search else None
+        limited = match is not None or searched is not None
+        walk_args = [arg for arg in rev_args if not (limited and arg.startswith("--max-count="))]
+        proc = _run(self.run_git, ["log", *walk_args, *extra_args, f"--pretty=format:%x1e%H%x1f%P%x1f{header_format}"])
+        if proc.returncode != 0:
+            return None
+        walk: list[tuple[str, list[str], str]] = []
+        for chunk in (proc.stdout or "").split(_COMMIT_MARK)[1:]:
+            oid, parents, header = chunk.split(_FIELD_MARK, 2)
+            # git separates commits with a newline after each header.
+            walk.append((oid, parents.split(), header[:-1] if header.endswith("\n") else header))
+        walked = {oid for oid, _, _ in walk}
+        reachable = set(positive)
+        passed: set[str] = set()
+        selected: list[IndexedCommit] = []
+        for start in range(0, len(walk), _BATCH):
+            batch = walk[start:start + _BATCH]
+            meta, rows, merge_rows = self._rows([oid for oid, _, _ in batch], match is not None)
+            for oid, parents, header in batch:
+                info = meta.get(oid)
+                if info is None:
+                    return None
+                commit_id, files, added, deleted = info
+                item = IndexedCommit(oid, header)
+                if match is None:
+                    item.files, item.added, item.deleted = files, added, deleted
+                else:
+                    if oid not in reachable:
+                        passed.add(oid)
+                        continue
+                    kept = self._simplify(item, parents, rows.get(commit_id, []), merge_rows.get(commit_id, []), match, walked, totals)
+                    if kept is None:
+                        return None
+                    for parent in kept:
+                        if parent in passed:
+                            # git reached this parent later than its child here (clock skew); let git answer.
+                            return None
+                        reachable.add(parent)
+                    if not item.shown:
+                        continue
+                if searched is not None and oid not in searched:
+                    continue
+                selected.append(item)
+                if count is not None and len(selected) >= count:
+                    return selected
+        return selected
+
+    def _simplify(
+        self,
+        item: IndexedCommit,
+        parents: list[str],
+        rows: list[tuple],
+        merge_rows: list[tuple[int, str]],
+        match: Callable[[str], bool],
+        walked: set[str],
+        totals: bool,
+    ) -> list[str] | None:
+        """Apply git's default history simplification to one path-limited commit.
+
+        Sets `item.shown` and its totals, and returns the parents the walk
+        continues through: a commit identical (within the pathspecs) to a
+        parent follows only that parent. Returns None for cases only git can
+        answer (merges with parents outside the range, split renames).
+        """
+        if len(parents) > 1:
+            if any(parent not in walked for parent in parents):
+                return None
+            touched = [False] * len(parents)
+            for index, path in merge_rows:
+                if not touched[index] and match(path):
+                    touched[index] = True
+            for parent, changed in zip(parents, touched):
+                if not changed:
+                    item.shown = False
+                    return [parent]
+            # Merges differing from every parent are shown without a stat.
+            item.shown = True
+            return parents
+        for path, old_path, row_added, row_deleted in rows:
+            hit = match(path)
+            if old_path and match(old_path) != hit:
+                if totals:
+                    # git would split this rename into an add and a delete; only git can count it.
+                    return None
+                hit = True
+            if hit:
+                item.files += 1
+                item.added += row_added or 0
+                item.deleted += row_deleted or 0
+        item.shown = item.files > 0
+        return parents
+
+    def _rows(self, oids: list[str], with_paths: bool) -> tuple[dict, dict, dict]:
+        """Fetch commit totals, and numstat/merge path rows when path-limiting, for a batch of oids."""
+        marks = ",".join("?" * len(oids))
+        meta = {
+            row[0]: row[1:]
+            for row in self.conn.execute(f"SELECT oid, id, files, added, deleted FROM commits WHERE oid IN ({marks})", oids)
+        }
+        rows: dict[int, list[tuple]] = {}
+        merge_rows: dict[int, list[tuple[int, str]]] = {}
+        if with_paths and meta:
+            ids = [info[0] for info in meta.values()]
+            id_marks = ",".join("?" * len(ids))
+            for row in self.conn.execute(
+                f"SELECT commit_id, path, old_path, added, deleted FROM numstat WHERE commit_id IN ({id_marks})", ids
+            ):
+                rows.setdefault(row[0], []).append(row[1:])
+            for row in self.conn.execute(
+                f"SELECT commit_id, parent, path FROM merge_paths WHERE commit_id IN ({id_marks})", ids
+            ):
+                merge_rows.setdefault(row[0], []).append(row[1:])
+        return meta, rows, merge_rows
+
+    def _search(self, terms: list[str]) -> set[str]:
+        """Return the oids whose subjects contain every term, ignoring case.
+
+        FTS5 answers terms of three or more characters; shorter ones (and every
+        term without FTS5) use LIKE on the subject column.
+        """
+        long_terms = [term for term in terms if self.fts and len(term) >= _FTS_MIN_TERM]
+        short_terms = [term for term in terms if term not in long_terms]
+        clauses = ["c.subject LIKE ? ESCAPE '\\'" for _ in short_terms]
+        params = ["%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for term in short_terms]
+        source = "commits c"
+        if long_terms:
+            source = "subjects JOIN commits c ON c.id = subjects.rowid"
+            clauses.insert(0, "subjects MATCH ?")
+            params.insert(0, " ".join('"' + term.replace('"', '""') + '"' for term in long_terms))
+        rows = self.conn.execute(f"SELECT c.oid FROM {source} WHERE {' AND '.join(clauses)}", params)
+        return {row[0] for row in rows}
+
+
+def shortstat_line(files: int, added: int, deleted: int) -> str:
+    """Render git's `--shortstat` summary line."""
+    if not files:
+        return " 0 files changed"
+    parts = [f" {files} file{'s' if files != 1 else ''} changed"]
+    if added or not deleted:
+        parts.append(f"{added} insertion{'s' if added != 1 else ''}(+)")
+    if deleted or not added:
+        parts.append(f"{deleted} deletion{'s' if deleted != 1 else ''}(-)")
+    return ", ".join(parts)
+
+
+def index_path(git_common_dir: Callable[[], str]) -> Path | None:
+    """Return the index file path, or None outside a repository."""
+    try:
+        return Path(git_common_dir()) / INDEX_FILE
+    except RuntimeError:
+        return None
+
+
+def open_commit_index(
+    config: dict,
+    git_common_dir: Callable[[], str],
+    run_git: Callable[..., object],
+) -> CommitIndex | None:
+    """Open the built index for queries, updating it first, or None when unused.
+
+    Returns None when router.commit_index.enabled is off, the index was never
+    built, or the incremental update fails (queries then fall back to git).
+    """
+    index_cfg = _index_cfg(config)
+    if not index_cfg.get("enabled", True):
+        return None
+    path = index_path(git_common_dir)
+    if path is None or not path.exists():
+        return None
+    try:
+        index = CommitIndex(path, run_git)
+    except (sqlite3.Error, RuntimeError):
+        return None
+    if index_cfg.get("auto_update", True):
+        try:
+            index.update()
+        except (sqlite3.Error, RuntimeError):
+            index.close()
+            return None
+    return index
@@ -2,8 +2,11 @@
 from __future__ import annotations
 
 import subprocess
+import threading
 from typing import Callable, Sequence
 
+DEFAULT_MAX_WORKERS = 8
+
 
 def git_output(
     args: Sequence[str],
@@ -39,6 +42,246 @@ def run_git(
     return subprocess.run(["git", *[str(a) for a in args]], **kwargs)
 
 
+def run_many(
+    commands: Sequence[Sequence[str]],
+    record_resolved: Callable[[str, Sequence[str]], None],
+    get_timeout: Callable[[], float | None],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> list[subprocess.CompletedProcess]:
+    """Run independent read-only git commands concurrently.
+
+    Results come back in the same order as `commands`; failures are returned
+    as CompletedProcess objects with a non-zero returncode, not raised.
+    """
+    for args in commands:
+        record_resolved("git", args)
+    timeout = get_timeout()
+
+    def _run_one(args: Sequence[str]) -> subprocess.CompletedProcess:
+        """Run one git command with captured text output."""
+        return subprocess.run(
+            ["git", *[str(a) for a in args]],
+            check=False,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+
+    if len(commands) <= 1 or max_workers <= 1:
+        return [_run_one(args) for args in commands]
+    # Imported here so passthrough runs never pay for concurrent.futures (and logging).
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(commands))) as pool:
+        return list(pool.map(_run_one, commands))
+
+
+class GitStream:
+    """Running git process whose stdout is consumed line by line.
+
+    Stderr is drained on a background thread so a chatty stderr can never block
+    git while the caller is still reading stdout.
+    """
+
+    def __init__(self, args: Sequence[str], timeout: float | None) -> None:
+        """Start git with piped, utf-8 decoded stdout/stderr."""
+        self.args = ["git", *[str(a) for a in args]]
+        self.timeout = timeout
+        self.timed_out = False
+        self.stderr = ""
+        self._stderr_parts: list[str] = []
+        self.proc = subprocess.Popen(
+            self.args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        self._timer = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._kill_on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _drain_stderr(self) -> None:
+        """Collect stderr until git closes it."""
+        assert self.proc.stderr is not None
+        for chunk in self.proc.stderr:
+            self._stderr_parts.append(chunk)
+
+    def _kill_on_timeout(self) -> None:
+        """Kill git once the configured timeout elapses."""
+        if self.proc.poll() is None:
+            self.timed_out = True
+            self.proc.kill()
+
+    def __iter__(self):
+        """Yield stdout lines (newline-terminated except possibly the last)."""
+        assert self.proc.stdout is not None
+        return iter(self.proc.stdout)
+
+    def wait(self) -> int:
+        """Wait for git to exit and return its exit code."""
+        returncode = self.proc.wait()
+        self._stderr_thread.join()
+        self.stderr = "".join(self._stderr_parts)
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.args, self.timeout or 0, stderr=self.stderr)
+        return returncode
+
+    def __enter__(self) -> "GitStream":
+        """Return the stream for use in a with block."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Stop git if the caller bailed out early, then release the pipes."""
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        if self._timer is not None:
+            self._timer.cancel()
+        for pipe in (self.proc.stdout, self.proc.stderr):
+            if pipe is not None:
+                pipe.close()
+
+
+def stream_git(
+    args: Sequence[str],
+    record_resolved: Callable[[str, Sequence[str]], None],
+    get_timeout: Callable[[], float | None],
+) -> GitStream:
+    """Start git and return a GitStream over its stdout."""
+    record_resolved("git", args)
+    return GitStream(args, get_timeout())
+
+
+class ObjectServer:
+    """Long-lived `git cat-file` co-process for object and ref lookups.
+
+    One process answers every lookup for the invocation over a pipe. Uses
+    `--batch-command` (git >= 2.36) and falls back to separate `--batch-check`
+    / `--batch` processes on older git.
+    """
+
+    def __init__(self, record_resolved: Callable[[str, Sequence[str]], None]) -> None:
+        """Prepare the server; processes start on first use."""
+        self.record_resolved = record_resolved
+        self._procs: dict[str, subprocess.Popen] = {}
+        self._batch_command: bool | None = None
+
+    def _start(self, mode: str) -> subprocess.Popen:
+        """Start (or reuse) a cat-file process for a batch mode."""
+        proc = self._procs.get(mode)
+        if proc is not None and proc.poll() is None:
+            return proc
+        args = ["cat-file", mode]
+        self.record_resolved("git", args)
+        proc = subprocess.Popen(
+            ["git", *args],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._procs[mode] = proc
+        return proc
+
+    def _request(self, mode: str, line: str) -> bytes:
+        """Send one request line and return the header line of the reply."""
+        if "\n" in line:
+            raise RuntimeError(f"git cat-file: invalid object name {line!r}")
+        proc = self._start(mode)
+        assert proc.stdin is not None and proc.stdout is not None
+        try:
+            proc.stdin.write(line.encode("utf-8") + b"\n")
+            proc.stdin.flush()
+        except BrokenPipeError:
+            return b""
+        return proc.stdout.readline()
+
+    def _query(self, command: str, name: str) -> tuple[str, bytes]:
+        """Run an info/contents query, returning the mode used and the header."""
+        if self._batch_command is not False:
+            header = self._request("--batch-command", f"{command} {name}")
+            if header:
+                self._batch_command = True
+                return "--batch-command", header
+            if self._batch_command is None:
+                # Older git rejects --batch-command and exits before replying.
+                self._batch_command = False
+            else:
+                raise RuntimeError("git cat-file --batch-command exited unexpectedly")
+        mode = "--batch-check" if command == "info" else "--batch"
+        header = self._request(mode, name)
+        if not header:
+            raise RuntimeError(f"git cat-file {mode} exited unexpectedly")
+        return mode, header
+
+    def info(self, name: str) -> tuple[str, str, int] | None:
+        """Return (oid, type, size) for an object name, or None when it does not resolve."""
+        _mode, header = self._query("info", name)
+        parts = header.decode("utf-8", errors="replace").split()
+        if len(parts) != 3 or parts[1] in {"missing", "ambiguous"}:
+            return None
+        return parts[0], parts[1], int(parts[2])
+
+    def exists(self, name: str) -> bool:
+        """Return True when an object name (ref, oid, rev expression) resolves."""
+        return self.info(name) is not None
+
+    def resolve(self, name: str) -> str:
+        """Resolve an object name to a full oid, raising like `git rev-parse` does."""
+        found = self.info(name)
+        if found is None:
+            raise RuntimeError(f"fatal: ambiguous argument '{name}': unknown revision or path not in the working tree.")
+        return found[0]
+
+    def verify_ref(self, ref: str) -> bool:
+        """Return True when a full refname exists (like `show-ref --verify`)."""
+        return ref.startswith("refs/") and self.exists(ref)
+
+    def read(self, name: str) -> tuple[str, bytes] | None:
+        """Return (type, content) for an object name, or None when it does not resolve."""
+        mode, header = self._query("contents", name)
+        parts = header.decode("utf-8", errors="replace").split()
+        if len(parts) != 3 or parts[1] in {"missing", "ambiguous"}:
+            return None
+        proc = self._procs[mode]
+        assert proc.stdout is not None
+        size = int(parts[2])
+        data = proc.stdout.read(size)
+        proc.stdout.read(1)
+        return parts[1], data
+
+    def read_blob(self, name: str) -> bytes | None:
+        """Return blob content for an object name (ex: `HEAD:path`), or None."""
+        found = self.read(name)
+        if found is None or found[0] != "blob":
+            return None
+        return found[1]
+
+    def close(self) -> None:
+        """Stop every cat-file process started by this server."""
+        for proc in self._procs.values():
+            if proc.stdin is not None:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            if proc.stdout is not None:
+                proc.stdout.close()
+        self._procs.clear()
+
+
 def run_gh(
     args: Sequence[str],
     record_resolved: Callable[[str, Sequence[str]], None],
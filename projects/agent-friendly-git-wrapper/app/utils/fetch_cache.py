@@ -0,0 +1,60 @@
+"""Fetch freshness state so back-to-back branch commands skip redundant fetches."""
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+
+STATE_FILE = "router-fetch-state.json"
+FULL_FETCH = "--prune"
+
+
+def _state_path(git_dir: str | Path) -> Path:
+    """Return the fetch state file path under a git dir."""
+    return Path(git_dir) / STATE_FILE
+
+
+def _fetch_key(remote: str, refspec: str) -> str:
+    """Return the state key for a remote/refspec pair."""
+    return f"{remote} {refspec}"
+
+
+def load_fetch_state(git_dir: str | Path) -> dict[str, float]:
+    """Load recorded fetch times, ignoring a missing or unreadable state file."""
+    try:
+        data = json.loads(_state_path(git_dir).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {str(k): float(v) for k, v in data.items() if isinstance(v, (int, float))}
+
+
+def fetch_is_fresh(git_dir: str | Path, remote: str, refspec: str, ttl: float) -> bool:
+    """Return True when remote/refspec (or a full fetch of the remote) ran within ttl seconds."""
+    if ttl <= 0:
+        return False
+    state = load_fetch_state(git_dir)
+    now = time.time()
+    for key in {_fetch_key(remote, refspec), _fetch_key(remote, FULL_FETCH)}:
+        stamp = state.get(key)
+        if stamp is not None and 0 <= now - stamp < ttl:
+            return True
+    return False
+
+
+def record_fetch(git_dir: str | Path, remote: str, refspec: str) -> None:
+    """Record a successful fetch; write failures are ignored (the cache is advisory)."""
+    state = load_fetch_state(git_dir)
+    state[_fetch_key(remote, refspec)] = time.time()
+    path = _state_path(git_dir)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(state, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
@@ -12,14 +12,22 @@ class TeeStream:
         """Initialize the tee stream with a buffer limit."""
         self.stream = stream
         self.limit = limit
-        self.buffer = ""
+        # Chunks are joined on read; appending to one string is quadratic for large outputs.
+        self._parts: list[str] = []
+        self._size = 0
+
+    @property
+    def buffer(self) -> str:
+        """Return the captured text (at most `limit` characters)."""
+        return "".join(self._parts)
 
     def write(self, data: str) -> int:
         """Write to the wrapped stream and capture up to the limit."""
         self.stream.write(data)
-        if self.limit > 0 and len(self.buffer) < self.limit:
-            remaining = self.limit - len(self.buffer)
-            self.buffer += data[:remaining]
+        if self.limit > 0 and self._size < self.limit:
+            piece = data[: self.limit - self._size]
+            self._parts.append(piece)
+            self._size += len(piece)
         return len(data)
 
     def flush(self) -> None:
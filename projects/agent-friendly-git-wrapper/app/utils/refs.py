@@ -0,0 +1,411 @@
+"""Read-only repository and ref metadata without spawning git.
+
+Covers repo discovery (including `.git` files for worktrees and submodules),
+HEAD, loose refs, `packed-refs` and branch upstream config. Every lookup
+returns None when it cannot answer exactly as git would (reftable repos,
+GIT_DIR overrides, config includes, ambiguous short names, ...), and the
+module-level helpers then fall back to git.
+"""
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+from typing import Callable
+
+# Environment that changes how git finds the repository; when set, let git decide.
+_DISCOVERY_ENV = (
+    "GIT_DIR",
+    "GIT_WORK_TREE",
+    "GIT_COMMON_DIR",
+    "GIT_CEILING_DIRECTORIES",
+    "GIT_DISCOVERY_ACROSS_FILESYSTEM",
+)
+
+# Refs that live in the per-worktree git dir rather than the common dir.
+_PER_WORKTREE_PREFIXES = ("refs/bisect/", "refs/worktree/", "refs/rewritten/")
+
+# `git rev-parse` short-name rules, in lookup order.
+_SHORTEN_RULES = ("{}", "refs/{}", "refs/tags/{}", "refs/heads/{}", "refs/remotes/{}", "refs/remotes/{}/HEAD")
+
+_OID_RE = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+_SECTION_RE = re.compile(r'^\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]\s*(?:[#;].*)?$')
+_KEY_RE = re.compile(r"^([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*(.*))?$")
+
+# path -> (mtime_ns, size, parsed value); shared by every Repo in the process.
+_FILE_CACHE: dict[str, tuple[int, int, object]] = {}
+# start path -> discovered layout; one request's worth, see reset_discovery().
+_DISCOVER_CACHE: dict[tuple, "Repo | None"] = {}
+
+
+class _Unparseable(Exception):
+    """Raised when a config file uses syntax this reader does not handle."""
+
+
+def _cached_parse(path: Path, parse: Callable[[str], object]) -> object:
+    """Parse a small text file, reusing the previous result while its stat is unchanged.
+
+    Returns None for a missing file; propagates _Unparseable from `parse`.
+    """
+    key = str(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        _FILE_CACHE.pop(key, None)
+        return None
+    cached = _FILE_CACHE.get(key)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    try:
+        text = path.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return None
+    value = parse(text)
+    _FILE_CACHE[key] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+
+def _parse_packed_refs(text: str) -> dict[str, str]:
+    """Parse `packed-refs` into {refname: oid}, skipping the header and peeled lines."""
+    refs: dict[str, str] = {}
+    for line in text.splitlines():
+        if not line or line[0] in "#^":
+            continue
+        oid, _, name = line.partition(" ")
+        if _OID_RE.match(oid) and name:
+            refs[name] = oid
+    return refs
+
+
+def _config_value(raw: str) -> str:
+    """Decode a git config value (quotes, escapes, trailing comments)."""
+    out: list[str] = []
+    quoted = False
+    idx = 0
+    while idx < len(raw):
+        ch = raw[idx]
+        if ch == "\\":
+            if idx + 1 >= len(raw):
+                # Line continuation; not worth supporting here.
+                raise _Unparseable(raw)
+            nxt = raw[idx + 1]
+            out.append({"n": "\n", "t": "\t", "b": "\b", "\\": "\\", '"': '"'}.get(nxt, ""))
+            if nxt not in 'ntb\\"':
+                raise _Unparseable(raw)
+            idx += 2
+            continue
+        if ch == '"':
+            quoted = not quoted
+        elif ch in "#;" and not quoted:
+            break
+        else:
+            out.append(ch)
+        idx += 1
+    if quoted:
+        raise _Unparseable(raw)
+    return "".join(out).strip()
+
+
+def _parse_config(text: str) -> dict[tuple[str, str, str], list[str]]:
+    """Parse git config text into {(section, subsection, key): [values]}.
+
+    Section and key names are lowercased; subsections keep their case.
+    Includes and legacy `[section.sub]` headers raise _Unparseable.
+    """
+    values: dict[tuple[str, str, str], list[str]] = {}
+    section = ""
+    subsection = ""
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line or line[0] in "#;":
+            continue
+        if line.startswith("["):
+            match = _SECTION_RE.match(line)
+            if match is None or "." in match.group(1):
+                raise _Unparseable(line)
+            section = match.group(1).lower()
+            subsection = re.sub(r"\\(.)", r"\1", match.group(2) or "")
+            if section in {"include", "includeif"}:
+                raise _Unparseable(line)
+            continue
+        match = _KEY_RE.match(line)
+        if match is None or not section:
+            raise _Unparseable(line)
+        value = "true" if match.group(2) is None else _config_value(match.group(2))
+        values.setdefault((section, subsection, match.group(1).lower()), []).append(value)
+    return values
+
+
+def _valid_refname(name: str) -> bool:
+    """Return True for refnames that are safe to map onto files under a git dir."""
+    if not name or name.startswith("/") or name.endswith("/") or name.endswith(".lock"):
+        return False
+    parts = name.split("/")
+    return all(part and not part.startswith(".") for part in parts) and "\\" not in name
+
+
+class Repo:
+    """Paths for one discovered repository plus cached ref/config readers."""
+
+    __slots__ = ("work_tree", "git_dir", "common_dir")
+
+    def __init__(self, work_tree: Path, git_dir: Path, common_dir: Path) -> None:
+        """Store the resolved work tree, per-worktree git dir and common dir."""
+        self.work_tree = work_tree
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+
+    def config(self) -> dict[tuple[str, str, str], list[str]] | None:
+        """Return the parsed repo config, or None when it cannot be read safely."""
+        try:
+            values = _cached_parse(self.common_dir / "config", _parse_config)
+            if values is None:
+                return None
+            worktree_cfg = self.git_dir / "config.worktree"
+            if values.get(("extensions", "", "worktreeconfig"), ["false"])[-1].lower() == "true":
+                extra = _cached_parse(worktree_cfg, _parse_config) or {}
+                values = {**values, **{k: list(values.get(k, [])) + v for k, v in extra.items()}}
+        except _Unparseable:
+            return None
+        return values
+
+    def _packed(self) -> dict[str, str]:
+        """Return the packed-refs index (cached by mtime)."""
+        return _cached_parse(self.common_dir / "packed-refs", _parse_packed_refs) or {}
+
+    def _loose_path(self, name: str) -> Path:
+        """Return the loose file path for a refname."""
+        if name.startswith(_PER_WORKTREE_PREFIXES) or "/" not in name:
+            return self.git_dir / name
+        return self.common_dir / name
+
+    def read_ref(self, name: str) -> str | None:
+        """Return a ref's raw value (an oid or `ref: TARGET`) without following it."""
+        if not _valid_refname(name):
+            return None
+        try:
+            value = self._loose_path(name).read_text(encoding="utf-8").strip()
+        except (OSError, UnicodeDecodeError):
+            value = ""
+        if value:
+            if _OID_RE.match(value) or value.startswith("ref: "):
+                return value
+            return None
+        if "/" not in name:
+            return None
+        return self._packed().get(name)
+
+    def resolve(self, name: str) -> str | None:
+        """Resolve a full refname (or HEAD-like root ref) to an oid, following symrefs."""
+        for _depth in range(5):
+            value = self.read_ref(name)
+            if value is None:
+                return None
+            if not value.startswith("ref: "):
+                return value
+            name = value[5:].strip()
+        return None
+
+    def has_ref(self, name: str) -> bool:
+        """Return True when a full refname exists (like `show-ref --verify`)."""
+        return self.resolve(name) is not None
+
+    def shorten(self, name: str) -> str | None:
+        """Return git's unambiguous short name for a full refname, or None if unsure."""
+        # Like git, try the most specific rule first (refs/remotes/x/HEAD -> x).
+        for idx in range(len(_SHORTEN_RULES) - 1, 0, -1):
+            rule = _SHORTEN_RULES[idx]
+            prefix, _, suffix = rule.partition("{}")
+            if not (name.startswith(prefix) and name.endswith(suffix)) or len(name) <= len(prefix) + len(suffix):
+                continue
+            short = name[len(prefix): len(name) - len(suffix)] if suffix else name[len(prefix):]
+            for other_idx, other in enumerate(_SHORTEN_RULES):
+                if other_idx != idx and self.read_ref(other.format(short)) is not None:
+                    # Another ref could claim the same short name; let git pick.
+                    return None
+            return short
+        return None
+
+    def head(self) -> str | None:
+        """Return HEAD's raw value (an oid or `ref: TARGET`)."""
+        return self.read_ref("HEAD")
+
+    def current_branch(self) -> str | None:
+        """Return the checked-out branch like `rev-parse --abbrev-ref HEAD` ("HEAD" when detached)."""
+        head = self.head()
+        if head is None:
+            return None
+        if not head.startswith("ref: "):
+            return "HEAD"
+        target = head[5:].strip()
+        if not target.startswith("refs/heads/") or not self.has_ref(target):
+            # Unborn branches make git error out; keep that behavior by deferring.
+            return None
+        return self.shorten(target)
+
+    def branches(self) -> list[tuple[str, str]] | None:
+        """Return (refname, oid) for every local branch, sorted like for-each-ref."""
+        names = {name for name in self._packed() if name.startswith("refs/heads/")}
+        heads_dir = self.common_dir / "refs" / "heads"
+        for root, dirs, files in os.walk(heads_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            rel_root = Path(root).relative_to(self.common_dir).as_posix()
+            for filename in files:
+                if filename.startswith(".") or filename.endswith(".lock"):
+                    continue
+                names.add(f"{rel_root}/{filename}")
+        result = []
+        for name in sorted(names, key=lambda item: item.encode("utf-8")):
+            oid = self.resolve(name)
+            if oid is None:
+                return None
+            result.append((name, oid))
+        return result
+
+    def upstream(self, branch: str) -> str | None:
+        """Return the full upstream refname for a branch ("" when none is configured)."""
+        values = self.config()
+        if values is None:
+            return None
+        remotes = values.get(("branch", branch, "remote"), [])
+        merges = values.get(("branch", branch, "merge"), [])
+        if not merges:
+            return ""
+        if not remotes or len(merges) > 1:
+            return None
+        remote = remotes[-1]
+        merge = merges[0]
+        if remote == ".":
+            return merge
+        fetch_specs = values.get(("remote", remote, "fetch"), [])
+        if not fetch_specs:
+            return None
+        for spec in fetch_specs:
+            spec = spec.lstrip("+")
+            if spec.startswith("^"):
+                return None
+            src, sep, dst = spec.partition(":")
+            if not sep:
+                continue
+            if "*" not in src:
+                if src == merge:
+                    return dst
+                continue
+            src_head, _, src_tail = src.partition("*")
+            dst_head, _, dst_tail = dst.partition("*")
+            if merge.startswith(src_head) and merge.endswith(src_tail) and len(merge) >= len(src_head) + len(src_tail):
+                middle = merge[len(src_head): len(merge) - len(src_tail)]
+                return f"{dst_head}{middle}{dst_tail}"
+        return None
+
+    def upstream_short(self, branch: str) -> str | None:
+        """Return `%(upstream:short)` for a branch ("" when no upstream is configured)."""
+        upstream = self.upstream(branch)
+        if not upstream:
+            return upstream
+        return self.shorten(upstream)
+
+
+def _is_git_dir(path: Path) -> bool:
+    """Return True when a directory looks like a git dir itself (bare repo or inside .git)."""
+    return (path / "HEAD").is_file() and (path / "objects").is_dir() and (path / "refs").is_dir()
+
+
+def _discover(start: Path) -> Repo | None:
+    """Walk up from `start` to the enclosing work tree, mirroring git's discovery."""
+    for directory in (start, *start.parents):
+        if _is_git_dir(directory):
+            return None
+        candidate = directory / ".git"
+        if candidate.is_dir():
+            git_dir = candidate
+        elif candidate.is_file():
+            try:
+                content = candidate.read_text(encoding="utf-8").strip()
+            except (OSError, UnicodeDecodeError):
+                return None
+            if not content.startswith("gitdir:"):
+                return None
+            git_dir = Path(content[len("gitdir:"):].strip())
+            if not git_dir.is_absolute():
+                git_dir = directory / git_dir
+            git_dir = git_dir.resolve()
+        else:
+            continue
+        if hasattr(os, "getuid"):
+            try:
+                if directory.stat().st_uid != os.getuid():
+                    # safe.directory rules apply; git decides.
+                    return None
+            except OSError:
+                return None
+        common_dir = git_dir
+        try:
+            common_raw = (git_dir / "commondir").read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            common_raw = ""
+        except (OSError, UnicodeDecodeError):
+            return None
+        if common_raw:
+            common_dir = Path(common_raw)
+            if not common_dir.is_absolute():
+                common_dir = (git_dir / common_dir).resolve()
+        if not (git_dir / "HEAD").is_file() or (common_dir / "reftable").exists():
+            return None
+        repo = Repo(directory, git_dir, common_dir)
+        values = repo.config()
+        if values is None:
+            return None
+        ref_storage = values.get(("extensions", "", "refstorage"), ["files"])[-1].lower()
+        bare = values.get(("core", "", "bare"), ["false"])[-1].lower()
+        if ref_storage != "files" or bare in {"true", "yes", "on", "1"}:
+            return None
+        worktree_cfg = values.get(("core", "", "worktree"))
+        if worktree_cfg:
+            # Submodules record their own checkout here; anything else relocates the work tree.
+            configured = Path(worktree_cfg[-1])
+            if not configured.is_absolute():
+                configured = git_dir / configured
+            if configured.resolve() != directory:
+                return None
+        return repo
+    return None
+
+
+def discover(start: str | None = None) -> Repo | None:
+    """Return the repository containing `start` (default: cwd), or None to defer to git."""
+    if any(os.environ.get(name) for name in _DISCOVERY_ENV):
+        return None
+    try:
+        start_path = Path(start or os.getcwd()).resolve()
+    except OSError:
+        return None
+    key = (str(start_path),)
+    if key not in _DISCOVER_CACHE:
+        _DISCOVER_CACHE[key] = _discover(start_path)
+    return _DISCOVER_CACHE[key]
+
+
+def reset_discovery() -> None:
+    """Forget discovered layouts, so `git init`, new worktrees or core.bare/core.worktree edits are seen.
+
+    Discovery is cached per request; long-lived processes call this before each one.
+    """
+    _DISCOVER_CACHE.clear()
+
+
+def current_branch(git_output: Callable[[list[str]], str]) -> str:
+    """Return `git rev-parse --abbrev-ref HEAD`, reading HEAD directly when possible."""
+    repo = discover()
+    branch = repo.current_branch() if repo is not None else None
+    if branch is not None:
+        return branch
+    return git_output(["rev-parse", "--abbrev-ref", "HEAD"])
+
+
+def git_common_dir(git_output: Callable[[list[str]], str]) -> str:
+    """Return the git common dir, asking git only when discovery defers."""
+    repo = discover()
+    if repo is not None:
+        return str(repo.common_dir)
+    return git_output(["rev-parse", "--git-common-dir"])
@@ -0,0 +1,178 @@
+"""Inspect and enable the git features that speed up the router's read paths.
+
+Each feature reports `ok`, `missing`, `partial` or `unsupported` and knows the
+git command that enables it. Object-store features (commit-graph, multi-pack
+index, bitmaps) are read from the files under `objects/`; the rest are local
+config switches.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable
+
+# Feature names in report order.
+FEATURES = ("commit-graph", "multi-pack-index", "bitmaps", "untracked-cache", "many-files", "fsmonitor")
+_GRAPH_SIGNATURE = b"CGPH"
+_BLOOM_CHUNKS = {b"BIDX", b"BDAT"}
+_CONFIG_KEYS = ("core.commitgraph", "core.untrackedcache", "core.fsmonitor", "feature.manyfiles")
+_COMMIT_GRAPH_WRITE = ["commit-graph", "write", "--reachable", "--changed-paths"]
+# Packs loose objects into a new pack (existing packs are kept) and writes the
+# multi-pack index with a reachability bitmap over every pack.
+_MIDX_BITMAP_WRITE = ["repack", "-d", "--write-midx", "--write-bitmap-index"]
+
+
+class FeatureState:
+    """One feature's status, detail text, and the git command that enables it."""
+
+    __slots__ = ("name", "status", "detail", "enable")
+
+    def __init__(self, name: str, status: str, detail: str = "", enable: list[str] | None = None) -> None:
+        """Store the inspection result for `name`."""
+        self.name = name
+        self.status = status
+        self.detail = detail
+        self.enable = enable or []
+
+
+def _run(run_git: Callable[..., object], args: list[str]):
+    """Run git capturing text output."""
+    return run_git(args, check=False, capture_output=True, text=True, encoding="utf-8", errors="replace")
+
+
+def _graph_has_bloom(path: Path) -> bool | None:
+    """Return whether one commit-graph file carries changed-path Bloom chunks (None if unreadable)."""
+    try:
+        with path.open("rb") as handle:
+            header = handle.read(8)
+            if len(header) < 8 or header[:4] != _GRAPH_SIGNATURE:
+                return None
+            # The chunk table has one 12-byte (id, offset) entry per chunk plus a terminator.
+            table = handle.read(12 * (header[6] + 1))
+    except OSError:
+        return None
+    chunks = {table[pos:pos + 4] for pos in range(0, len(table), 12)}
+    return _BLOOM_CHUNKS <= chunks
+
+
+def _commit_graph_files(objects_dir: Path) -> list[Path]:
+    """Return the commit-graph files in use: the single graph, or every layer of a split chain."""
+    info = objects_dir / "info"
+    chain = info / "commit-graphs" / "commit-graph-chain"
+    if chain.exists():
+        try:
+            hashes = chain.read_text(encoding="utf-8").split()
+        except OSError:
+            return []
+        return [info / "commit-graphs" / f"graph-{oid}.graph" for oid in hashes]
+    single = info / "commit-graph"
+    return [single] if single.exists() else []
+
+
+def _config_values(run_git: Callable[..., object]) -> dict[str, str]:
+    """Return the effective values of the feature config keys (lowercased names)."""
+    pattern = "^(" + "|".join(key.replace(".", "\\.") for key in _CONFIG_KEYS) + ")$"
+    proc = _run(run_git, ["config", "-z", "--get-regexp", pattern])
+    values: dict[str, str] = {}
+    for entry in (proc.stdout or "").split("\0"):
+        if entry:
+            key, _, value = entry.partition("\n")
+            values[key.lower()] = value.strip().lower()
+    return values
+
+
+def _truthy(value: str | None) -> bool:
+    """Interpret a git boolean config value."""
+    return value in {"true", "yes", "on", "1"}
+
+
+def _fsmonitor_supported(run_git: Callable[..., object]) -> tuple[bool, str]:
+    """Return whether git's builtin fsmonitor daemon runs on this platform, with git's message."""
+    proc = _run(run_git, ["fsmonitor--daemon", "status"])
+    message = (proc.stderr or proc.stdout or "").strip().splitlines()
+    text = message[-1].removeprefix("fatal: ") if message else ""
+    if "not supported" in text or "is not a git command" in text:
+        return False, text
+    return True, text
+
+
+def inspect_features(run_git: Callable[..., object]) -> list[FeatureState]:
+    """Report which speed-up features the current repository has."""
+    proc = _run(run_git, ["rev-parse", "--git-path", "objects"])
+    if proc.returncode != 0:
+        raise RuntimeError((proc.stderr or "").strip() or "router optimize: not inside a git repository")
+    objects_dir = Path(proc.stdout.strip())
+    values = _config_values(run_git)
+    states: list[FeatureState] = []
+
+    graphs = _commit_graph_files(objects_dir)
+    if values.get("core.commitgraph") == "false":
+        # An explicit opt-out is left alone.
+        states.append(FeatureState("commit-graph", "missing", "disabled by core.commitGraph"))
+    elif not graphs:
+        states.append(FeatureState("commit-graph", "missing", "", _COMMIT_GRAPH_WRITE))
+    elif all(_graph_has_bloom(path) for path in graphs):
+        states.append(FeatureState("commit-graph", "ok", "changed-path Bloom filters"))
+    else:
+        states.append(FeatureState("commit-graph", "partial", "no changed-path Bloom filters", _COMMIT_GRAPH_WRITE))
+
+    pack_dir = objects_dir / "pack"
+    has_midx = (pack_dir / "multi-pack-index").exists()
+    states.append(FeatureState("multi-pack-index", "ok" if has_midx else "missing", "", None if has_midx else _MIDX_BITMAP_WRITE))
+    has_bitmap = pack_dir.is_dir() and any(pack_dir.glob("*.bitmap"))
+    states.append(FeatureState("bitmaps", "ok" if has_bitmap else "missing", "", None if has_bitmap else _MIDX_BITMAP_WRITE))
+
+    many_files = _truthy(values.get("feature.manyfiles"))
+    untracked = values.get("core.untrackedcache")
+    # feature.manyFiles turns the untracked cache on unless it is set explicitly.
+    untracked_on = _truthy(untracked) or (untracked is None and many_files)
+    states.append(
+        FeatureState(
+            "untracked-cache",
+            "ok" if untracked_on else "missing",
+            "via feature.manyFiles" if untracked_on and untracked is None else "",
+            None if untracked_on else ["config", "--local", "core.untrackedCache", "true"],
+        )
+    )
+    states.append(
+        FeatureState(
+            "many-files",
+            "ok" if many_files else "missing",
+            "",
+            None if many_files else ["config", "--local", "feature.manyFiles", "true"],
+        )
+    )
+
+    fsmonitor = values.get("core.fsmonitor")
+    if fsmonitor and fsmonitor != "false":
+        states.append(FeatureState("fsmonitor", "ok", "" if _truthy(fsmonitor) else "hook"))
+    else:
+        supported, message = _fsmonitor_supported(run_git)
+        if supported:
+            states.append(FeatureState("fsmonitor", "missing", "", ["config", "--local", "core.fsmonitor", "true"]))
+        else:
+            states.append(FeatureState("fsmonitor", "unsupported", message))
+    return states
+
+
+def enable_features(states: list[FeatureState], run_git: Callable[..., object]) -> list[tuple[str, list[str], str]]:
+    """Run each distinct enable command for the missing or partial features.
+
+    Returns (feature names, git args, error text or "") per command run;
+    features sharing a command (multi-pack index and bitmaps) run it once.
+    """
+    results: list[tuple[str, list[str], str]] = []
+    pending: list[tuple[list[str], list[str]]] = []
+    for state in states:
+        if state.status not in {"missing", "partial"} or not state.enable:
+            continue
+        for names, args in pending:
+            if args == state.enable:
+                names.append(state.name)
+                break
+        else:
+            pending.append(([state.name], state.enable))
+    for names, args in pending:
+        proc = _run(run_git, args)
+        error = "" if proc.returncode == 0 else ((proc.stderr or "").strip().splitlines() or ["failed"])[-1]
+        results.append((", ".join(names), args, error))
+    return results
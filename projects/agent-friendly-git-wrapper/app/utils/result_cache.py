@@ -0,0 +1,415 @@
+"""On-disk result cache for router output over immutable commits."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import sys
+import zlib
+from pathlib import Path
+from typing import Callable
+
+from app.utils.refs import discover
+
+CACHE_DIR = "router-cache"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+# Entries are a zlib stream of frames: a stream tag (b"o"/b"e") and payload length, then the payload.
+ENTRY_FORMAT = 2
+_FRAME = struct.Struct("!cI")
+_READ_CHUNK = 64 * 1024
+# git config that changes log/show/diff text (path quoting, prefixes, rename
+# detection, diff algorithm, textconv drivers, notes, pretty aliases, colors).
+_OUTPUT_CONFIG = r"^(core\.(quotepath|abbrev)|(diff|log|color|pretty|notes|grep|i18n|format)\..*)$"
+
+
+def _config_digest(config: dict) -> str:
+    """Digest the effective config (minus per-run metadata and derived tables) for cache keys."""
+    stable = {key: value for key, value in config.items() if not str(key).startswith("_")}
+    payload = json.dumps(stable, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cwd_prefix() -> str:
+    """Return the cwd relative to the work tree top (what `--show-prefix` prints).
+
+    Pathspecs are cwd-relative, so the prefix is part of the key. When the
+    repository layout cannot be read, the absolute cwd stands in for it.
+    """
+    cwd = os.getcwd()
+    repo = discover(cwd)
+    if repo is None:
+        return cwd
+    prefix = os.path.relpath(Path(cwd).resolve(), repo.work_tree)
+    return "" if prefix == "." else f"{Path(prefix).as_posix()}/"
+
+
+def _git_config_digest(run_git: Callable[..., object] | None) -> str:
+    """Digest the effective git config values that change command output ("" without git)."""
+    if run_git is None:
+        return ""
+    proc = run_git(
+        ["config", "-z", "--get-regexp", _OUTPUT_CONFIG],
+        check=False,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    return hashlib.sha256((proc.stdout or "").encode("utf-8")).hexdigest()
+
+
+def resolve_range_oids(spec: str, resolve: Callable[[str], str], allow_single: bool) -> list[str] | None:
+    """Resolve `A..B`, `A...B` (or a single rev when allowed) to commit oids.
+
+    Returns None when the spec cannot be pinned to immutable commits, so the
+    caller skips the cache instead of serving a stale answer.
+    """
+    if "..." in spec:
+        sides = spec.split("...", 1)
+    elif ".." in spec:
+        sides = spec.split("..", 1)
+    elif allow_single and spec:
+        sides = [spec]
+    else:
+        return None
+    try:
+        return [resolve(side or "HEAD") for side in sides]
+    except (RuntimeError, OSError):
+        return None
+
+
+class _EntryWriter:
+    """Compress captured output frames into a temp file next to the entry, up to a size limit."""
+
+    def __init__(self, path: Path, limit: int) -> None:
+        """Open the temp file lazily; nothing is written for runs without output."""
+        self.path = path
+        self.tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        self.limit = limit
+        self.size = 0
+        self.handle = None
+        self.failed = False
+        self.compressor = zlib.compressobj()
+
+    def add(self, tag: bytes, text: str) -> None:
+        """Append one frame; past the limit (or on a write error) the partial entry is dropped."""
+        if self.failed or not text:
+            return
+        raw = text.encode("utf-8")
+        self.size += len(raw)
+        if self.size > self.limit:
+            self.abort()
+            return
+        try:
+            if self.handle is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.handle = self.tmp.open("wb")
+            self.handle.write(self.compressor.compress(_FRAME.pack(tag, len(raw)) + raw))
+        except OSError:
+            self.abort()
+
+    def commit(self) -> bool:
+        """Move the finished entry into place; return False when nothing was stored."""
+        if self.failed:
+            return False
+        try:
+            if self.handle is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.handle = self.tmp.open("wb")
+            self.handle.write(self.compressor.flush())
+            self.handle.close()
+            os.replace(self.tmp, self.path)
+        except OSError:
+            self.abort()
+            return False
+        return True
+
+    def abort(self) -> None:
+        """Close and delete the temp file and stop capturing."""
+        self.failed = True
+        if self.handle is not None:
+            try:
+                self.handle.close()
+            except OSError:
+                pass
+        try:
+            self.tmp.unlink()
+        except OSError:
+            pass
+
+
+class _SpoolStream:
+    """Mirror writes to a real stream and spool them into an entry writer."""
+
+    def __init__(self, stream, writer: _EntryWriter, tag: bytes) -> None:
+        """Wrap `stream`, tagging its frames with `tag`."""
+        self.stream = stream
+        self.writer = writer
+        self.tag = tag
+
+    def write(self, data: str) -> int:
+        """Write through to the wrapped stream and spool a copy."""
+        self.stream.write(data)
+        self.writer.add(self.tag, data)
+        return len(data)
+
+    def flush(self) -> None:
+        """Flush the wrapped stream."""
+        self.stream.flush()
+
+
+def _read_frames(path: Path):
+    """Yield (tag, text) frames from an entry file, decompressing a chunk at a time."""
+    decompressor = zlib.decompressobj()
+    pending = b""
+    with path.open("rb") as handle:
+        while True:
+            chunk = handle.read(_READ_CHUNK)
+            pending += decompressor.decompress(chunk) if chunk else decompressor.flush()
+            while len(pending) >= _FRAME.size:
+                tag, length = _FRAME.unpack_from(pending)
+                if len(pending) < _FRAME.size + length:
+                    break
+                yield tag, pending[_FRAME.size:_FRAME.size + length].decode("utf-8")
+                pending = pending[_FRAME.size + length:]
+            if not chunk:
+                break
+    if pending or not decompressor.eof:
+        raise ValueError("truncated result cache entry")
+
+
+class ResultCache:
+    """Content-addressed, size-bounded (LRU) cache of command output."""
+
+    def __init__(
+        self,
+        root: str | Path,
+        max_bytes: int,
+        max_entry_bytes: int,
+        run_git: Callable[..., object] | None = None,
+    ) -> None:
+        """Point the cache at a directory; nothing is created until first write.
+
+        `run_git` reads the output-affecting git config for keys; without it
+        keys only cover the router config.
+        """
+        self.root = Path(root)
+        self.entries = self.root / "entries"
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.run_git = run_git
+
+    def key(self, command: str, oids: list[str], config: dict, options: dict) -> str:
+        """Build a cache key from resolved oids, cwd prefix, config digests, and normalized options."""
+        payload = json.dumps(
+            {
+                "format": ENTRY_FORMAT,
+                "command": command,
+                "oids": oids,
+                "prefix": _cwd_prefix(),
+                "config": _config_digest(config),
+                "git_config": _git_config_digest(self.run_git),
+                "options": options,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        """Return the entry file for a key."""
+        return self.entries / key[:2] / key
+
+    def get(self, key: str) -> Path | None:
+        """Return a cached entry's file and mark it recently used, or None on a miss."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            self._bump("misses")
+            return None
+        self._bump("hits")
+        return path
+
+    def read(self, key: str) -> dict | None:
+        """Return a cached entry's stdout and stderr, or None when missing or unreadable."""
+        entry = {"stdout": [], "stderr": []}
+        try:
+            for tag, text in _read_frames(self._path(key)):
+                entry["stdout" if tag == b"o" else "stderr"].append(text)
+        except (OSError, ValueError, zlib.error, struct.error):
+            return None
+        return {name: "".join(parts) for name, parts in entry.items()}
+
+    def put(self, key: str, stdout: str, stderr: str = "") -> None:
+        """Store an entry atomically, then evict least recently used entries over budget."""
+        writer = _EntryWriter(self._path(key), self.max_entry_bytes)
+        writer.add(b"o", stdout)
+        writer.add(b"e", stderr)
+        if writer.commit():
+            self._evict()
+
+    def _files(self) -> list[tuple[float, int, Path]]:
+        """Return (mtime, size, path) for every entry file."""
+        files: list[tuple[float, int, Path]] = []
+        if not self.entries.is_dir():
+            return files
+        for bucket in self.entries.iterdir():
+            if not bucket.is_dir():
+                continue
+            for path in bucket.iterdir():
+                if path.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the cache fits max_bytes."""
+        files = self._files()
+        total = sum(size for _mtime, size, _path in files)
+        if total <= self.max_bytes:
+            return
+        for _mtime, size, path in sorted(files, key=lambda item: item[0]):
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _read_counters(self) -> dict:
+        """Load hit/miss counters."""
+        try:
+            data = json.loads((self.root / "stats.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _bump(self, name: str) -> None:
+        """Increment a hit/miss counter (best effort; concurrent runs may drop a count)."""
+        counters = self._read_counters()
+        counters[name] = int(counters.get(name, 0)) + 1
+        path = self.root / "stats.json"
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            # Replace atomically so readers never see a half-written file and reset the counters.
+            tmp.write_text(json.dumps(counters), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """Return entry count, size, budget, and hit/miss counters."""
+        files = self._files()
+        counters = self._read_counters()
+        return {
+            "path": str(self.root),
+            "entries": len(files),
+            "bytes": sum(size for _mtime, size, _path in files),
+            "max_bytes": self.max_bytes,
+            "hits": int(counters.get("hits", 0)),
+            "misses": int(counters.get("misses", 0)),
+        }
+
+    def clear(self) -> int:
+        """Delete every entry and reset counters; return the number of entries removed."""
+        removed = 0
+        for _mtime, _size, path in self._files():
+            try:
+                path.unlink()
+                removed += 1
+            except OSError:
+                continue
+        try:
+            (self.root / "stats.json").unlink()
+        except OSError:
+            pass
+        return removed
+
+    def run(self, key: str, produce: Callable[[], int]) -> int:
+        """Replay a cached result, or run `produce` and cache its successful output."""
+        path = self.get(key)
+        if path is not None:
+            replayed = False
+            try:
+                for tag, text in _read_frames(path):
+                    (sys.stdout if tag == b"o" else sys.stderr).write(text)
+                    replayed = True
+                return 0
+            except (OSError, ValueError, zlib.error, struct.error):
+                if replayed:
+                    raise RuntimeError(f"router: result cache entry {key[:12]} is corrupt; run `router cache clear`")
+        # Output is spooled to a temp file as it streams, so memory stays bounded; only
+        # successful runs within max_entry_bytes are moved into place.
+        writer = _EntryWriter(self._path(key), self.max_entry_bytes)
+        real_out, real_err = sys.stdout, sys.stderr
+        sys.stdout = _SpoolStream(real_out, writer, b"o")
+        sys.stderr = _SpoolStream(real_err, writer, b"e")
+        try:
+            rc = produce()
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            sys.stdout, sys.stderr = real_out, real_err
+        if rc != 0:
+            writer.abort()
+        elif writer.commit():
+            self._evict()
+        return rc
+
+
+def open_result_cache(
+    config: dict,
+    git_common_dir: Callable[[], str],
+    run_git: Callable[..., object] | None = None,
+) -> ResultCache | None:
+    """Return the repo's result cache, or None when disabled by config."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    cache_cfg = router_cfg.get("result_cache", {})
+    if not isinstance(cache_cfg, dict) or not cache_cfg.get("enabled", False):
+        return None
+    try:
+        max_bytes = int(cache_cfg.get("max_bytes", DEFAULT_MAX_BYTES))
+        max_entry_bytes = int(cache_cfg.get("max_entry_bytes", DEFAULT_MAX_ENTRY_BYTES))
+    except (TypeError, ValueError):
+        raise RuntimeError("router.result_cache.max_bytes/max_entry_bytes must be integers")
+    try:
+        common_dir = git_common_dir()
+    except RuntimeError:
+        # Outside a repository there is nothing immutable to cache; let git report the error.
+        return None
+    return ResultCache(Path(common_dir) / CACHE_DIR, max_bytes, max_entry_bytes, run_git)
+
+
+def run_cached(
+    command: str,
+    spec: str,
+    allow_single: bool,
+    config: dict,
+    options: dict,
+    produce: Callable[[], int],
+    result_cache: Callable[[dict], ResultCache | None] | None = None,
+    objects: Callable[[], object] | None = None,
+) -> int:
+    """Serve `produce` through the result cache when its revisions are pinned to commits."""
+    if result_cache is None or objects is None:
+        return produce()
+    cache = result_cache(config)
+    if cache is None:
+        return produce()
+    oids = resolve_range_oids(spec, objects().resolve, allow_single)
+    if oids is None:
+        return produce()
+    return cache.run(cache.key(command, oids, config, options), produce)
@@ -3,6 +3,8 @@ from __future__ import annotations
 
 from typing import Sequence
 
+from app.utils.exec_utils import ObjectServer
+
 
 class RuntimeContext:
     """Hold runtime config and helpers for router execution."""
@@ -10,6 +12,7 @@ class RuntimeContext:
     def __init__(self) -> None:
         """Initialize an empty runtime context."""
         self.config: dict | None = None
+        self.objects: ObjectServer | None = None
 
     def set_config(self, config: dict | None) -> None:
         """Set the active runtime configuration dict."""
@@ -19,6 +22,18 @@ class RuntimeContext:
         """Return the active runtime configuration dict."""
         return self.config
 
+    def get_objects(self) -> ObjectServer:
+        """Return the invocation's cat-file object server, starting it on demand."""
+        if self.objects is None:
+            self.objects = ObjectServer(self.record_resolved)
+        return self.objects
+
+    def close_objects(self) -> None:
+        """Stop the object server started for this invocation, if any."""
+        if self.objects is not None:
+            self.objects.close()
+            self.objects = None
+
     def record_resolved(self, tool: str, args: Sequence[str]) -> None:
         """Store a resolved command entry for logging."""
         runtime = self.get_config()
@@ -0,0 +1,369 @@
+"""Content-addressed spill files for oversized router output, paged by cursor id."""
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Callable
+
+SPILL_DIR = "router-spill"
+DEFAULT_THRESHOLD_BYTES = 1024 * 1024
+DEFAULT_PAGE_LINES = 400
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ID_CHARS = 16
+MIN_ID_CHARS = 6
+
+# File sections start at a `diff --git` header, or its compact `f <path|id>` form.
+_SECTION_RE = re.compile(rb"^(?:diff --git [^\n]*|f [^\n]+)$", re.M)
+# A blank line not followed by patch text closes a section (history separates commits this way).
+_BREAK_RE = re.compile(rb"\n\n(?![-+ @\\])")
+_PATH_TABLE_RE = re.compile(rb"^files\[\d+\]\{id,path\}:\n((?:  \d+,[^\n]*\n)*)", re.M)
+
+
+def _section_path(header: str, table: dict[str, str]) -> str:
+    """Return the file path a section header line refers to."""
+    if header.startswith("f "):
+        name = header[2:].strip()
+        return table.get(name, name)
+    parts = header.split()
+    if len(parts) < 4:
+        return ""
+    path = parts[3]
+    return path[2:] if path.startswith("b/") else path
+
+
+def _build_index(data: mmap.mmap | bytes) -> tuple[array, list[list]]:
+    """Return (line start offsets plus end offset, [path, first line, end line] per file section)."""
+    offsets = array("Q", [0])
+    pos = data.find(b"\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = data.find(b"\n", pos + 1)
+    if offsets[-1] != len(data):
+        offsets.append(len(data))
+    table: dict[str, str] = {}
+    for match in _PATH_TABLE_RE.finditer(data):
+        for row in match.group(1).decode("utf-8", "replace").splitlines():
+            number, _, path = row.strip().partition(",")
+            table[number] = path
+    starts: list[tuple[int, str]] = []
+    for match in _SECTION_RE.finditer(data):
+        line = _bisect(offsets, match.start())
+        starts.append((line, _section_path(match.group(0).decode("utf-8", "replace"), table)))
+    total = len(offsets) - 1
+    breaks = [_bisect(offsets, match.start() + 1) for match in _BREAK_RE.finditer(data)]
+    files: list[list] = []
+    for idx, (line, path) in enumerate(starts):
+        end = starts[idx + 1][0] if idx + 1 < len(starts) else total
+        cut = bisect_right(breaks, line)
+        if cut < len(breaks) and breaks[cut] < end:
+            end = breaks[cut]
+        files.append([path, line, end])
+    return offsets, files
+
+
+def _bisect(offsets: array, pos: int) -> int:
+    """Return the 0-based line containing byte `pos`."""
+    low, high = 0, len(offsets) - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if offsets[mid] <= pos:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class SpillFile:
+    """Read-only view of one spill: the output mmapped, plus its line and file indexes."""
+
+    __slots__ = ("spill_id", "meta", "_handle", "_data", "_index_handle", "_index", "_offsets")
+
+    def __init__(self, spill_id: str, out_path: Path, lines_path: Path, meta: dict) -> None:
+        """Map the output and line-offset files for random access."""
+        self.spill_id = spill_id
+        self.meta = meta
+        self._handle = out_path.open("rb")
+        self._data = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index_handle = lines_path.open("rb")
+        self._index = mmap.mmap(self._index_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = memoryview(self._index).cast("Q")
+
+    @property
+    def line_count(self) -> int:
+        """Return the number of lines in the spilled output."""
+        return len(self._offsets) - 1
+
+    def lines(self, start: int, count: int) -> str:
+        """Return `count` lines starting at 0-based line `start`."""
+        start = max(0, min(start, self.line_count))
+        end = max(start, min(start + count, self.line_count))
+        return self._data[self._offsets[start]:self._offsets[end]].decode("utf-8", "replace")
+
+    def files(self) -> list[list]:
+        """Return [path, first line, end line] for every indexed file section."""
+        return list(self.meta.get("files", []))
+
+    def close(self) -> None:
+        """Release the mappings and file handles."""
+        self._offsets.release()
+        self._index.close()
+        self._index_handle.close()
+        self._data.close()
+        self._handle.close()
+
+
+class SpillStore:
+    """Size-bounded (LRU) directory of spill files keyed by content hash."""
+
+    def __init__(self, root: str | Path, max_bytes: int) -> None:
+        """Point the store at a directory; nothing is created until first write."""
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def _paths(self, spill_id: str) -> tuple[Path, Path, Path]:
+        """Return the (output, line offsets, metadata) paths for a spill id."""
+        return (
+            self.root / f"{spill_id}.out",
+            self.root / f"{spill_id}.lines",
+            self.root / f"{spill_id}.json",
+        )
+
+    def new_file(self) -> tuple[Path, object]:
+        """Create and open a temporary output file inside the store."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"spill.{os.getpid()}.{id(self)}.tmp"
+        return path, path.open("wb")
+
+    def commit(self, tmp: Path, digest: str, command: str) -> str:
+        """Move a finished temp file into place under its content id and index it once."""
+        spill_id = digest[:ID_CHARS]
+        out_path, lines_path, meta_path = self._paths(spill_id)
+        if meta_path.exists():
+            # Same content already spilled: keep the existing files and refresh their age.
+            tmp.unlink()
+            for path in (out_path, lines_path, meta_path):
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+            return spill_id
+        os.replace(tmp, out_path)
+        with out_path.open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offsets, files = _build_index(data)
+            size = len(data)
+        lines_tmp = lines_path.with_name(f"{lines_path.name}.{os.getpid()}.tmp")
+        lines_tmp.write_bytes(offsets.tobytes())
+        os.replace(lines_tmp, lines_path)
+        meta = {"command": command, "sha256": digest, "bytes": size, "lines": len(offsets) - 1, "files": files}
+        meta_tmp = meta_path.with_name(f"{meta_path.name}.{os.getpid()}.tmp")
+        meta_tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(meta_tmp, meta_path)
+        self._evict(keep=spill_id)
+        return spill_id
+
+    def resolve(self, prefix: str) -> str:
+        """Return the full spill id for an id or unique prefix."""
+        prefix = prefix.strip().lower()
+        if len(prefix) < MIN_ID_CHARS or not re.fullmatch(r"[0-9a-f]+", prefix):
+            raise RuntimeError(f"router page: invalid cursor id '{prefix}'")
+        matches = sorted(path.stem for path in self.root.glob(f"{prefix}*.json")) if self.root.is_dir() else []
+        if not matches:
+            raise RuntimeError(f"router page: unknown or expired cursor id '{prefix}'")
+        if len(matches) > 1:
+            raise RuntimeError(f"router page: cursor id '{prefix}' is ambiguous")
+        return matches[0]
+
+    def open(self, prefix: str) -> SpillFile:
+        """Open a spill by id (or unique prefix) for paging."""
+        spill_id = self.resolve(prefix)
+        out_path, lines_path, meta_path = self._paths(spill_id)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            spill = SpillFile(spill_id, out_path, lines_path, meta)
+        except (OSError, ValueError) as exc:
+            raise RuntimeError(f"router page: cannot read spill '{spill_id}': {exc}")
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return spill
+
+    def _evict(self, keep: str) -> None:
+        """Delete the least recently used spills until the store fits max_bytes."""
+        spills: list[tuple[float, int, str]] = []
+        for meta_path in self.root.glob("*.json"):
+            spill_id = meta_path.stem
+            try:
+                mtime = meta_path.stat().st_mtime
+                size = sum(path.stat().st_size for path in self._paths(spill_id))
+            except OSError:
+                continue
+            spills.append((mtime, size, spill_id))
+        total = sum(size for _mtime, size, _id in spills)
+        for _mtime, size, spill_id in sorted(spills):
+            if total <= self.max_bytes:
+                break
+            if spill_id == keep:
+                continue
+            for path in reversed(self._paths(spill_id)):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+
+def _spill_cfg(config: dict) -> dict:
+    """Return the router.spill config section."""
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    spill_cfg = router_cfg.get("spill", {})
+    return spill_cfg if isinstance(spill_cfg, dict) else {}
+
+
+def page_lines(config: dict) -> int:
+    """Return router.spill.page_lines."""
+    try:
+        lines = int(_spill_cfg(config).get("page_lines", DEFAULT_PAGE_LINES))
+    except (TypeError, ValueError):
+        raise RuntimeError("router.spill.page_lines must be an integer")
+    if lines < 1:
+        raise RuntimeError("router.spill.page_lines must be positive")
+    return lines
+
+
+def open_spill_store(config: dict, git_common_dir: Callable[[], str], require_enabled: bool = True) -> SpillStore | None:
+    """Return the repo's spill store, or None when disabled by config or outside a repo."""
+    spill_cfg = _spill_cfg(config)
+    if require_enabled and not spill_cfg.get("enabled", False):
+        return None
+    try:
+        max_bytes = int(spill_cfg.get("max_bytes", DEFAULT_MAX_BYTES))
+    except (TypeError, ValueError):
+        raise RuntimeError("router.spill.max_bytes must be an integer")
+    try:
+        common_dir = git_common_dir()
+    except RuntimeError:
+        return None
+    return SpillStore(Path(common_dir) / SPILL_DIR, max_bytes)
+
+
+class SpillStream:
+    """Stream output through until it outgrows the threshold, then move the rest to a spill file."""
+
+    def __init__(self, stream, store: SpillStore, threshold: int) -> None:
+        """Wrap `stream`; nothing touches disk until the output outgrows `threshold` bytes."""
+        self.stream = stream
+        self.store = store
+        self.threshold = threshold
+        self.passing = True
+        self.lines_out = 0
+        self.shown_bytes = 0
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.everything: list[bytes] = []
+        self.tmp: Path | None = None
+        self.handle = None
+
+    def write(self, data: str) -> int:
+        """Pass output through up to the line crossing the threshold and keep all of it for a possible spill."""
+        if not data:
+            return 0
+        raw = data.encode("utf-8", "replace")
+        before = self.size
+        self.digest.update(raw)
+        self.size += len(raw)
+        if self.handle is not None:
+            self.handle.write(raw)
+        else:
+            self.everything.append(raw)
+        if self.passing:
+            cut = len(raw)
+            if self.size > self.threshold:
+                # Finish the line holding the last byte under the threshold; the rest is only in the spill.
+                pos = raw.find(b"\n", max(0, self.threshold - before - 1))
+                if pos != -1:
+                    cut = pos + 1
+                    self.passing = False
+            head = raw[:cut]
+            self.stream.write(head.decode("utf-8", "replace"))
+            self.lines_out += head.count(b"\n")
+            self.shown_bytes += len(head)
+        if self.handle is None and self.size > self.threshold:
+            self.tmp, self.handle = self.store.new_file()
+            for chunk in self.everything:
+                self.handle.write(chunk)
+            self.everything.clear()
+        return len(data)
+
+    def flush(self) -> None:
+        """Flush the wrapped stream."""
+        self.stream.flush()
+
+    def finish(self, rc: int, command: str) -> None:
+        """Write out the rest, or store the spill and print its cursor line."""
+        if self.handle is None or rc != 0 or self.passing:
+            # Small or failed runs, and output whose last line never ended, are not paged.
+            self.abort()
+            return
+        self.handle.close()
+        spill_id = self.store.commit(self.tmp, self.digest.hexdigest(), command)
+        spill = self.store.open(spill_id)
+        try:
+            total = spill.line_count
+        finally:
+            spill.close()
+        shown = min(self.lines_out, total)
+        self.stream.write(
+            f"cursor: {spill_id} lines 1-{shown} of {total} ({self.size} bytes); "
+            f"next: router page {spill_id} --from {shown + 1}\n"
+        )
+
+    def abort(self) -> None:
+        """Write whatever was not passed through yet and drop any temp file."""
+        if self.handle is None:
+            return
+        self.handle.close()
+        with self.tmp.open("rb") as handle:
+            handle.seek(self.shown_bytes)
+            self.stream.write(handle.read().decode("utf-8", "replace"))
+        self.tmp.unlink()
+
+
+def run_spilled(
+    command: str,
+    config: dict,
+    produce: Callable[[], int],
+    spill_store: Callable[[dict], SpillStore | None] | None = None,
+) -> int:
+    """Run `produce`, paging its stdout through the spill store when it outgrows the threshold."""
+    if spill_store is None:
+        return produce()
+    spill_cfg = _spill_cfg(config)
+    if not spill_cfg.get("enabled", False):
+        return produce()
+    try:
+        threshold = int(spill_cfg.get("threshold_bytes", DEFAULT_THRESHOLD_BYTES))
+    except (TypeError, ValueError):
+        raise RuntimeError("router.spill.threshold_bytes must be an integer")
+    store = spill_store(config)
+    if store is None:
+        return produce()
+    real_out = sys.stdout
+    spill = SpillStream(real_out, store, threshold)
+    sys.stdout = spill
+    try:
+        rc = produce()
+    except BaseException:
+        sys.stdout = real_out
+        spill.abort()
+        raise
+    sys.stdout = real_out
+    spill.finish(rc, command)
+    return rc
@@ -0,0 +1,189 @@
+"""Token counting: cached tiktoken encoders, local BPE files, and a calibrated estimator."""
+from __future__ import annotations
+
+import os
+import re
+import sys
+from pathlib import Path
+
+DEFAULT_ENCODING = "cl100k_base"
+BPE_DIR_ENV = "ROUTER_TIKTOKEN_BPE_DIR"
+
+# On multi-core hosts, texts at least this long are split at file/hunk/commit
+# boundaries into up to BATCH_SLICES contiguous slices and encoded with
+# encode_ordinary_batch (tiktoken encodes the batch on a thread pool).
+BATCH_MIN_CHARS = 256 * 1024
+BATCH_SLICES = 8
+
+# A newline followed by one of these starts a new BPE pre-token for the
+# cl100k/o200k patterns, so per-chunk counts add up to the whole-text count.
+_CHUNK_SPLIT_RE = re.compile(r"(?<=\n)(?=diff --git |@@ |commit )")
+
+# Estimator features: letter runs, letters, digit groups, punctuation runs,
+# punctuation chars, newline runs, indentation runs, non-ASCII chars.
+_FEATURE_RES = (
+    re.compile(r"[A-Za-z]+"),
+    re.compile(r"[A-Za-z]"),
+    re.compile(r"\d{1,3}"),
+    re.compile(r"[^\sA-Za-z0-9]+"),
+    re.compile(r"[^\sA-Za-z0-9]"),
+    re.compile(r"\n+"),
+    re.compile(r"[^\S\n]{2,}"),
+    re.compile(r"[^\x00-\x7f]"),
+)
+
+# Least-squares fits against exact counts over hunk-sized chunks of the
+# benchmark_history_compaction outputs; whole outputs land within about 3%.
+_ESTIMATOR_COEFFS = {
+    "cl100k_base": (0.3827, 0.1295, 1.3727, 0.6904, 0.2114, -0.6125, 1.1641, 1.3961),
+    "o200k_base": (0.4643, 0.1127, 1.3240, 0.6588, 0.2194, -0.4202, 1.1182, 1.0678),
+}
+
+# Split pattern, special tokens and ranks-file sha256 per encoding, as published
+# with tiktoken, for building encoders from a local `<encoding>.tiktoken` file.
+_LOCAL_ENCODINGS = {
+    "cl100k_base": (
+        r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s""",
+        {
+            "<|endoftext|>": 100257,
+            "<|fim_prefix|>": 100258,
+            "<|fim_middle|>": 100259,
+            "<|fim_suffix|>": 100260,
+            "<|endofprompt|>": 100276,
+        },
+        "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+    ),
+    "o200k_base": (
+        "|".join(
+            [
+                r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+                r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+                r"""\p{N}{1,3}""",
+                r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+                r"""\s*[\r\n]+""",
+                r"""\s+(?!\S)""",
+                r"""\s+""",
+            ]
+        ),
+        {"<|endoftext|>": 199999, "<|endofprompt|>": 200018},
+        "446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d",
+    ),
+}
+
+# (encoding, bpe file) -> Encoding, or None when exact counting is unavailable.
+_ENCODERS: dict[tuple[str, str], object | None] = {}
+
+
+def _token_cfg(config: dict | None) -> dict:
+    """Return the router.token_counting config section."""
+    if not isinstance(config, dict):
+        return {}
+    router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+    token_cfg = router_cfg.get("token_counting", {})
+    return token_cfg if isinstance(token_cfg, dict) else {}
+
+
+def _bpe_file(encoding: str, config: dict | None) -> Path | None:
+    """Return the local `<encoding>.tiktoken` file to load, if one is configured."""
+    bpe_dir = str(_token_cfg(config).get("bpe_dir", "") or os.environ.get(BPE_DIR_ENV, "")).strip()
+    if not bpe_dir:
+        return None
+    path = Path(bpe_dir).expanduser()
+    if not path.is_absolute() and isinstance(config, dict):
+        runtime = config.get("_runtime", {}) if isinstance(config.get("_runtime"), dict) else {}
+        config_path = str(runtime.get("config_path", "")).strip()
+        if config_path:
+            path = Path(config_path).parent / path
+    path = path / f"{encoding}.tiktoken"
+    return path if path.is_file() else None
+
+
+def _load_encoding(encoding: str, bpe_file: Path | None):
+    """Build a tiktoken Encoding, reading BPE ranks from `bpe_file` instead of the network."""
+    import tiktoken  # type: ignore
+
+    if bpe_file is None:
+        return tiktoken.get_encoding(encoding)
+    from tiktoken.load import load_tiktoken_bpe  # type: ignore
+
+    spec = _LOCAL_ENCODINGS.get(encoding)
+    if spec is None:
+        raise ValueError(f"router token counting: no local BPE support for encoding '{encoding}'")
+    pat_str, special_tokens, expected_hash = spec
+    # The published hash is still checked, so a wrong or truncated file is reported, not used.
+    ranks = load_tiktoken_bpe(str(bpe_file), expected_hash=expected_hash)
+    return tiktoken.Encoding(name=encoding, pat_str=pat_str, mergeable_ranks=ranks, special_tokens=special_tokens)
+
+
+def get_encoder(encoding: str = DEFAULT_ENCODING, config: dict | None = None):
+    """Return a memoized tiktoken encoder, or None when tiktoken or its BPE data is unavailable."""
+    encoding = encoding or DEFAULT_ENCODING
+    bpe_file = _bpe_file(encoding, config)
+    key = (encoding, str(bpe_file or ""))
+    if key not in _ENCODERS:
+        try:
+            _ENCODERS[key] = _load_encoding(encoding, bpe_file)
+        except (ImportError, OSError):
+            # No tiktoken, or no network to fetch the BPE file.
+            _ENCODERS[key] = None
+        except ValueError as exc:
+            # An unknown encoding name, or a local BPE file that fails its hash check:
+            # a config problem, so say which setting to fix, then estimate.
+            sys.stderr.write(
+                f"router: token counting falls back to estimates ({exc}); "
+                f"check the configured encoding '{encoding}' and router.token_counting.bpe_dir\n"
+            )
+            _ENCODERS[key] = None
+    return _ENCODERS[key]
+
+
+def exact_tokens_available(encoding: str = DEFAULT_ENCODING, config: dict | None = None) -> bool:
+    """Return True when `count_tokens` will return exact counts."""
+    return get_encoder(encoding, config) is not None
+
+
+def estimate_tokens(text: str, encoding: str = DEFAULT_ENCODING) -> int:
+    """Estimate the token count of `text` from character-class counts (no tiktoken needed)."""
+    if not text:
+        return 0
+    coeffs = _ESTIMATOR_COEFFS.get(encoding, _ESTIMATOR_COEFFS[DEFAULT_ENCODING])
+    total = 0.0
+    for pattern, coeff in zip(_FEATURE_RES, coeffs):
+        total += coeff * len(pattern.findall(text))
+    return max(1, round(total))
+
+
+def count_tokens_batch(texts: list[str], encoding: str = DEFAULT_ENCODING, config: dict | None = None) -> list[int]:
+    """Return a token count per text, batching exact encodes when tiktoken is available."""
+    encoder = get_encoder(encoding, config)
+    if encoder is None:
+        return [estimate_tokens(text, encoding) for text in texts]
+    return [len(tokens) for tokens in encoder.encode_ordinary_batch(texts)]
+
+
+def count_tokens(text: str, encoding: str = DEFAULT_ENCODING, config: dict | None = None) -> int:
+    """Count tokens exactly when possible, otherwise return the calibrated estimate."""
+    if not text:
+        return 0
+    encoder = get_encoder(encoding, config)
+    if encoder is None:
+        return estimate_tokens(text, encoding)
+    slices = min(BATCH_SLICES, os.cpu_count() or 1)
+    if len(text) < BATCH_MIN_CHARS or slices < 2:
+        return len(encoder.encode_ordinary(text))
+    return sum(count_tokens_batch(_split_slices(text, slices), encoding, config))
+
+
+def _split_slices(text: str, slices: int) -> list[str]:
+    """Split text at pre-token-safe boundaries into about `slices` similar-sized pieces."""
+    target = max(1, len(text) // slices)
+    pieces: list[str] = []
+    start = 0
+    for match in _CHUNK_SPLIT_RE.finditer(text, target):
+        cut = match.start()
+        if cut - start < target:
+            continue
+        pieces.append(text[start:cut])
+        start = cut
+    pieces.append(text[start:])
+    return pieces
@@ -0,0 +1,179 @@
+"""Cursor-based paging over git's revision walk for `router log` and `router history`.
+
+A page walks at most a page's worth of commits from the previous page's
+frontier: the commits git had queued but not yet shown (the parents of shown
+commits, rewritten past commits the pathspecs skip). The cursor carries that
+frontier, the last oid shown, and the range's negative refs, so every page
+costs the same however deep into history it starts.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import zlib
+from typing import Callable
+
+DEFAULT_PAGE_SIZE = 50
+CURSOR_VERSION = "w1"
+# Filtered pages (subject search, diff filters) walk this many commits per step.
+_FILTER_CHUNK_MIN = 64
+_FIELD_MARK = "\x1f"
+_COMMIT_MARK = "\x1e"
+
+
+def _run(run_git: Callable[..., object], args: list[str]):
+    """Run git capturing text output."""
+    return run_git(args, check=False, capture_output=True, text=True, encoding="utf-8", errors="replace")
+
+
+def page_size_setting(config: dict, page_size: int | None, command: str) -> int:
+    """Return `--page-size`, else router.page_size."""
+    if page_size is None:
+        router_cfg = config.get("router", {}) if isinstance(config.get("router"), dict) else {}
+        try:
+            page_size = int(router_cfg.get("page_size", DEFAULT_PAGE_SIZE))
+        except (TypeError, ValueError):
+            raise RuntimeError("router.page_size must be an integer")
+    if page_size < 1:
+        raise RuntimeError(f"router {command}: --page-size must be positive")
+    return page_size
+
+
+def validate_paging(count: int | None, since: str, rev_range: str, after_cursor: str, command: str) -> None:
+    """Reject flags that conflict with paging (`--page-size` / `--after-cursor`)."""
+    if count is not None:
+        raise RuntimeError(f"router {command}: use either --n or --page-size/--after-cursor, not both")
+    if after_cursor and (since or rev_range):
+        raise RuntimeError(f"router {command}: --after-cursor already carries the range; drop --since/--range")
+
+
+def encode_cursor(last: str, frontier: list[str], negatives: list[str]) -> str:
+    """Pack the walk state into an opaque, URL-safe token."""
+    payload = ";".join([CURSOR_VERSION, last, ",".join(frontier), ",".join(negatives)])
+    return base64.urlsafe_b64encode(zlib.compress(payload.encode("ascii"), 9)).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[str, list[str], list[str]] | None:
+    """Unpack (last oid, frontier, negatives) from a cursor token, or None when it is not one."""
+    try:
+        payload = zlib.decompress(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))).decode("ascii")
+    except (binascii.Error, ValueError, zlib.error, UnicodeDecodeError):
+        return None
+    fields = payload.split(";")
+    if len(fields) != 4 or fields[0] != CURSOR_VERSION:
+        return None
+    return fields[1], [oid for oid in fields[2].split(",") if oid], [oid for oid in fields[3].split(",") if oid]
+
+
+def _resolve_tips(
+    run_git: Callable[..., object],
+    tips: list[str],
+    negatives: list[str],
+    pathspecs: list[str],
+) -> list[str]:
+    """Replace each tip with the first commit a pathspec-limited walk from it shows.
+
+    A tip that leaves the paths untouched is never shown, so it would stay on
+    the frontier forever; git simplifies it to that first shown commit.
+    """
+    if not pathspecs:
+        return tips
+    resolved: list[str] = []
+    for tip in tips:
+        args = ["log", "--max-count=1", "--format=%H", tip]
+        if negatives:
+            args.extend(["--not", *negatives])
+        proc = _run(run_git, [*args, "--", *pathspecs])
+        oid = (proc.stdout or "").strip()
+        if oid and oid not in resolved:
+            resolved.append(oid)
+    return resolved
+
+
+def start_walk(
+    run_git: Callable[..., object],
+    rev_args: list[str],
+    after_cursor: str,
+    pathspecs: list[str],
+    command: str,
+) -> tuple[list[str], list[str]]:
+    """Return the (frontier, negatives) a page walk starts from.
+
+    Without a cursor the frontier is the range's positive endpoints (HEAD by
+    default). A cursor restores its saved state; a plain commit instead
+    resumes from that commit's parents (exact for linear history only).
+    """
+    if after_cursor:
+        state = decode_cursor(after_cursor)
+        if state is not None:
+            return state[1], state[2]
+        proc = _run(run_git, ["rev-parse", "--verify", "-q", f"{after_cursor}^{{commit}}"])
+        if proc.returncode != 0 or not proc.stdout.strip():
+            raise RuntimeError(f"router {command}: --after-cursor is neither a cursor nor a commit")
+        parents = _run(run_git, ["rev-parse", f"{proc.stdout.strip()}^@"])
+        return _resolve_tips(run_git, (parents.stdout or "").split(), [], pathspecs), []
+    revisions = [arg for arg in rev_args if not arg.startswith("-")] or ["HEAD"]
+    proc = _run(run_git, ["rev-parse", "--revs-only", *revisions])
+    if proc.returncode != 0:
+        raise RuntimeError((proc.stderr or "").strip() or f"router {command}: unknown revision")
+    lines = (proc.stdout or "").split()
+    negatives = [line[1:] for line in lines if line.startswith("^")]
+    tips = [line for line in lines if not line.startswith("^")]
+    return _resolve_tips(run_git, tips, negatives, pathspecs), negatives
+
+
+def walk_page(
+    run_git: Callable[..., object],
+    frontier: list[str],
+    negatives: list[str],
+    pathspecs: list[str],
+    page_size: int,
+    keep: Callable[[list[tuple[str, str]]], set[str]] | None = None,
+) -> tuple[list[str], str | None]:
+    """Walk one page from `frontier`; returns its oids and the next cursor (None at the end).
+
+    git walks with `--parents` so that pathspec-limited walks report
+    rewritten parents, which keeps every frontier commit one git shows.
+    `--date-order` never shows a parent before all of its children, so no
+    shown commit is reachable from the frontier and later pages cannot repeat
+    it; git's default order can when timestamps tie or are skewed. `keep`
+    filters walked (oid, subject) pairs for options that hide commits without
+    pruning the walk (subject search, diff filters); without it one extra
+    commit is walked to tell whether another page exists.
+    """
+    pending = dict.fromkeys(frontier)
+    popped: set[str] = set()
+    page: list[str] = []
+    last = ""
+    while pending:
+        limit = page_size + 1 if keep is None else max(page_size * 4, _FILTER_CHUNK_MIN)
+        args = ["log", "--parents", "--date-order", f"--max-count={limit}", "--format=%x1e%H%x1f%P%x1f%s", *pending]
+        if negatives:
+            args.extend(["--not", *negatives])
+        proc = _run(run_git, [*args, "--", *pathspecs])
+        if proc.returncode != 0:
+            raise RuntimeError((proc.stderr or "").strip() or "router: git log failed while paging")
+        walked: list[tuple[str, list[str], str]] = []
+        for chunk in (proc.stdout or "").split(_COMMIT_MARK)[1:]:
+            oid, parents, subject = chunk.rstrip("\n").split(_FIELD_MARK, 2)
+            walked.append((oid, parents.split(), subject))
+        kept = keep([(oid, subject) for oid, _, subject in walked]) if keep is not None and walked else None
+        for oid, parents, _ in walked:
+            if len(page) == page_size:
+                return page, encode_cursor(last, list(pending), negatives)
+            if oid in popped:
+                continue
+            pending.pop(oid, None)
+            popped.add(oid)
+            for parent in parents:
+                if parent not in popped:
+                    pending.setdefault(parent)
+            last = oid
+            if kept is None or oid in kept:
+                page.append(oid)
+        if len(walked) < limit:
+            # The walk ran out; what is left pending lies outside the range.
+            return page, None
+        if len(page) == page_size:
+            return page, encode_cursor(last, list(pending), negatives)
+    return page, None
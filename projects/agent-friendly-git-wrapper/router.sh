@@ -8,4 +8,10 @@ if [[ ! -x "${PYTHON_BIN}" ]]; then
   PYTHON_BIN="python3"
 fi
 
-exec "${PYTHON_BIN}" "${REPO_ROOT}/app/main.py" router "$@"
+if [[ "${1:-}" == "daemon" ]]; then
+  exec "${PYTHON_BIN}" "${REPO_ROOT}/app/main.py" "$@"
+fi
+
+# The thin client forwards to a running router daemon and falls back to
+# running the router in-process when none is listening.
+exec "${PYTHON_BIN}" "${REPO_ROOT}/app/cli/router_client.py" "$@"
@@ -16,6 +16,7 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from app.compact import compact as compact_mod  # noqa: E402
+from app.utils import tokens as tokens_mod  # noqa: E402
 
 
 def _iter_case_dirs() -> list[Path]:
@@ -58,8 +59,11 @@ def _build_table(variants: list[dict], case_dir: Path) -> str:
         if not output_path.exists():
             raise FileNotFoundError(f"Missing output file: {output_path}")
         text = output_path.read_text(encoding="utf-8")
-        if compact_mod.tiktoken is None:
-            raise RuntimeError("tiktoken is required for benchmark tests.")
+        if not tokens_mod.exact_tokens_available("cl100k_base"):
+            raise RuntimeError(
+                "tiktoken with cl100k_base BPE data is required for benchmark tests "
+                f"(offline hosts: set {tokens_mod.BPE_DIR_ENV} to a directory holding cl100k_base.tiktoken)."
+            )
         chars = int(compact_mod._measure_text(text, "chars", "cl100k_base"))
         tokens = int(compact_mod._measure_text(text, "tokens", "cl100k_base"))
         outputs[name] = {"chars": chars, "tokens": tokens}
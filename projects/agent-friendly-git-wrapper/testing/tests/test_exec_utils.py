@@ -0,0 +1,77 @@
+"""Tests for git process helpers in exec_utils."""
+from __future__ import annotations
+
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.utils.exec_utils import ObjectServer, run_many  # noqa: E402
+
+
+def _run(cmd: list[str], cwd: Path) -> str:
+    """Run a subprocess command for test setup and return stdout."""
+    proc = subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
+    return proc.stdout.strip()
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Initialize a git repo with a starter commit."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    (repo_dir / "sample.txt").write_text("Hello\n", encoding="utf-8")
+    _run(["git", "add", "sample.txt"], repo_dir)
+    _run(["git", "commit", "-m", "initial"], repo_dir)
+
+
+def test_object_server_lookups(tmp_path, monkeypatch) -> None:
+    """Answer resolve/verify/blob lookups from one cat-file process."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    head = _run(["git", "rev-parse", "HEAD"], tmp_path)
+
+    started: list[list[str]] = []
+    server = ObjectServer(lambda _tool, args: started.append(list(args)))
+    try:
+        assert server.resolve("main") == head
+        assert server.info("HEAD") == (head, "commit", server.info(head)[2])
+        assert server.verify_ref("refs/heads/main")
+        assert not server.verify_ref("refs/heads/missing")
+        assert not server.verify_ref("main")
+        assert not server.exists("does-not-exist")
+        assert server.read_blob("HEAD:sample.txt") == b"Hello\n"
+        assert server.read_blob("HEAD:missing.txt") is None
+        assert server.resolve("HEAD") == head
+        with pytest.raises(RuntimeError):
+            server.resolve("does-not-exist")
+    finally:
+        server.close()
+    assert len(started) == 1
+
+
+def test_run_many_keeps_order_and_failures(tmp_path, monkeypatch) -> None:
+    """Return concurrent results in request order without raising on failures."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    recorded: list[list[str]] = []
+    results = run_many(
+        [["rev-parse", "HEAD"], ["rev-parse", "missing-ref"], ["rev-parse", "--abbrev-ref", "HEAD"]],
+        lambda _tool, args: recorded.append(list(args)),
+        lambda: None,
+    )
+    assert [proc.returncode == 0 for proc in results] == [True, False, True]
+    assert results[0].stdout.strip() == _run(["git", "rev-parse", "HEAD"], tmp_path)
+    assert results[2].stdout.strip() == "main"
+    assert len(recorded) == 3
@@ -15,6 +15,7 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from app.cli import router_cli  # noqa: E402
+from app.commands import branch_cmd  # noqa: E402
 
 try:
     import yaml  # type: ignore
@@ -180,3 +181,122 @@ def test_router_branch_cases(tmp_path, monkeypatch, capsys) -> None:
             assert line in output.out
 
 
+
+
+def test_branch_bulk_delete_reports_per_branch(tmp_path, monkeypatch) -> None:
+    """Delete branches in one transaction and report moved refs as failed."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    for name in ("stale-a", "stale-b", "moved"):
+        _run(["git", "branch", name], tmp_path)
+    _run(["git", "config", "branch.stale-a.remote", "origin"], tmp_path)
+    head = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=tmp_path, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+    calls: list[list[str]] = []
+
+    def run_git(args, **kwargs):
+        """Run git and record each invocation."""
+        calls.append(list(args))
+        return subprocess.run(["git", *args], **kwargs)
+
+    results = branch_cmd._delete_branches(
+        [("stale-a", head), ("moved", "1" * 40), ("stale-b", head)],
+        run_git,
+    )
+    assert results == {"stale-a": True, "moved": False, "stale-b": True}
+    remaining = subprocess.run(
+        ["git", "for-each-ref", "--format=%(refname:short)", "refs/heads"],
+        cwd=tmp_path,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    assert remaining == ["main", "moved"]
+    assert len([call for call in calls if call[:1] == ["update-ref"]]) == 2
+    config = subprocess.run(["git", "config", "--get-regexp", "^branch\\."], cwd=tmp_path, capture_output=True, text=True)
+    assert "stale-a" not in config.stdout
+
+
+def test_branch_fetch_ttl_skips_recent_fetch(tmp_path, monkeypatch, capsys) -> None:
+    """Skip fetches within the TTL and force one with --fetch."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _init_repo(repo)
+    _setup_remote(repo, tmp_path / "remote.git")
+    other = tmp_path / "other"
+    _run(["git", "clone", str(tmp_path / "remote.git"), str(other)], tmp_path)
+    monkeypatch.chdir(repo)
+
+    config = _merge_dict(
+        _load_config(PROJECT_ROOT / "config" / "cli_router.yaml"),
+        {"branch_hygiene": {"fetch_before": True, "fetch_ttl_seconds": 300}},
+    )
+    config["router"]["custom_commands_file"] = str(PROJECT_ROOT / "config" / "cli_router_custom_commands.yaml")
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config, sort_keys=False), encoding="utf-8")
+
+    def remote_refs() -> list[str]:
+        """List remote-tracking refs in the test repo."""
+        proc = subprocess.run(
+            ["git", "for-each-ref", "--format=%(refname:short)", "refs/remotes/origin"],
+            cwd=repo,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        return proc.stdout.split()
+
+    assert router_cli.run(["--config", str(config_path), "branch", "sync-report"]) == 0
+    assert (repo / ".git" / "router-fetch-state.json").exists()
+
+    _run(["git", "push", "origin", "refs/remotes/origin/main:refs/heads/late"], other)
+    assert router_cli.run(["--config", str(config_path), "branch", "sync-report"]) == 0
+    assert "origin/late" not in remote_refs()
+
+    assert router_cli.run(["--config", str(config_path), "branch", "sync-report", "--fetch"]) == 0
+    assert "origin/late" in remote_refs()
+    capsys.readouterr()
+
+
+def test_branch_cleanup_requires_head_or_upstream_merge(tmp_path, monkeypatch, capsys) -> None:
+    """Keep `git branch -d`'s rule: merged into the base alone does not allow a delete."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    _run(["git", "branch", "develop"], tmp_path)
+    _checkout(tmp_path, "feature", create=True)
+    _commit_change(tmp_path, "feature change", "Feature\n")
+    _run(["git", "branch", "tracked"], tmp_path)
+    _checkout(tmp_path, "develop")
+    _run(["git", "merge", "--no-ff", "feature", "-m", "merge feature"], tmp_path)
+    _run(["git", "branch", "--set-upstream-to=develop", "tracked"], tmp_path)
+    _checkout(tmp_path, "main")
+
+    config = _merge_dict(
+        _load_config(PROJECT_ROOT / "config" / "cli_router.yaml"),
+        {"branch_hygiene": {"fetch_before": False, "protected_branches": [], "protected_patterns": []}},
+    )
+    config["router"]["custom_commands_file"] = str(PROJECT_ROOT / "config" / "cli_router_custom_commands.yaml")
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config, sort_keys=False), encoding="utf-8")
+
+    assert router_cli.run(["--config", str(config_path), "branch", "cleanup-merged", "--base", "develop", "--apply"]) == 0
+    out = capsys.readouterr().out
+    # feature is only merged into develop, not into HEAD (main); tracked is merged into its upstream.
+    assert "  cleanup: skip-unmerged-head feature\n" in out
+    assert "  cleanup: deleted tracked\n" in out
+    remaining = subprocess.run(
+        ["git", "for-each-ref", "--format=%(refname:short)", "refs/heads"],
+        cwd=tmp_path,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    assert remaining == ["develop", "feature", "main"]
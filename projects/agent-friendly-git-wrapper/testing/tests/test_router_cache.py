@@ -0,0 +1,195 @@
+"""Tests for the immutable-commit result cache."""
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.commands.cache_cmd import dispatch_cache  # noqa: E402
+from app.commands.history_cmd import dispatch_history  # noqa: E402
+from app.commands.show_cmd import dispatch_show  # noqa: E402
+from app.utils.exec_utils import ObjectServer, run_git  # noqa: E402
+from app.utils.result_cache import ResultCache  # noqa: E402
+
+
+def _run(cmd: list[str], cwd: Path) -> None:
+    """Run a subprocess command for test setup."""
+    subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Initialize a git repo with a starter commit."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    (repo_dir / "sample.txt").write_text("Hello\n", encoding="utf-8")
+    _run(["git", "add", "sample.txt"], repo_dir)
+    _run(["git", "commit", "-m", "initial"], repo_dir)
+
+
+def _commit(repo_dir: Path, text: str) -> None:
+    """Append a line to sample.txt and commit it."""
+    with (repo_dir / "sample.txt").open("a", encoding="utf-8") as handle:
+        handle.write(text + "\n")
+    _run(["git", "commit", "-am", text], repo_dir)
+
+
+def test_result_cache_replays_without_git(tmp_path, monkeypatch, capsys) -> None:
+    """Serve repeat show/history requests from the cache and miss when HEAD moves."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    calls: list[list[str]] = []
+
+    def _counting_git(args, **kwargs):
+        """Record git invocations made by the handlers."""
+        calls.append(list(args))
+        return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+    cache = ResultCache(tmp_path / ".git" / "router-cache", 1024 * 1024, 64 * 1024)
+    server = ObjectServer(lambda _tool, _args: None)
+    config = {"router": {"history_default_patch": True}}
+    try:
+        assert dispatch_show(["HEAD", "--stat"], config, _counting_git, lambda: server, lambda _cfg: cache) == 0
+        first = capsys.readouterr().out
+        assert dispatch_show(["HEAD", "--stat"], config, _counting_git, lambda: server, lambda _cfg: cache) == 0
+        assert capsys.readouterr().out == first
+        assert len(calls) == 1
+
+        # --no-cache always runs git.
+        dispatch_show(["HEAD", "--stat", "--no-cache"], config, _counting_git, lambda: server, lambda _cfg: cache)
+        capsys.readouterr()
+        assert len(calls) == 2
+
+        dispatch_history(["--n", "1"], config, _counting_git, None, lambda: server, lambda _cfg: cache)
+        dispatch_history(["--n", "1"], config, _counting_git, None, lambda: server, lambda _cfg: cache)
+        assert len(calls) == 3
+        capsys.readouterr()
+    finally:
+        server.close()
+
+    # A new commit changes the resolved HEAD oid, so the old entry is not reused.
+    _commit(tmp_path, "second")
+    server = ObjectServer(lambda _tool, _args: None)
+    try:
+        dispatch_history(["--n", "1"], config, _counting_git, None, lambda: server, lambda _cfg: cache)
+        assert "second" in capsys.readouterr().out
+        assert len(calls) == 4
+    finally:
+        server.close()
+
+    assert dispatch_cache(["stats"], config, lambda _cfg: cache) == 0
+    stats = capsys.readouterr().out
+    assert "entries: 3" in stats
+    assert "hits: 2" in stats
+    assert dispatch_cache(["clear"], config, lambda _cfg: cache) == 0
+    assert "cleared entries=3" in capsys.readouterr().out
+    with pytest.raises(RuntimeError):
+        dispatch_cache(["bogus"], config, lambda _cfg: cache)
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path) -> None:
+    """Keep the cache under max_bytes by dropping the oldest entries first."""
+    cache = ResultCache(tmp_path / "router-cache", 1000, 64 * 1024)
+    keys = [f"{idx:02d}" + "0" * 62 for idx in range(5)]
+    for idx, key in enumerate(keys):
+        cache.put(key, os.urandom(300).hex())
+        # Pin mtimes so recency does not depend on filesystem timestamp resolution.
+        os.utime(cache._path(key), (idx + 1, idx + 1))
+    stats = cache.stats()
+    assert 0 < stats["bytes"] <= 1000
+    assert cache.get(keys[-1]) is not None
+    assert cache.get(keys[0]) is None
+
+
+def test_result_cache_spools_output_to_disk(tmp_path, monkeypatch, capsys) -> None:
+    """Spool output to a temp file while it streams; keep only successful runs within max_entry_bytes."""
+    cache = ResultCache(tmp_path / "router-cache", 1024 * 1024, 1000)
+    seen: list[list[str]] = []
+
+    def _produce(lines: int, rc: int = 0):
+        """Return a producer writing `lines` lines, recording the spool files present mid-run."""
+        def _run_it() -> int:
+            """Write the lines and a warning."""
+            for idx in range(lines):
+                sys.stdout.write(f"line {idx}\n")
+            sys.stderr.write("warning\n")
+            seen.append(sorted(path.name for path in cache.root.rglob("*.tmp")))
+            return rc
+        return _run_it
+
+    key = "ab" + "0" * 62
+    assert cache.run(key, _produce(20)) == 0
+    expected = "".join(f"line {idx}\n" for idx in range(20))
+    assert capsys.readouterr() == (expected, "warning\n")
+    assert seen[-1] == [f"{key}.{os.getpid()}.tmp"]
+    assert cache.read(key) == {"stdout": expected, "stderr": "warning\n"}
+    # Replay streams the frames back without running the producer.
+    assert cache.run(key, _produce(0, rc=1)) == 0
+    assert capsys.readouterr() == (expected, "warning\n")
+    assert len(seen) == 1
+
+    # Past max_entry_bytes the spool is dropped mid-run; failed runs are not kept either.
+    for other, lines, rc in (("cd" + "0" * 62, 200, 0), ("ef" + "0" * 62, 5, 1)):
+        assert cache.run(other, _produce(lines, rc)) == rc
+        assert capsys.readouterr().out.count("\n") == lines
+        assert cache.get(other) is None
+    assert seen[1] == []
+    assert not list(cache.root.rglob("*.tmp"))
+
+    # Counters are replaced atomically, never left half-written.
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 5)
+    monkeypatch.setattr(os, "replace", lambda *_args: (_ for _ in ()).throw(OSError("read-only")))
+    cache.get(key)
+    assert cache.stats()["hits"] == 1
+    assert not list(cache.root.glob("*.tmp"))
+
+
+def test_result_cache_keys_cover_cwd_and_git_config(tmp_path, monkeypatch, capsys) -> None:
+    """Never replay output across cwds (pathspecs are cwd-relative) or output-changing git config."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    (tmp_path / "e").mkdir()
+    (tmp_path / "e" / "f0.txt").write_text("nested\n", encoding="utf-8")
+    _run(["git", "add", "-A"], tmp_path)
+    _run(["git", "commit", "-m", "nested file"], tmp_path)
+
+    def _git(args, **kwargs):
+        """Run git without runtime bookkeeping."""
+        return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+    cache = ResultCache(tmp_path / ".git" / "router-cache", 1024 * 1024, 64 * 1024, _git)
+    server = ObjectServer(lambda _tool, _args: None)
+    config = {"router": {}}
+    args = ["--n", "3", "--files-only", "--path", "f0.txt"]
+    try:
+        monkeypatch.chdir(tmp_path / "e")
+        assert dispatch_history(args, config, _git, None, lambda: server, lambda _cfg: cache) == 0
+        assert "e/f0.txt" in capsys.readouterr().out
+        monkeypatch.chdir(tmp_path)
+        assert dispatch_history(args, config, _git, None, lambda: server, lambda _cfg: cache) == 0
+        assert capsys.readouterr().out == ""
+
+        show = ["HEAD", "--patch"]
+        assert dispatch_show(show, config, _git, lambda: server, lambda _cfg: cache) == 0
+        assert "+++ b/e/f0.txt" in capsys.readouterr().out
+        _run(["git", "config", "diff.noprefix", "true"], tmp_path)
+        assert dispatch_show(show, config, _git, lambda: server, lambda _cfg: cache) == 0
+        assert "+++ e/f0.txt" in capsys.readouterr().out
+        _run(["git", "config", "--unset", "diff.noprefix"], tmp_path)
+        assert dispatch_show(show, config, _git, lambda: server, lambda _cfg: cache) == 0
+        assert "+++ b/e/f0.txt" in capsys.readouterr().out
+    finally:
+        server.close()
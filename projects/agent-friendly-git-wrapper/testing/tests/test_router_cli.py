@@ -1,6 +1,7 @@
 """Tests for router CLI command routing."""
 from __future__ import annotations
 
+import os
 import shlex
 import shutil
 import subprocess
@@ -15,6 +16,7 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from app.cli import router_cli  # noqa: E402
+from app.routing.routing import command_allowed, pick_tool, routing_table, tool_enabled  # noqa: E402
 
 try:
     import yaml  # type: ignore
@@ -127,3 +129,80 @@ def test_router_cases(tmp_path, monkeypatch, capsys) -> None:
                 assert line in output.out
 
 
+
+
+def test_compiled_config_snapshot(tmp_path, monkeypatch, capsys) -> None:
+    """Serve warm starts from the compiled config and rebuild it when a source changes."""
+    if yaml is None:  # pragma: no cover
+        pytest.skip("PyYAML not installed")
+    from app.config.config_loader import _load_effective_config
+
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("ROUTER_CACHE_DIR", str(cache_dir))
+    custom_path = tmp_path / "custom.yaml"
+    custom_path.write_text("custom_commands: {}\n", encoding="utf-8")
+    config = _load_config(PROJECT_ROOT / "config" / "cli_router.yaml")
+    config["router"]["custom_commands_file"] = str(custom_path)
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config, sort_keys=False), encoding="utf-8")
+
+    assert router_cli.run(["--config", str(config_path), "config", "compile"]) == 0
+    output = capsys.readouterr().out
+    assert "config: compiled" in output
+    assert f"source: {custom_path}" in output
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # A warm start answers from the snapshot without importing PyYAML.
+    probe = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; sys.path.insert(0, sys.argv[1]); from pathlib import Path; "
+            "from app.config.config_loader import _load_effective_config as load; "
+            "config, profile = load(Path(sys.argv[2])); "
+            "print(profile, 'yaml' in sys.modules, sorted(config['commands'])[0])",
+            str(PROJECT_ROOT),
+            str(config_path),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert probe.stdout.split() == ["default", "False", "base"]
+
+    # Editing the custom commands file invalidates the snapshot.
+    custom_path.write_text("custom_commands:\n  hello:\n    steps: []\n", encoding="utf-8")
+    stat = custom_path.stat()
+    os.utime(custom_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    loaded, _profile = _load_effective_config(config_path)
+    assert "hello" in loaded["custom_commands"]
+
+    assert router_cli.run(["--config", str(config_path), "--profile", "missing", "state"]) == 2
+    assert "unknown profile 'missing'" in capsys.readouterr().err
+
+
+def test_routing_table_lookups() -> None:
+    """Resolve tools and overrides from one precomputed table per config."""
+    config = {
+        "router": {"enable_gh": False, "unknown_command_policy": "error"},
+        "overlap_commands": {"status": {"default": "gh"}},
+        "git_only_commands": ["Push"],
+        "gh_only_commands": ["pr"],
+        "command_overrides": {"git": {"push": False}},
+    }
+    table = routing_table(config)
+    assert routing_table(config) is table
+    # gh is disabled, so the overlap default falls back to git.
+    assert pick_tool("status", "", config) == "git"
+    assert pick_tool("push", "", config) == "git"
+    assert pick_tool("pr", "", config) == "gh"
+    assert pick_tool("pr", "git", config) == "git"
+    with pytest.raises(RuntimeError, match="unrecognized command 'frobnicate'"):
+        pick_tool("frobnicate", "", config)
+    assert not command_allowed("git", "push", config)
+    assert command_allowed("git", "commit", config)
+    assert tool_enabled("git", config) and not tool_enabled("gh", config)
+
+    restored = {"_compiled": {"routing": table.state()}}
+    assert pick_tool("status", "", restored) == "git"
+    assert not command_allowed("git", "push", restored)
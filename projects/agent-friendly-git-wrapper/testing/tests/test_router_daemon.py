@@ -0,0 +1,152 @@
+"""Tests for the resident router daemon and thin client."""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.cli import router_client  # noqa: E402
+
+try:
+    import yaml  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover
+    yaml = None  # type: ignore
+
+
+def _run(cmd: list[str], cwd: Path) -> None:
+    """Run a subprocess command for test setup."""
+    subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Initialize a git repo with a starter commit."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    (repo_dir / "sample.txt").write_text("Hello\n", encoding="utf-8")
+    _run(["git", "add", "sample.txt"], repo_dir)
+    _run(["git", "commit", "-m", "initial"], repo_dir)
+
+
+def _router(args: list[str], cwd: Path, env: dict) -> subprocess.CompletedProcess:
+    """Invoke router.sh the way the shims do."""
+    return subprocess.run(
+        ["bash", str(PROJECT_ROOT / "router.sh"), *args],
+        cwd=cwd,
+        env=env,
+        check=False,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+
+def test_router_daemon_matches_in_process(tmp_path) -> None:
+    """Serve requests through the daemon and match in-process output."""
+    if shutil.which("git") is None or shutil.which("bash") is None:
+        pytest.skip("git/bash not available")
+    if not router_client.daemon_supported():
+        pytest.skip("daemon requires Unix sockets with fd passing")
+    if yaml is None:  # pragma: no cover
+        pytest.skip("PyYAML not installed")
+
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _init_repo(repo)
+    config = yaml.safe_load((PROJECT_ROOT / "config" / "cli_router.yaml").read_text(encoding="utf-8"))
+    config["router"]["custom_commands_file"] = str(PROJECT_ROOT / "config" / "cli_router_custom_commands.yaml")
+    log_path = tmp_path / "router.json.log"
+    config["router"].update({"log_all": True, "log_format": "json", "log_file": str(log_path)})
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config, sort_keys=False), encoding="utf-8")
+
+    env = dict(os.environ)
+    env["ROUTER_SOCKET_DIR"] = str(tmp_path / "sock")
+    env["ROUTER_DAEMON"] = "0"
+    baseline = _router(["--config", str(config_path), "state"], repo, env)
+    assert baseline.returncode == 0
+    assert json.loads(log_path.read_text(encoding="utf-8").splitlines()[-1])["daemon_pid"] is None
+
+    env.pop("ROUTER_DAEMON")
+    started = _router(["daemon", "start"], repo, env)
+    assert started.returncode == 0, started.stderr
+    try:
+        assert (tmp_path / "sock").stat().st_mode & 0o777 == 0o700
+        served = _router(["--config", str(config_path), "state"], repo, env)
+        assert served.returncode == 0
+        assert served.stdout == baseline.stdout
+        # Only a daemon worker records the serving daemon's pid.
+        status = _router(["daemon", "status"], repo, env)
+        daemon_pid = int(status.stdout.split("pid=")[1].split()[0])
+        assert json.loads(log_path.read_text(encoding="utf-8").splitlines()[-1])["daemon_pid"] == daemon_pid
+
+        # Requests keep their own cwd, even from a subdirectory of the repo.
+        (repo / "sub").mkdir()
+        nested = _router(["--config", str(config_path), "state"], repo / "sub", env)
+        assert nested.stdout == baseline.stdout
+
+        # Editing the config is picked up on the next request.
+        config["commands"]["state"]["enabled"] = False
+        config_path.write_text(yaml.safe_dump(config, sort_keys=False), encoding="utf-8")
+        stat = config_path.stat()
+        os.utime(config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        disabled = _router(["--config", str(config_path), "state"], repo, env)
+        assert disabled.returncode == 2
+        assert "disabled by config" in disabled.stderr
+
+        status = _router(["daemon", "status"], repo, env)
+        assert "daemon: running" in status.stdout
+
+        # A socket directory other users could reach is never trusted.
+        (tmp_path / "sock").chmod(0o755)
+        assert router_client.connect(str(repo)) is None
+        (tmp_path / "sock").chmod(0o700)
+    finally:
+        _router(["daemon", "stop"], repo, env)
+
+
+def test_router_daemon_refuses_shared_socket_dir(tmp_path, monkeypatch) -> None:
+    """Refuse to bind in, or connect through, a socket directory that is not private."""
+    if not router_client.daemon_supported():
+        pytest.skip("daemon requires Unix sockets with fd passing")
+    from app.cli import router_daemon
+
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    monkeypatch.setenv("ROUTER_SOCKET_DIR", str(shared))
+    path = router_client.socket_path(str(tmp_path))
+    with pytest.raises(RuntimeError, match="mode 0700"):
+        router_daemon._prepare_socket(path)
+
+    # A listener planted in a shared directory is ignored, so the client runs in-process.
+    import socket
+
+    planted = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        planted.bind(path)
+        planted.listen(1)
+        assert router_client.connect_path(path) is None
+        monkeypatch.chdir(tmp_path)
+        assert router_client.forward(["state"]) is None
+    finally:
+        planted.close()
+
+
+def test_router_daemon_exit_codes(capsys) -> None:
+    """Map SystemExit codes like the interpreter: None is 0 and messages go to stderr."""
+    from app.cli import router_daemon
+
+    assert router_daemon._exit_code(SystemExit()) == 0
+    assert router_daemon._exit_code(SystemExit(3)) == 3
+    assert router_daemon._exit_code(SystemExit("router: bad flag")) == 1
+    assert capsys.readouterr().err == "router: bad flag\n"
@@ -15,6 +15,7 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from app.cli import router_cli  # noqa: E402
+from app.compact import compact as compact_mod  # noqa: E402
 
 try:
     import yaml  # type: ignore
@@ -92,6 +93,12 @@ def _apply_setup(case_repo: Path, setup: dict) -> None:
         _run(["git", "commit", "-m", "add nested"], case_repo)
         (nested_dir / "one.txt").write_text("One\nMore\n", encoding="utf-8")
         (nested_dir / "two.txt").write_text("Two\nMore\n", encoding="utf-8")
+    if setup.get("budget_change"):
+        (case_repo / "big.txt").write_text("".join(f"line {idx}\n" for idx in range(200)), encoding="utf-8")
+        _run(["git", "add", "big.txt"], case_repo)
+        _run(["git", "commit", "-m", "add big file"], case_repo)
+        (case_repo / "big.txt").write_text("".join(f"line {idx} changed\n" for idx in range(200)), encoding="utf-8")
+        (case_repo / "sample.txt").write_text("Hello\nWorld\n", encoding="utf-8")
     if setup.get("long_paths_change"):
         long_dir = case_repo / "src" / "components" / "super" / "long" / "nested" / "path" / "segment"
         long_dir.mkdir(parents=True, exist_ok=True)
@@ -170,3 +177,132 @@ def test_router_diff_cases(tmp_path, monkeypatch, capsys) -> None:
                 assert line not in output.out
 
 
+def test_compact_auto_tune_single_parse(monkeypatch) -> None:
+    """Estimate candidates from one parse and render only the winner."""
+    outputs = TESTING_ROOT / "cases" / "benchmark_history_compaction" / "case_codex_last_10" / "input" / "outputs"
+    text = (outputs / "unified.txt").read_text(encoding="utf-8")
+    # Body lines that look like ---/+++ headers and a "\ No newline" marker exercise the run splitting.
+    text += "diff --git a/x b/x\n--- a/x\n+++ b/x\n@@ -1 +1 @@\n-a\n--- b\n+++ c\n+d\n\\ No newline at end of file\n+e"
+    model = compact_mod._DiffModel(text)
+    unit = {"body": 1.0, "file": 1.0, "hunk": 1.0, "meta": 1.0}
+    for spec in ["", "path-table,path-common-prefix", "drop-headers,prefix-first", "short-hunk,hunk-new,no-prefix",
+                 "drop-diff-header,drop-hunk-header,prefix-first", "path-table,prefix-first,short-hunk"]:
+        options = compact_mod._parse_compact_spec(spec, {}, {})
+        assert model.estimate(options, unit) == len(compact_mod._compact_output(text, options)), spec
+
+    renders: list[dict] = []
+    real_compact = compact_mod._compact_output
+
+    def _counting_compact(diff_text: str, options: dict) -> str:
+        """Record each full render."""
+        renders.append(options)
+        return real_compact(diff_text, options)
+
+    monkeypatch.setattr(compact_mod, "_compact_output", _counting_compact)
+    candidates = ["path-table", "path-common-prefix", "prefix-first", "short-hunk"]
+    config = {"router": {"compact_auto_tune": {"enabled": True, "metric": "chars", "candidates": candidates}}}
+    result = compact_mod._auto_tune_compact(text, {}, config)
+    assert len(renders) == 1
+    # Same greedy choice as rendering every candidate.
+    best = {}
+    for candidate in candidates:
+        trial = compact_mod._parse_compact_spec(candidate, best, {})
+        if len(real_compact(text, trial)) < len(real_compact(text, best)):
+            best = trial
+    assert result == real_compact(text, best)
+
+
+def test_budget_priorities_and_patch_fetch(tmp_path, monkeypatch, capsys) -> None:
+    """Rank files by configured priority and fetch patches only for files that can fit."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    from app.compact import budget as budget_mod
+
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    _apply_setup(tmp_path, {"multi_change": True})
+    (tmp_path / "big.txt").write_text("".join(f"line {idx}\n" for idx in range(400)), encoding="utf-8")
+    # Count characters so the allocation does not depend on tiktoken data.
+    monkeypatch.setattr(budget_mod, "_measure_text", lambda text, metric, encoding, config=None: len(text))
+    calls: list[list[str]] = []
+
+    def _run_git(args, **kwargs):
+        """Record and run git."""
+        calls.append(list(args))
+        return subprocess.run(["git", *args], **kwargs)
+
+    _run(["git", "add", "-N", "big.txt"], tmp_path)
+    diff_args = ["diff", "--patch", "--no-prefix", "--unified=0"]
+    for priorities, patched, demoted in [({}, "drop.txt", "keep.txt"), ({"keep*": 1}, "keep.txt", "drop.txt")]:
+        calls.clear()
+        config = {"router": {"budget": {"path_priorities": priorities}}}
+        assert budget_mod.render_budget_output(diff_args, 190, _run_git, {"drop_headers": True}, config) == 0
+        out = capsys.readouterr().out
+        assert f"diff --git {patched} {patched}" in out
+        assert f"{demoted} | +1 -1" in out
+        assert "big.txt | +400 -0" in out
+        assert out.endswith("budget: 190 tokens, 1 patch, 2 stat\n")
+        assert len(out) <= 190
+        # numstat, then one patch fetch limited to the files that could still fit.
+        assert [call[1] for call in calls] == ["--numstat", "--patch"]
+        assert sorted(calls[1][-2:]) == [":(literal)drop.txt", ":(literal)keep.txt"]
+
+
+def test_budget_below_fixed_output_is_an_error(tmp_path, monkeypatch, capsys) -> None:
+    """Raise instead of overshooting when the headers and summary alone exceed the budget."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    from app.compact import budget as budget_mod
+
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    _apply_setup(tmp_path, {"multi_change": True})
+    monkeypatch.setattr(budget_mod, "_measure_text", lambda text, metric, encoding, config=None: len(text))
+
+    def _run_git(args, **kwargs):
+        """Run git in the test repo."""
+        return subprocess.run(["git", *args], **kwargs)
+
+    diff_args = ["diff", "--patch", "--no-prefix", "--unified=0"]
+    # Room for the summary line only: every file is omitted, and the output still fits.
+    assert budget_mod.render_budget_output(diff_args, 40, _run_git, {}, {}, "diff") == 0
+    assert capsys.readouterr().out == "budget: 40 tokens, 2 omitted\n"
+    with pytest.raises(RuntimeError, match=r"router diff: --budget 20 is below the 29 tokens"):
+        budget_mod.render_budget_output(diff_args, 20, _run_git, {}, {}, "diff")
+    assert capsys.readouterr().out == ""
+
+    log_args = ["log", "-n", "2", "--pretty=format:%h %s", "--patch", "--no-prefix"]
+    with pytest.raises(RuntimeError, match="router history: --budget 30 is below"):
+        budget_mod.render_budget_output(log_args, 30, _run_git, {}, {}, "history")
+
+
+def test_output_guard_skips_patch_generation(tmp_path, capsys) -> None:
+    """Predict the patch from numstat plus a small sample, then step down or refuse without a full patch."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    from app.compact import estimate as estimate_mod
+
+    _init_repo(tmp_path)
+    _apply_setup(tmp_path, {"budget_change": True})
+    calls: list[list[str]] = []
+
+    def _run_git(args, **kwargs):
+        """Record and run git in the test repo."""
+        calls.append(list(args))
+        return subprocess.run(["git", *args], cwd=tmp_path, **kwargs)
+
+    diff_args = ["diff", "--patch", "--no-prefix", "--unified=3"]
+    config = {"router": {"max_output_tokens": 200}}
+    assert estimate_mod.guard_patch_output(diff_args, _run_git, config, "diff") == "stat"
+    assert "showing --stat instead" in capsys.readouterr().err
+    # numstat, then a patch for the sampled small file only; big.txt is never diffed.
+    assert calls[0] == ["diff", "--no-prefix", "--numstat", "-z"]
+    assert calls[1][-2:] == ["--", ":(literal)sample.txt"]
+    assert len(calls) == 2
+    assert estimate_mod.downgrade_args(diff_args, "stat") == ["diff", "--stat"]
+
+    config["router"]["max_output_tokens"] = 100000
+    assert estimate_mod.guard_patch_output(diff_args, _run_git, config, "diff") == "patch"
+    config["router"].update({"max_output_tokens": 200, "max_output_action": "refuse"})
+    with pytest.raises(RuntimeError, match="exceeds router.max_output_tokens"):
+        estimate_mod.guard_patch_output(diff_args, _run_git, config, "diff")
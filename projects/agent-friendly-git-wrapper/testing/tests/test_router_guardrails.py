@@ -15,6 +15,14 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from app.cli import router_cli  # noqa: E402
+from app.policy.guardrails import (  # noqa: E402
+    GuardrailPolicy,
+    _current_branch,
+    _worktree_clean,
+    guardrail_policy,
+    guardrails_block,
+)
+from app.utils.exec_utils import run_git  # noqa: E402
 
 try:
     import yaml  # type: ignore
@@ -68,6 +76,8 @@ def _apply_setup(repo_dir: Path, setup: dict) -> None:
     """Apply worktree changes for guardrails scenarios."""
     if setup.get("working_change"):
         (repo_dir / "sample.txt").write_text("Changed\n", encoding="utf-8")
+    if setup.get("untracked_file"):
+        (repo_dir / "notes.txt").write_text("draft\n", encoding="utf-8")
 
 
 def test_router_guardrails_cases(tmp_path, monkeypatch, capsys) -> None:
@@ -121,3 +131,79 @@ def test_router_guardrails_cases(tmp_path, monkeypatch, capsys) -> None:
             assert line in output.err
 
 
+
+
+def test_guardrail_policy_compiled_once(tmp_path, monkeypatch) -> None:
+    """Normalize guardrail rules once and restore them from the snapshot state."""
+    # Outside any repo, so the branch comes from the git_output stub rather than HEAD.
+    monkeypatch.chdir(tmp_path)
+    config = {
+        "guardrails": {
+            "protected_branches": [" main "],
+            "protected_patterns": ["release/*", "hot?x"],
+            "protected_ops": ["push"],
+            "branch_name_patterns": ["feat/*"],
+            "enforce_branch_name_ops": ["commit"],
+            "merge_policies": [{"target": "main", "allowed_sources": ["develop"]}],
+        },
+        "_runtime": {},
+    }
+    policy = guardrail_policy(config)
+    assert guardrail_policy(config) is policy
+    assert policy.protected("main") and policy.protected("release/1.0") and policy.protected("hotfx")
+    assert not policy.protected("feature/x")
+    assert policy.name_allowed("feat/a") and not policy.name_allowed("bugfix/a")
+
+    restored = {"guardrails": {}, "_runtime": {}, "_compiled": {"guardrails": policy.state()}}
+    assert isinstance(guardrail_policy(restored), GuardrailPolicy)
+
+    def _on_branch(branch: str):
+        """Return a git_output stub that reports the given branch."""
+        return lambda args: branch
+
+    assert guardrails_block("git", ["push"], restored, _on_branch("release/2")) is not None
+    assert guardrails_block("git", ["commit", "-m", "x"], restored, _on_branch("bugfix/a")) is not None
+    assert guardrails_block("git", ["merge", "topic"], restored, _on_branch("main")) is not None
+    assert guardrails_block("git", ["merge", "develop"], restored, _on_branch("main")) is None
+
+
+def test_guardrails_fast_path(tmp_path, monkeypatch) -> None:
+    """Read HEAD through worktree gitdir files and skip git when no rule needs it."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _init_repo(repo)
+    _run(["git", "worktree", "add", "-b", "feat/x", str(tmp_path / "wt")], repo)
+    (tmp_path / "wt" / "sub").mkdir()
+    monkeypatch.chdir(tmp_path / "wt" / "sub")
+
+    def _no_git(args):
+        """Fail if the guardrails fall back to git for the branch."""
+        raise AssertionError(f"unexpected git call: {args}")
+
+    assert _current_branch(_no_git) == "feat/x"
+
+    def _quiet_git(args, **kwargs):
+        """Run git without logging."""
+        return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+    def _git_output(args):
+        """Return stdout for a git command."""
+        return _quiet_git(args, check=True, capture_output=True, text=True).stdout.strip()
+
+    assert _worktree_clean(_git_output, _quiet_git)
+    (tmp_path / "wt" / "notes.txt").write_text("draft\n", encoding="utf-8")
+    assert not _worktree_clean(_git_output, _quiet_git)
+    # Like `status --porcelain`, untracked files do not count when status hides them.
+    _run(["git", "config", "status.showUntrackedFiles", "no"], repo)
+    assert _git_output(["status", "--porcelain"]) == ""
+    assert _worktree_clean(_git_output, _quiet_git)
+    _run(["git", "config", "--unset", "status.showUntrackedFiles"], repo)
+    (tmp_path / "wt" / "notes.txt").unlink()
+    (tmp_path / "wt" / "sample.txt").write_text("Changed\n", encoding="utf-8")
+    assert not _worktree_clean(_git_output, _quiet_git)
+
+    # No protected/name/merge/clean rule covers `status`, so git is never consulted.
+    config = {"guardrails": {"protected_branches": ["main"], "protected_ops": ["push"]}, "_runtime": {}}
+    assert guardrails_block("git", ["status"], config, _no_git, _no_git) is None
@@ -1,6 +1,7 @@
 """Tests for router history command cases."""
 from __future__ import annotations
 
+import os
 import shlex
 import shutil
 import subprocess
@@ -27,6 +28,16 @@ def _run(cmd: list[str], cwd: Path) -> None:
     subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
 
 
+def _commit(repo_dir: Path, message: str) -> None:
+    """Commit with dates pinned per commit, so hashes (and their token counts) are the same every run."""
+    count = int(subprocess.run(
+        ["git", "rev-list", "--count", "--all"], cwd=repo_dir, capture_output=True, text=True
+    ).stdout.strip() or 0)
+    date = f"{1700000000 + count * 60} +0000"
+    env = {**os.environ, "GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date}
+    subprocess.run(["git", "commit", "-m", message], cwd=repo_dir, env=env, check=True, capture_output=True, text=True)
+
+
 def _init_repo(repo_dir: Path) -> None:
     """Initialize a git repo with a starter commit."""
     _run(["git", "init"], repo_dir)
@@ -34,7 +45,7 @@ def _init_repo(repo_dir: Path) -> None:
     _run(["git", "config", "user.name", "Test User"], repo_dir)
     (repo_dir / "sample.txt").write_text("Hello\n", encoding="utf-8")
     _run(["git", "add", "sample.txt"], repo_dir)
-    _run(["git", "commit", "-m", "initial"], repo_dir)
+    _commit(repo_dir, "initial")
 
 
 def _iter_case_dirs() -> list[Path]:
@@ -78,7 +89,7 @@ def _apply_commits(case_repo: Path, commits: list[dict]) -> None:
             existing = path.read_text(encoding="utf-8") if path.exists() else ""
             path.write_text(f"{existing}{message}\n", encoding="utf-8")
         _run(["git", "add", file_path], case_repo)
-        _run(["git", "commit", "-m", message], case_repo)
+        _commit(case_repo, message)
 
 
 def _apply_setup(case_repo: Path, setup: dict) -> None:
@@ -155,3 +166,131 @@ def test_router_history_cases(tmp_path, monkeypatch, capsys) -> None:
                 assert line not in output.out
 
 
+
+
+def test_sharded_history_matches_sequential(tmp_path, monkeypatch, capsys) -> None:
+    """Render long ranges as parallel per-chunk logs with byte-identical output."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    from app.commands.history_cmd import dispatch_history
+    from app.utils.exec_utils import run_git
+
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    _run(["git", "checkout", "-q", "-b", "side"], tmp_path)
+    (tmp_path / "side.txt").write_text("side\n", encoding="utf-8")
+    _run(["git", "add", "side.txt"], tmp_path)
+    _run(["git", "commit", "-m", "side"], tmp_path)
+    _run(["git", "checkout", "-q", "-"], tmp_path)
+    for idx in range(6):
+        (tmp_path / "src").mkdir(exist_ok=True)
+        (tmp_path / "src" / f"f{idx}.py").write_text(f"value = {idx}\n" * (idx + 1), encoding="utf-8")
+        _run(["git", "add", "."], tmp_path)
+        _run(["git", "commit", "-m", f"-dash subject {idx}"], tmp_path)
+    _run(["git", "merge", "-q", "--no-ff", "-m", "merge side", "side"], tmp_path)
+    _run(["git", "mv", "src/f1.py", "src/renamed.py"], tmp_path)
+    (tmp_path / "src" / "f2.py").write_text("value  =  2\n" * 3, encoding="utf-8")
+    _run(["git", "commit", "-am", "rename and whitespace"], tmp_path)
+    (tmp_path / "blob.bin").write_bytes(b"\x00\x01binary")
+    _run(["git", "add", "blob.bin"], tmp_path)
+    _run(["git", "commit", "-m", "binary"], tmp_path)
+
+    calls: list[list[str]] = []
+
+    def _git(args, **kwargs):
+        """Record git invocations."""
+        calls.append(list(args))
+        return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+    config = {"router": {"history_default_patch": True, "history_shards": {"min_commits": 2}}}
+    for extra in (
+        [],
+        ["--compact"],
+        ["--compact=drop-headers,short-hunk-header,prefix-first"],
+        ["--compact=path-table,no-prefix", "--commit-meta", "none"],
+        ["--commit-meta", "subject", "--compact"],
+        ["--noise=none", "--ops", "A"],
+        ["--path", "src"],
+    ):
+        args = ["--n", "20", "--no-cache", *extra]
+        assert dispatch_history([*args, "--jobs", "1"], config, _git) == 0
+        sequential = capsys.readouterr().out
+        calls.clear()
+        assert dispatch_history([*args, "--jobs", "3"], config, _git) == 0
+        assert capsys.readouterr().out == sequential, extra
+        assert calls[0][:2] == ["log", "--format=%H"]
+        assert sum(1 for call in calls if "--no-walk=unsorted" in call) > 1, (extra, calls)
+
+
+def test_history_records_match_text_output(tmp_path, monkeypatch, capsys) -> None:
+    """Parse record-separated history into per-commit records that render like plain git log."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    import json
+
+    from app.commands.history_cmd import dispatch_history
+    from app.compact.records import parse_records
+    from app.utils.exec_utils import run_git
+
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "big.txt").write_text("".join(f"row {idx}\n" for idx in range(200)), encoding="utf-8")
+    (tmp_path / "small.txt").write_text("small\n", encoding="utf-8")
+    _run(["git", "add", "."], tmp_path)
+    _run(["git", "commit", "-m", "subject with  spaces | and %s"], tmp_path)
+    _run(["git", "commit", "--allow-empty", "-m", "empty"], tmp_path)
+
+    def _git(args, **kwargs):
+        """Run git without runtime bookkeeping."""
+        return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+    config = {"router": {"history_default_patch": True}}
+    for extra in ([], ["--compact=drop-headers,short-hunk-header"], ["--commit-meta", "none"], ["--stat"]):
+        args = ["--n", "5", "--no-cache", *extra]
+        assert dispatch_history(args, config, _git) == 0
+        plain = capsys.readouterr().out
+        assert dispatch_history([*args, "--per-commit-max-tokens", "1000000"], config, _git) == 0
+        assert capsys.readouterr().out == plain, extra
+
+    assert dispatch_history(["--n", "5", "--no-cache", "--format", "json", "--per-commit-max-tokens", "60"], config, _git) == 0
+    items = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [item["subject"] for item in items] == ["empty", "subject with  spaces | and %s", "initial"]
+    assert items[0]["body"] == ""
+    assert items[1]["omitted"] == ["big.txt"]
+    assert items[1]["body"].startswith("diff --git a/small.txt b/small.txt\n")
+
+    data = b"\0aaa\0a\0sub\0me\x002024-01-01\0\ndiff --git a/x b/x\n+x\n\n\0bbb\0b\0next\0me\x002024-01-01\0"
+    records = parse_records(data)
+    assert [(record.oid, record.subject) for record in records] == [("aaa", "sub"), ("bbb", "next")]
+    assert data[records[0].start : records[0].end] == b"diff --git a/x b/x\n+x"
+    assert records[1].start == records[1].end
+
+
+def test_history_records_keep_control_bytes_in_patches(tmp_path, monkeypatch, capsys) -> None:
+    """Keep one record per commit when a patch carries the old \\x1e/\\x1f separator bytes."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    import json
+
+    from app.commands.history_cmd import dispatch_history
+    from app.utils.exec_utils import run_git
+
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "ctl.txt").write_bytes(b"a\x1eb\x1fc\n")
+    _run(["git", "add", "ctl.txt"], tmp_path)
+    _run(["git", "commit", "-m", "control bytes"], tmp_path)
+
+    def _git(args, **kwargs):
+        """Run git without runtime bookkeeping."""
+        return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+    config = {"router": {"history_default_patch": True}}
+    assert dispatch_history(["--n", "2", "--no-cache", "--format", "json"], config, _git) == 0
+    items = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [item["subject"] for item in items] == ["control bytes", "initial"]
+    assert "+a\x1eb\x1fc\n" in items[0]["body"]
+    assert dispatch_history(["--n", "2", "--no-cache"], config, _git) == 0
+    plain = capsys.readouterr().out
+    assert dispatch_history(["--n", "2", "--no-cache", "--per-commit-max-tokens", "1000000"], config, _git) == 0
+    assert capsys.readouterr().out == plain
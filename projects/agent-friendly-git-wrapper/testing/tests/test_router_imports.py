@@ -0,0 +1,91 @@
+"""Import-time budget tests for the router's hot paths."""
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# Modules loaded on top of a bare interpreter start (`python -c pass`).
+STATE_MODULE_BUDGET = 120
+PASSTHROUGH_MODULE_BUDGET = 100
+
+# Handler and compaction code that neither path should load.
+HEAVY_MODULES = {
+    "app.commands.branch_cmd",
+    "app.commands.pr_cmd",
+    "app.commands.history_cmd",
+    "app.commands.compare_cmd",
+    "app.compact.compact",
+    "tiktoken",
+    "yaml",
+}
+
+
+def _run(cmd: list[str], cwd: Path) -> None:
+    """Run a subprocess command for test setup."""
+    subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Initialize a git repo with a starter commit."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    (repo_dir / "sample.txt").write_text("Hello\n", encoding="utf-8")
+    _run(["git", "add", "sample.txt"], repo_dir)
+    _run(["git", "commit", "-m", "initial"], repo_dir)
+
+
+def _imported_modules(args: list[str], cwd: Path, env: dict) -> list[str]:
+    """Run python -X importtime and return the names of every imported module."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=cwd,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[0].split(":", 1)[1].strip().isdigit():
+            continue
+        modules.append(fields[2].strip())
+    return modules
+
+
+def test_router_import_budget(tmp_path) -> None:
+    """Keep `router state` and passthrough runs from importing unrelated handlers."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _init_repo(repo)
+    env = dict(os.environ)
+    env["ROUTER_CACHE_DIR"] = str(tmp_path / "cache")
+    main = str(PROJECT_ROOT / "app" / "main.py")
+
+    # Compile the config snapshot first; budgets apply to warm starts.
+    subprocess.run(
+        [sys.executable, main, "router", "config", "compile"], cwd=repo, env=env, check=True, capture_output=True
+    )
+
+    baseline = len(_imported_modules(["-c", "pass"], repo, env))
+    state = _imported_modules([main, "router", "state"], repo, env)
+    passthrough = _imported_modules([main, "router", "status"], repo, env)
+
+    assert "app.commands.state" in state
+    assert not HEAVY_MODULES & set(state)
+    assert not HEAVY_MODULES & set(passthrough)
+    assert not [name for name in passthrough if name.startswith("app.commands")]
+    assert len(state) - baseline <= STATE_MODULE_BUDGET, sorted(state)
+    assert len(passthrough) - baseline <= PASSTHROUGH_MODULE_BUDGET, sorted(passthrough)
@@ -0,0 +1,135 @@
+"""Tests for the SQLite commit index behind log --path/--search and history --summary."""
+from __future__ import annotations
+
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.commands.history_cmd import dispatch_history  # noqa: E402
+from app.commands.index_cmd import dispatch_index  # noqa: E402
+from app.commands.log_cmd import dispatch_log  # noqa: E402
+from app.utils.commit_index import open_commit_index, shortstat_line  # noqa: E402
+from app.utils.exec_utils import run_git  # noqa: E402
+
+
+def _run(cmd: list[str], cwd: Path) -> None:
+    """Run a subprocess command for test setup."""
+    subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
+
+
+def _write(repo_dir: Path, name: str, text: str) -> None:
+    """Write one file (creating its directory) in the repo."""
+    target = repo_dir / name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(text, encoding="utf-8")
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Create history with a rename, a binary file, an empty commit and two merges."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    for idx in range(4):
+        _write(repo_dir, f"src/f{idx}.txt", f"v{idx}\n")
+        _run(["git", "add", "-A"], repo_dir)
+        _run(["git", "commit", "-m", f"Add f{idx} module"], repo_dir)
+    _run(["git", "checkout", "-b", "side"], repo_dir)
+    _write(repo_dir, "docs/side.md", "side\n")
+    _run(["git", "add", "-A"], repo_dir)
+    _run(["git", "commit", "-m", "Document the side branch"], repo_dir)
+    _run(["git", "checkout", "main"], repo_dir)
+    _run(["git", "mv", "src/f1.txt", "src/g1.txt"], repo_dir)
+    (repo_dir / "data.bin").write_bytes(b"\0\1\2")
+    _run(["git", "add", "-A"], repo_dir)
+    _run(["git", "commit", "-m", "Rename f1 and add binary"], repo_dir)
+    _run(["git", "merge", "--no-ff", "-m", "Merge side", "side"], repo_dir)
+    _run(["git", "commit", "--allow-empty", "-m", "Empty marker"], repo_dir)
+    _run(["git", "checkout", "-b", "ours", "HEAD~1"], repo_dir)
+    _write(repo_dir, "src/f2.txt", "ours\n")
+    _run(["git", "commit", "-am", "Change f2 on ours"], repo_dir)
+    _run(["git", "checkout", "main"], repo_dir)
+    _run(["git", "merge", "-s", "ours", "-m", "Merge ours keeping main", "ours"], repo_dir)
+
+
+def test_index_answers_like_git(tmp_path, monkeypatch, capsys) -> None:
+    """Match git's log/history output from the index, without diffing, once it is built."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    calls: list[list[str]] = []
+
+    def _git(args, **kwargs):
+        """Record git invocations made by the handlers."""
+        calls.append(list(args))
+        return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+    config: dict = {}
+
+    def _index(cfg):
+        """Open the test repo's commit index."""
+        return open_commit_index(cfg, lambda: str(tmp_path / ".git"), _git)
+
+    assert _index(config) is None
+    assert dispatch_index(["status"], config, _git, lambda: str(tmp_path / ".git")) == 0
+    assert capsys.readouterr().out == "index: not built (run `router index build`)\n"
+    assert dispatch_index(["build"], config, _git, lambda: str(tmp_path / ".git")) == 0
+    built = capsys.readouterr().out
+    assert "index: added commits=10\n" in built
+    assert "commits: 10\n" in built and "stale: false\n" in built
+
+    cases = [
+        (dispatch_log, ["--path", "src"]),
+        (dispatch_log, ["--n", "2", "--path", "src/f2.txt"]),
+        (dispatch_log, ["--path", "docs"]),
+        (dispatch_log, ["--search", "add"]),
+        (dispatch_log, ["--search", "merge side", "--short-hash"]),
+        (dispatch_history, ["--summary"]),
+        (dispatch_history, ["--summary", "--path", "src/f2.txt"]),
+        (dispatch_history, ["--summary", "--path", "docs", "--commit-meta", "full"]),
+        (dispatch_history, ["--summary", "--range", "HEAD~4..HEAD~2", "--path", "data.bin"]),
+    ]
+    for dispatch, args in cases:
+        extra = [None] * 3 if dispatch is dispatch_history else []
+        assert dispatch([*args, "--no-cache"] if extra else args, config, _git, *extra) == 0
+        expected = capsys.readouterr().out
+        del calls[:]
+        assert dispatch([*args, "--no-cache"] if extra else args, config, _git, *extra, _index) == 0
+        assert capsys.readouterr().out == expected, args
+        # git only walked the revisions: no pathspec, grep or stat reached it.
+        assert not any("--" in call or "--shortstat" in call or "--all-match" in call for call in calls), args
+
+    # A split rename (only one side inside the pathspec) is counted by git.
+    assert dispatch_history(["--summary", "--path", "src/g1.txt", "--no-cache"], config, _git) == 0
+    expected = capsys.readouterr().out
+    assert dispatch_history(["--summary", "--path", "src/g1.txt", "--no-cache"], config, _git, None, None, None, _index) == 0
+    assert capsys.readouterr().out == expected
+
+    # New commits are indexed incrementally on the next query.
+    _write(tmp_path, "src/f3.txt", "v3\nmore\n")
+    _run(["git", "commit", "-am", "Extend f3"], tmp_path)
+    assert dispatch_log(["--n", "1", "--path", "src"], config, _git, _index) == 0
+    assert capsys.readouterr().out.endswith(" Extend f3")
+    dispatch_index(["status"], config, _git, lambda: str(tmp_path / ".git"))
+    assert "commits: 11\n" in capsys.readouterr().out
+
+    assert dispatch_index(["drop"], config, _git, lambda: str(tmp_path / ".git")) == 0
+    assert capsys.readouterr().out == "index: dropped\n"
+    assert not (tmp_path / ".git" / "router-index.sqlite").exists()
+    with pytest.raises(RuntimeError, match="unknown action"):
+        dispatch_index(["rebuild"], config, _git, lambda: str(tmp_path / ".git"))
+
+
+def test_shortstat_line_matches_git() -> None:
+    """Render the shortstat summary exactly as git does."""
+    assert shortstat_line(1, 1, 0) == " 1 file changed, 1 insertion(+)"
+    assert shortstat_line(2, 0, 3) == " 2 files changed, 3 deletions(-)"
+    assert shortstat_line(3, 2, 1) == " 3 files changed, 2 insertions(+), 1 deletion(-)"
+    assert shortstat_line(1, 0, 0) == " 1 file changed, 0 insertions(+), 0 deletions(-)"
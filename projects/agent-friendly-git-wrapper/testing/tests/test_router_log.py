@@ -171,7 +171,7 @@ def test_router_log_includes_resolved(tmp_path, monkeypatch) -> None:
     assert rc == 0
     log_text = log_path.read_text(encoding="utf-8")
     assert "resolved:" in log_text
-    assert "git rev-parse --show-toplevel" in log_text
+    assert "git rev-parse --short HEAD" in log_text
 
 
 
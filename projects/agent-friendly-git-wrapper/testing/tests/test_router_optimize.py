@@ -0,0 +1,112 @@
+"""Tests for router optimize feature inspection, apply and benchmark table."""
+from __future__ import annotations
+
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.commands.optimize_cmd import dispatch_optimize  # noqa: E402
+from app.utils.exec_utils import run_git  # noqa: E402
+
+
+def _run(cmd: list[str], cwd: Path) -> str:
+    """Run a subprocess command for test setup and return its stdout."""
+    return subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Initialize a git repo with a few commits and no optimizations."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    for idx in range(3):
+        (repo_dir / f"file{idx}.txt").write_text(f"{idx}\n", encoding="utf-8")
+        _run(["git", "add", "-A"], repo_dir)
+        _run(["git", "commit", "-m", f"commit {idx}"], repo_dir)
+
+
+def _git(args, **kwargs):
+    """Run git without runtime bookkeeping."""
+    return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+
+def _features(output: str, heading: str = "features:") -> dict[str, str]:
+    """Parse the `name: status` lines under one heading."""
+    lines = output.splitlines()
+    start = lines.index(heading) + 1
+    found: dict[str, str] = {}
+    for line in lines[start:]:
+        if not line.startswith("  "):
+            break
+        name, _, status = line.strip().partition(": ")
+        found[name] = status.split(" ", 1)[0]
+    return found
+
+
+def test_optimize_inspects_and_applies(tmp_path, monkeypatch, capsys) -> None:
+    """Report missing features, refuse --apply in safe mode, then enable them."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    assert dispatch_optimize(["--no-bench"], {}, _git) == 0
+    before = capsys.readouterr().out
+    found = _features(before)
+    assert list(found)[:5] == ["commit-graph", "multi-pack-index", "bitmaps", "untracked-cache", "many-files"]
+    assert {found[name] for name in list(found)[:5]} == {"missing"}
+    assert found["fsmonitor"] in {"missing", "unsupported"}
+    assert "hint: run `router optimize --apply`" in before
+
+    safe = {"_runtime": {"safe_mode": True}}
+    with pytest.raises(RuntimeError, match="blocked by safe mode"):
+        dispatch_optimize(["--apply", "--no-bench"], safe, _git)
+    assert "core.untrackedcache" not in _run(["git", "config", "--list", "--local"], tmp_path)
+
+    assert dispatch_optimize(["--apply", "--no-bench", "--only", "untracked-cache"], {}, _git) == 0
+    applied = capsys.readouterr().out
+    assert "  untracked-cache: git config --local core.untrackedCache true -> ok\n" in applied
+    assert _features(applied, "features after:") == {"untracked-cache": "ok"}
+
+    assert dispatch_optimize(["--apply", "--no-bench", "--only", "commit-graph,bitmaps,many-files"], {}, _git) == 0
+    after = _features(capsys.readouterr().out, "features after:")
+    assert after == {"commit-graph": "ok", "bitmaps": "ok", "many-files": "ok"}
+    assert (tmp_path / ".git" / "objects" / "pack" / "multi-pack-index").exists()
+    assert _run(["git", "config", "feature.manyFiles"], tmp_path).strip() == "true"
+
+    assert dispatch_optimize(["--apply", "--no-bench", "--only", "commit-graph"], {}, _git) == 0
+    assert "  nothing to do\n" in capsys.readouterr().out
+    with pytest.raises(RuntimeError, match="unknown feature"):
+        dispatch_optimize(["--only", "turbo"], {}, _git)
+
+
+def test_optimize_benchmark_table(tmp_path, monkeypatch, capsys) -> None:
+    """Time the configured router commands in fresh processes and print a table."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    config = {"router": {"optimize": {"bench_commands": ["state", "log --n 5 --path {path}", "no-such-command"]}}}
+
+    assert dispatch_optimize(["--runs", "1", "--only", "many-files"], config, _git) == 0
+    out = capsys.readouterr().out.splitlines()
+    table = out[out.index("benchmark (median of 1 runs, ms):") + 1:]
+    assert table[0] == "path: file2.txt"
+    assert table[1].split() == ["command", "ms"]
+    assert table[2].startswith("state ") and float(table[2].split()[-1]) > 0
+    assert table[3].startswith("log --n 5 --path {path} ")
+    assert table[4].split()[-1] == "error"
+
+    assert dispatch_optimize(["--apply", "--runs", "1", "--only", "many-files"], config, _git) == 0
+    out = capsys.readouterr().out.splitlines()
+    table = out[out.index("benchmark (median of 1 runs, ms):") + 2:]
+    assert table[0].split() == ["command", "before_ms", "after_ms", "change"]
+    assert table[1].split()[-1].endswith("%")
+    assert table[3].split()[-3:] == ["error", "error", "-"]
@@ -0,0 +1,129 @@
+"""Tests for spilling oversized output and paging it back by cursor id."""
+from __future__ import annotations
+
+import io
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.commands.diff_cmd import dispatch_diff  # noqa: E402
+from app.commands.page_cmd import dispatch_page  # noqa: E402
+from app.utils.exec_utils import run_git  # noqa: E402
+from app.utils.spill_store import SpillStore, run_spilled  # noqa: E402
+
+
+def _run(cmd: list[str], cwd: Path) -> None:
+    """Run a subprocess command for test setup."""
+    subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True)
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Initialize a git repo with a large and a small pending change."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    (repo_dir / "big.txt").write_text("".join(f"line {idx}\n" for idx in range(200)), encoding="utf-8")
+    (repo_dir / "sample.txt").write_text("Hello\n", encoding="utf-8")
+    _run(["git", "add", "big.txt", "sample.txt"], repo_dir)
+    _run(["git", "commit", "-m", "initial"], repo_dir)
+    (repo_dir / "big.txt").write_text("".join(f"line {idx} changed\n" for idx in range(200)), encoding="utf-8")
+    (repo_dir / "sample.txt").write_text("Hello\nWorld\n", encoding="utf-8")
+
+
+def _git(args, **kwargs):
+    """Run git without runtime bookkeeping."""
+    return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+
+def test_spill_and_page(tmp_path, monkeypatch, capsys) -> None:
+    """Spill once past the threshold, then serve line ranges and file sections from the spill."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    store = SpillStore(tmp_path / ".git" / "router-spill", 1024 * 1024)
+    config = {"router": {"spill": {"enabled": True, "threshold_bytes": 2000, "page_lines": 20}}}
+
+    assert dispatch_diff([], config, _git) == 0
+    full = capsys.readouterr().out
+    full_lines = full.splitlines(keepends=True)
+    assert len(full_lines) > 400
+
+    # Output streams through up to the end of the line that crosses the threshold.
+    shown = next(idx for idx in range(len(full_lines)) if len("".join(full_lines[:idx])) >= 2000)
+    assert run_spilled("diff", config, lambda: dispatch_diff([], config, _git), lambda _cfg: store) == 0
+    first = capsys.readouterr().out.splitlines(keepends=True)
+    assert len(first) == shown + 1
+    assert first[:shown] == full_lines[:shown]
+    cursor = first[shown].split()[1]
+    assert first[shown].startswith(f"cursor: {cursor} lines 1-{shown} of {len(full_lines)} ")
+    assert first[shown].rstrip().endswith(f"next: router page {cursor} --from {shown + 1}")
+
+    # Same content maps to the same spill; nothing is rewritten.
+    run_spilled("diff", config, lambda: dispatch_diff([], config, _git), lambda _cfg: store)
+    assert capsys.readouterr().out.splitlines()[shown].split()[1] == cursor
+    assert sorted(path.suffix for path in store.root.iterdir()) == [".json", ".lines", ".out"]
+
+    assert dispatch_page([cursor[:8], "--from", "21", "--lines", "5"], config, lambda _cfg: store) == 0
+    page = capsys.readouterr().out.splitlines(keepends=True)
+    assert page[:5] == full_lines[20:25]
+    assert page[5].rstrip().endswith(f"next: router page {cursor} --from 26")
+
+    dispatch_page([cursor, "--lines", "100000"], config, lambda _cfg: store)
+    assert capsys.readouterr().out == full
+
+    dispatch_page([cursor, "--file", "sample.txt"], config, lambda _cfg: store)
+    section = capsys.readouterr().out
+    assert section.startswith("diff --git a/sample.txt b/sample.txt\n")
+    assert section.endswith("+World\n")
+    dispatch_page([cursor, "--files"], config, lambda _cfg: store)
+    assert capsys.readouterr().out == f"big.txt lines 1-405\nsample.txt lines 406-{len(full_lines)}\n"
+
+    with pytest.raises(RuntimeError, match="past the end"):
+        dispatch_page([cursor, "--from", str(len(full_lines) + 1)], config, lambda _cfg: store)
+    with pytest.raises(RuntimeError, match="unknown or expired"):
+        dispatch_page(["abcdef12"], config, lambda _cfg: store)
+
+
+def test_small_output_is_not_spilled(tmp_path, monkeypatch, capsys) -> None:
+    """Leave output under the threshold untouched and write nothing to disk."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    store = SpillStore(tmp_path / ".git" / "router-spill", 1024 * 1024)
+    config = {"router": {"spill": {"enabled": True, "threshold_bytes": 1024 * 1024, "page_lines": 20}}}
+    assert dispatch_diff([], config, _git) == 0
+    full = capsys.readouterr().out
+    assert run_spilled("diff", config, lambda: dispatch_diff([], config, _git), lambda _cfg: store) == 0
+    assert capsys.readouterr().out == full
+    assert not store.root.exists()
+
+
+def test_output_under_threshold_streams(tmp_path, monkeypatch) -> None:
+    """Pass output past the first page straight through while the command is still running."""
+    store = SpillStore(tmp_path / "router-spill", 1024 * 1024)
+    config = {"router": {"spill": {"enabled": True, "threshold_bytes": 1024 * 1024, "page_lines": 20}}}
+    out = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", out)
+    seen: list[str] = []
+
+    def _produce() -> int:
+        """Write three pages, checking what reached stdout before returning."""
+        for idx in range(60):
+            sys.stdout.write(f"line {idx}\n")
+        seen.append(out.getvalue())
+        return 0
+
+    assert run_spilled("diff", config, _produce, lambda _cfg: store) == 0
+    expected = "".join(f"line {idx}\n" for idx in range(60))
+    assert seen == [expected]
+    assert out.getvalue() == expected
+    assert not store.root.exists()
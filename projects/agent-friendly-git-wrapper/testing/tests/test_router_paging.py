@@ -0,0 +1,197 @@
+"""Tests for cursor-based paging of router log and router history."""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.commands.history_cmd import dispatch_history  # noqa: E402
+from app.commands.log_cmd import dispatch_log  # noqa: E402
+from app.utils.exec_utils import run_git  # noqa: E402
+from app.utils.walk_cursor import decode_cursor, encode_cursor  # noqa: E402
+
+
+def _run(cmd: list[str], cwd: Path, env: dict | None = None) -> str:
+    """Run a subprocess command for test setup and return its stdout."""
+    return subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True, env=env).stdout
+
+
+def _dated(stamp: int) -> dict:
+    """Return an environment that pins the author and committer dates."""
+    return {**os.environ, "GIT_AUTHOR_DATE": f"{stamp} +0000", "GIT_COMMITTER_DATE": f"{stamp} +0000"}
+
+
+def _git(args, **kwargs):
+    """Run git without runtime bookkeeping."""
+    return run_git(args, lambda _tool, _args: None, lambda: None, **kwargs)
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Create history with two side branches merged back into main."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    stamp = 1_700_000_000
+
+    def _commit(name: str, message: str) -> None:
+        """Commit one file change with a strictly increasing date."""
+        nonlocal stamp
+        stamp += 60
+        target = repo_dir / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with target.open("a", encoding="utf-8") as handle:
+            handle.write(f"{message}\n")
+        _run(["git", "add", "-A"], repo_dir)
+        _run(["git", "commit", "-m", message], repo_dir, _dated(stamp))
+
+    for idx in range(6):
+        _commit("src/main.txt" if idx % 2 else "docs/readme.md", f"fix main {idx}")
+    for branch in ("one", "two"):
+        _run(["git", "checkout", "-b", branch, "HEAD~2"], repo_dir)
+        for idx in range(3):
+            _commit(f"src/{branch}.txt", f"add {branch} {idx}")
+        _run(["git", "checkout", "main"], repo_dir)
+        _commit("docs/readme.md", f"docs before {branch}")
+        stamp += 60
+        _run(["git", "merge", "--no-ff", "-m", f"merge {branch}", branch], repo_dir, _dated(stamp))
+
+
+def _pages(dispatch, args: list[str], size: int, capsys) -> list[str]:
+    """Follow next_cursor lines from the first page to the last; returns each page's output."""
+    pages: list[str] = []
+    cursor = ""
+    while True:
+        extra = ["--after-cursor", cursor] if cursor else []
+        assert dispatch([*args, "--page-size", str(size), *extra], {}, _git) == 0
+        out = capsys.readouterr().out
+        cursor = ""
+        if out.endswith("\n") and out.split("\n")[-2].startswith("next_cursor: "):
+            cursor = out.split("\n")[-2].removeprefix("next_cursor: ")
+            out = out[: -len(out.split("\n")[-2]) - 2]
+        pages.append(out)
+        if not cursor:
+            return pages
+
+
+def test_pages_join_to_the_full_output(tmp_path, monkeypatch, capsys) -> None:
+    """Concatenated pages reproduce the unpaged output, across merges and pathspecs."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    cases = [
+        (dispatch_log, []),
+        (dispatch_log, ["--path", "src"]),
+        # HEAD leaves docs untouched, so the walk starts below it.
+        (dispatch_log, ["--path", "docs"]),
+        (dispatch_log, ["--search", "add"]),
+        (dispatch_history, ["--summary", "--no-cache"]),
+        (dispatch_history, ["--files-only", "--path", "src", "--no-cache"]),
+        (dispatch_history, ["--patch", "--ops", "A", "--no-cache"]),
+    ]
+    for dispatch, paged_args in cases:
+        assert dispatch(["--n", "100", *paged_args], {}, _git) == 0
+        expected = capsys.readouterr().out
+        for size in (1, 3, 50):
+            pages = _pages(dispatch, paged_args, size, capsys)
+            assert "\n".join(page for page in pages if page) == expected, (paged_args, size)
+            if size == 50:
+                assert len(pages) == 1
+    # --range only starts the walk; later pages take their range from the cursor.
+    assert dispatch_log(["--n", "100", "--range", "HEAD~3..HEAD"], {}, _git) == 0
+    expected = capsys.readouterr().out
+    assert dispatch_log(["--range", "HEAD~3..HEAD", "--page-size", "2"], {}, _git) == 0
+    first, _, cursor = capsys.readouterr().out.rstrip("\n").partition("\nnext_cursor: ")
+    assert dispatch_log(["--after-cursor", cursor, "--page-size", "100"], {}, _git) == 0
+    assert f"{first}\n{capsys.readouterr().out}" == expected
+
+    # Record formats carry the cursor in their own syntax.
+    assert dispatch_history(["--files-only", "--format", "json", "--page-size", "1", "--no-cache"], {}, _git) == 0
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(records) == 2 and "oid" in records[0]
+    assert records[-1]["type"] == "cursor"
+    assert dispatch_history(["--format", "json", "--after-cursor", records[-1]["next_cursor"], "--no-cache"], {}, _git) == 0
+    assert all("oid" in json.loads(line) for line in capsys.readouterr().out.splitlines())
+
+
+def test_pages_never_repeat_equal_timestamp_commits(tmp_path, monkeypatch, capsys) -> None:
+    """Show every commit once when merged branches share one timestamp, for log and history."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _run(["git", "init", "-b", "main"], tmp_path)
+    _run(["git", "config", "user.email", "test@example.com"], tmp_path)
+    _run(["git", "config", "user.name", "Test User"], tmp_path)
+    same = _dated(1_700_000_000)
+
+    def _commit(name: str) -> None:
+        """Commit one new file, all at the same date."""
+        (tmp_path / f"{name}.txt").write_text(f"{name}\n", encoding="utf-8")
+        _run(["git", "add", "-A"], tmp_path)
+        _run(["git", "commit", "-m", name], tmp_path, same)
+
+    _commit("base")
+    for branch in ("one", "two", "three", "four"):
+        _run(["git", "checkout", "-q", "-b", branch, "main"], tmp_path)
+        _commit(f"{branch}-a")
+        _commit(f"{branch}-b")
+        _run(["git", "checkout", "-q", "main"], tmp_path)
+        _commit(f"main-{branch}")
+        _run(["git", "merge", "--no-ff", "-m", f"merge {branch}", branch], tmp_path, same)
+    monkeypatch.chdir(tmp_path)
+    total = int(_run(["git", "rev-list", "--count", "HEAD"], tmp_path))
+    assert total == 17
+    parents = {
+        line.split()[0]: line.split()[1:]
+        for line in _run(["git", "rev-list", "--parents", "HEAD"], tmp_path).splitlines()
+    }
+
+    for dispatch, args in ((dispatch_log, []), (dispatch_history, ["--summary", "--no-cache"])):
+        for size in (1, 2, 3):
+            pages = _pages(dispatch, args, size, capsys)
+            oids = [line.split()[0] for page in pages for line in page.splitlines() if line[:1] not in ("", " ")]
+            assert len(oids) == total and set(oids) == set(parents), (args, size)
+            # A parent never comes before one of its children.
+            position = {oid: idx for idx, oid in enumerate(oids)}
+            assert all(position[parent] > position[oid] for oid in oids for parent in parents[oid]), (args, size)
+
+
+def test_cursor_is_opaque_and_validated(tmp_path, monkeypatch, capsys) -> None:
+    """Cursors round-trip, plain commits resume from their parents, and conflicts error."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    _init_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    token = encode_cursor("a" * 40, ["b" * 40, "c" * 40], ["d" * 40])
+    assert ";" not in token and "=" not in token
+    assert decode_cursor(token) == ("a" * 40, ["b" * 40, "c" * 40], ["d" * 40])
+    assert decode_cursor("HEAD~2") is None
+
+    # A plain commit resumes from that commit's parents.
+    assert dispatch_log(["--page-size", "2", "--after-cursor", "HEAD~1"], {}, _git) == 0
+    out = capsys.readouterr().out
+    expected = _run(["git", "log", "--max-count=2", "--format=%H %s", "HEAD~2"], tmp_path).strip()
+    assert out.split("\nnext_cursor: ")[0] == expected
+
+    # router.page_size sets the default page size.
+    assert dispatch_log(["--after-cursor", "HEAD~1"], {"router": {"page_size": 1}}, _git) == 0
+    assert capsys.readouterr().out.split("\n")[0] == expected.split("\n")[0]
+
+    with pytest.raises(RuntimeError, match="either --n or --page-size"):
+        dispatch_log(["--n", "3", "--page-size", "2"], {}, _git)
+    with pytest.raises(RuntimeError, match="already carries the range"):
+        dispatch_history(["--range", "HEAD~2..HEAD", "--after-cursor", token], {}, _git)
+    with pytest.raises(RuntimeError, match="neither a cursor nor a commit"):
+        dispatch_log(["--after-cursor", "not-a-cursor"], {}, _git)
+    with pytest.raises(RuntimeError, match="must be positive"):
+        dispatch_history(["--page-size", "0"], {}, _git)
@@ -0,0 +1,166 @@
+"""Tests for the pure-Python repository and ref reader."""
+from __future__ import annotations
+
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.utils import refs  # noqa: E402
+
+
+def _run(cmd: list[str], cwd: Path) -> str:
+    """Run a subprocess command for test setup and return stdout."""
+    return subprocess.run(cmd, cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _init_repo(repo_dir: Path) -> None:
+    """Initialize a git repo with a starter commit."""
+    _run(["git", "init", "-b", "main"], repo_dir)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    (repo_dir / "sample.txt").write_text("Hello\n", encoding="utf-8")
+    _run(["git", "add", "sample.txt"], repo_dir)
+    _run(["git", "commit", "-m", "initial"], repo_dir)
+
+
+def _discover(path: Path) -> refs.Repo | None:
+    """Discover a repo without reusing earlier results."""
+    refs.reset_discovery()
+    return refs.discover(str(path))
+
+
+def _assert_matches_git(path: Path) -> None:
+    """Compare the reader's answers with git's for the repo at `path`."""
+    repo = _discover(path)
+    assert repo is not None
+    assert str(repo.work_tree) == _run(["git", "rev-parse", "--show-toplevel"], path)
+    assert repo.git_dir == Path(_run(["git", "rev-parse", "--absolute-git-dir"], path))
+    common = Path(_run(["git", "rev-parse", "--git-common-dir"], path))
+    assert repo.common_dir == (common if common.is_absolute() else (path / common).resolve())
+    assert repo.current_branch() == _run(["git", "rev-parse", "--abbrev-ref", "HEAD"], path)
+    expected = _run(
+        ["git", "for-each-ref", "--format=%(refname)|%(objectname)|%(upstream:short)", "refs/heads"], path
+    ).splitlines()
+    branches = repo.branches()
+    assert branches is not None
+    actual = [f"{ref}|{oid}|{repo.upstream_short(ref[len('refs/heads/'):])}" for ref, oid in branches]
+    assert actual == expected
+
+
+def test_refs_reader_matches_git(tmp_path, monkeypatch) -> None:
+    """Answer discovery, HEAD, loose/packed ref and upstream queries like git does."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    _init_repo(origin)
+    _run(["git", "branch", "feature/a"], origin)
+    repo_dir = tmp_path / "clone"
+    _run(["git", "clone", "-q", str(origin), str(repo_dir)], tmp_path)
+    _run(["git", "config", "user.email", "test@example.com"], repo_dir)
+    _run(["git", "config", "user.name", "Test User"], repo_dir)
+    _run(["git", "branch", "--track", "feature/a", "origin/feature/a"], repo_dir)
+    _run(["git", "branch", "local-only"], repo_dir)
+    _run(["git", "branch", "stacked"], repo_dir)
+    _run(["git", "config", "branch.stacked.remote", "."], repo_dir)
+    _run(["git", "config", "branch.stacked.merge", "refs/heads/main"], repo_dir)
+    (repo_dir / "nested").mkdir()
+    _assert_matches_git(repo_dir / "nested")
+
+    # Packed refs, with a loose ref overriding a stale packed value.
+    _run(["git", "pack-refs", "--all"], repo_dir)
+    (repo_dir / "more.txt").write_text("more\n", encoding="utf-8")
+    _run(["git", "add", "more.txt"], repo_dir)
+    _run(["git", "commit", "-m", "more"], repo_dir)
+    _assert_matches_git(repo_dir)
+    repo = _discover(repo_dir)
+    assert repo.has_ref("refs/remotes/origin/feature/a")
+    assert not repo.has_ref("refs/heads/missing")
+
+    # Linked worktree: `.git` is a file and HEAD lives in the per-worktree git dir.
+    worktree = tmp_path / "wt"
+    _run(["git", "worktree", "add", "-q", "-b", "wt-branch", str(worktree)], repo_dir)
+    _assert_matches_git(worktree)
+
+    # Detached HEAD reads as "HEAD", like rev-parse --abbrev-ref.
+    _run(["git", "checkout", "-q", "--detach"], worktree)
+    _assert_matches_git(worktree)
+
+    # A tag with the branch's name makes the short name ambiguous; defer to git.
+    _run(["git", "tag", "main"], repo_dir)
+    assert _discover(repo_dir).current_branch() is None
+    calls: list[list[str]] = []
+
+    def _git_output(args):
+        """Record the fallback and answer with git."""
+        calls.append(list(args))
+        return _run(["git", *args], repo_dir)
+
+    refs.reset_discovery()
+    monkeypatch.chdir(repo_dir)
+    assert refs.current_branch(_git_output) == "heads/main"
+    assert calls == [["rev-parse", "--abbrev-ref", "HEAD"]]
+
+
+def test_refs_reader_defers_to_git(tmp_path, monkeypatch) -> None:
+    """Return None for layouts the reader cannot handle exactly."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    _init_repo(repo_dir)
+    assert _discover(repo_dir) is not None
+
+    # Submodule checkouts point core.worktree back at themselves and stay readable.
+    parent = tmp_path / "parent"
+    parent.mkdir()
+    _init_repo(parent)
+    _run(["git", "-c", "protocol.file.allow=always", "submodule", "add", "-q", str(repo_dir), "sub"], parent)
+    _assert_matches_git(parent / "sub")
+
+    # Unborn branches make git fail, so the reader does not answer.
+    unborn = tmp_path / "unborn"
+    unborn.mkdir()
+    _run(["git", "init", "-b", "main"], unborn)
+    assert _discover(unborn).current_branch() is None
+
+    # Reftable storage, config includes and GIT_DIR overrides all defer.
+    (repo_dir / ".git" / "reftable").mkdir()
+    assert _discover(repo_dir) is None
+    (repo_dir / ".git" / "reftable").rmdir()
+    _run(["git", "config", "include.path", "extra.cfg"], repo_dir)
+    assert _discover(repo_dir) is None
+    _run(["git", "config", "--unset", "include.path"], repo_dir)
+    assert _discover(repo_dir) is not None
+    monkeypatch.setenv("GIT_DIR", str(repo_dir / ".git"))
+    assert _discover(repo_dir) is None
+    monkeypatch.delenv("GIT_DIR")
+
+    # Inside the git dir itself git reports no work tree.
+    assert _discover(repo_dir / ".git" / "refs") is None
+
+
+def test_refs_discovery_is_reset_per_request(tmp_path) -> None:
+    """Cache discovery within a request; reset_discovery() picks up a later git init or core.bare change."""
+    if shutil.which("git") is None:
+        pytest.skip("git not available")
+    outer = tmp_path / "outer"
+    (outer / "inner").mkdir(parents=True)
+    _init_repo(outer)
+    inner = outer / "inner"
+    refs.reset_discovery()
+    assert refs.discover(str(inner)).work_tree == outer.resolve()
+    _run(["git", "init", "-b", "main"], inner)
+    assert refs.discover(str(inner)).work_tree == outer.resolve()
+    refs.reset_discovery()
+    assert refs.discover(str(inner)).work_tree == inner.resolve()
+    _run(["git", "config", "core.bare", "true"], inner)
+    refs.reset_discovery()
+    assert refs.discover(str(inner)) is None
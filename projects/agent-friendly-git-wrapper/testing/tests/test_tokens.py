@@ -0,0 +1,77 @@
+"""Tests for token counting helpers."""
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+TESTING_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.utils import tokens  # noqa: E402
+
+OUTPUTS = TESTING_ROOT / "cases" / "benchmark_history_compaction" / "case_codex_last_20" / "input" / "outputs"
+
+
+def test_token_estimator_offline(monkeypatch) -> None:
+    """Fall back to the calibrated estimate, not character length, without tiktoken data."""
+    monkeypatch.setattr(tokens, "get_encoder", lambda encoding="", config=None: None)
+    text = (OUTPUTS / "unified.txt").read_text(encoding="utf-8")
+    assert tokens.count_tokens("") == 0
+    estimate = tokens.count_tokens(text)
+    assert estimate == tokens.estimate_tokens(text)
+    assert estimate < len(text) // 2
+    assert tokens.count_tokens_batch(["a b", "c"]) == [tokens.estimate_tokens("a b"), tokens.estimate_tokens("c")]
+
+
+def test_token_counts_exact_and_cached(tmp_path, monkeypatch) -> None:
+    """Load BPE ranks from a configured local dir, memoize the encoder, and batch exactly."""
+    bpe_dir = os.environ.get(tokens.BPE_DIR_ENV, "")
+    if not bpe_dir or not (Path(bpe_dir) / "cl100k_base.tiktoken").is_file():
+        pytest.skip(f"{tokens.BPE_DIR_ENV} with cl100k_base.tiktoken not set")
+    monkeypatch.delenv(tokens.BPE_DIR_ENV)
+    shutil.copy(Path(bpe_dir) / "cl100k_base.tiktoken", tmp_path / "cl100k_base.tiktoken")
+    # Relative bpe_dir resolves against the config file's directory.
+    config = {
+        "router": {"token_counting": {"bpe_dir": "."}},
+        "_runtime": {"config_path": str(tmp_path / "cli_router.yaml")},
+    }
+    # Local files are loaded without touching tiktoken_ext's constructor table or loader.
+    import tiktoken_ext.openai_public as openai_public  # type: ignore
+
+    monkeypatch.setattr(openai_public, "ENCODING_CONSTRUCTORS", {})
+    monkeypatch.setattr(openai_public, "load_tiktoken_bpe", None)
+    encoder = tokens.get_encoder("cl100k_base", config)
+    assert encoder is not None
+    assert tokens.get_encoder("cl100k_base", config) is encoder
+
+    text = (OUTPUTS / "unified.txt").read_text(encoding="utf-8")
+    exact = len(encoder.encode_ordinary(text))
+    monkeypatch.setattr(tokens, "BATCH_MIN_CHARS", 1024)
+    monkeypatch.setattr(tokens.os, "cpu_count", lambda: 4)
+    assert len(tokens._split_slices(text, 4)) > 1
+    assert tokens.count_tokens(text, "cl100k_base", config) == exact
+    assert abs(tokens.estimate_tokens(text) - exact) / exact < 0.03
+
+
+def test_token_encoder_config_errors_fall_back(tmp_path, monkeypatch, capsys) -> None:
+    """Estimate, with a notice, when the encoding name or local BPE file is unusable."""
+    pytest.importorskip("tiktoken")
+    monkeypatch.setattr(tokens, "_ENCODERS", {})
+    monkeypatch.delenv(tokens.BPE_DIR_ENV, raising=False)
+    assert tokens.count_tokens("hello world", "o200k") == tokens.estimate_tokens("hello world", "o200k")
+    assert "encoding 'o200k'" in capsys.readouterr().err
+
+    # A local ranks file that fails tiktoken's published hash check.
+    (tmp_path / "cl100k_base.tiktoken").write_text("aGVsbG8= 0\n", encoding="utf-8")
+    config = {"router": {"token_counting": {"bpe_dir": str(tmp_path)}}}
+    assert tokens.get_encoder("cl100k_base", config) is None
+    assert "router.token_counting.bpe_dir" in capsys.readouterr().err
+    assert tokens.count_tokens("hello world", "cl100k_base", config) == tokens.estimate_tokens("hello world")
+    # The failure is memoized, so the notice is printed once.
+    assert capsys.readouterr().err == ""